@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from collections import deque
+import psutil
+from config import WORK_DIR, ADMISSION_DISK_RESERVE, ADMISSION_RAM_RESERVE
+
+# Memory a job needs beyond its files (buffers, repack workers' batches)
+JOB_RAM_OVERHEAD = 64 * 1024 * 1024
+# Free space can change outside our control; queued jobs re-check this often
+POLL_INTERVAL = 5
+
+
+class NotEnoughResources(Exception):
+    pass
+
+
+class Ticket:
+    def __init__(self, disk, ram):
+        self.disk = disk
+        self.ram = ram
+
+
+class AdmissionController:
+    """
+    First-come first-served admission of processing jobs by their
+    estimated peak disk and RAM use, against what psutil reports free
+    minus what already admitted jobs may still need.
+    """
+
+    def __init__(self, disk_path, disk_reserve, ram_reserve):
+        self.disk_path = disk_path
+        self.disk_reserve = disk_reserve
+        self.ram_reserve = ram_reserve
+        self.queue = deque()
+        self.admitted = set()
+        self._condition = None
+
+    @property
+    def condition(self):
+        # Created lazily so it binds to the running loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def available(self):
+        disk = psutil.disk_usage(self.disk_path).free - self.disk_reserve
+        ram = psutil.virtual_memory().available - self.ram_reserve
+        disk -= sum(t.disk for t in self.admitted)
+        ram -= sum(t.ram for t in self.admitted)
+        return disk, ram
+
+    def _fits(self, disk, ram):
+        free_disk, free_ram = self.available()
+        return disk <= free_disk and ram <= free_ram
+
+    async def acquire(self, disk, ram, on_queue=None):
+        """
+        Wait until a job needing `disk` and `ram` bytes fits. on_queue(position)
+        is called whenever the job's place in the queue changes. A job that
+        doesn't fit even with nothing else running is refused.
+        """
+        ram += JOB_RAM_OVERHEAD
+        ticket = Ticket(disk, ram)
+        async with self.condition:
+            self.queue.append(ticket)
+            reported = None
+            try:
+                while True:
+                    if self.queue[0] is ticket:
+                        if self._fits(disk, ram):
+                            break
+                        if not self.admitted:
+                            free_disk, free_ram = self.available()
+                            raise NotEnoughResources(
+                                f"Not enough space for this job (needs {disk // 2**20} MB disk, "
+                                f"{ram // 2**20} MB RAM; {max(free_disk, 0) // 2**20} MB / "
+                                f"{max(free_ram, 0) // 2**20} MB free)"
+                            )
+                    position = self.queue.index(ticket) + 1
+                    if position != reported:
+                        reported = position
+                        logging.info(f"Job queued at position {position} (needs {disk // 2**20} MB disk)")
+                        if on_queue:
+                            on_queue(position)
+                    try:
+                        await asyncio.wait_for(self.condition.wait(), POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self.queue.remove(ticket)
+                self.condition.notify_all()
+            self.admitted.add(ticket)
+        return ticket
+
+    async def release(self, ticket):
+        async with self.condition:
+            self.admitted.discard(ticket)
+            self.condition.notify_all()
+
+    async def resize(self, ticket, disk, ram=None, on_queue=None):
+        """
+        Update an admitted job's needs once they are known better. Growing
+        past what is free sends the job back through the queue.
+        """
+        ram = ticket.ram if ram is None else ram + JOB_RAM_OVERHEAD
+        async with self.condition:
+            self.admitted.discard(ticket)
+            fits = self._fits(disk, ram)
+            if fits:
+                ticket.disk, ticket.ram = disk, ram
+                self.admitted.add(ticket)
+            self.condition.notify_all()
+        if fits:
+            return ticket
+        return await self.acquire(disk, ram - JOB_RAM_OVERHEAD, on_queue)
+
+    def admit(self, disk, ram, on_queue=None):
+        return _Admission(self, disk, ram, on_queue)
+
+
+class _Admission:
+    """
+    `async with admission.admit(disk, ram) as slot:`; slot.resize() updates the estimate.
+    """
+
+    def __init__(self, controller, disk, ram, on_queue):
+        self.controller = controller
+        self.disk = disk
+        self.ram = ram
+        self.on_queue = on_queue
+        self.ticket = None
+
+    async def __aenter__(self):
+        self.ticket = await self.controller.acquire(self.disk, self.ram, self.on_queue)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.controller.release(self.ticket)
+
+    async def resize(self, disk, ram=None):
+        self.ticket = await self.controller.resize(self.ticket, disk, ram, self.on_queue)
+
+
+admission = AdmissionController(WORK_DIR, ADMISSION_DISK_RESERVE, ADMISSION_RAM_RESERVE)
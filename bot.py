@@ -2,7 +2,6 @@ import os
 import logging
 import asyncio
 import time
-import shutil
 import psutil
 import platform
 import sys
@@ -11,14 +10,21 @@ import re
 from pyrogram import Client, filters, idle
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from dotenv import load_dotenv
-from processor import process_url
-from curl_cffi import requests as cffi_requests
-from bs4 import BeautifulSoup
+from processor import process_url_async, probe_extractors, copyright_cache, parse_post_links
+from hosts import normalize_url
+from inflight import inflight
+from jobqueue import job_queue, QueueFull, PRIORITY_ADMIN, PRIORITY_USER, PRIORITY_MONITOR
+from pipeline import PIPELINES
+from executors import executors
+from net import fetch_text, close_sessions
+from health import host_health
+from workspace import workspace
 
 # New Imports
 from config import *
 from database import file_store
-from utils import ProgressTracker, check_force_sub, process_and_post_to_channel
+from utils import ProgressTracker, VolumeUploader, check_force_sub, process_and_post_to_channel, run_post_job, upload_or_reuse
+from dedup import Fingerprint, Duplicate
 
 # Logging setup
 logging.basicConfig(
@@ -71,42 +77,22 @@ async def monitor_codelist(client):
             logging.info("Checking for new posts...")
             RSS_STATS["last_check"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
-            loop = asyncio.get_running_loop()
-            
-            def fetch_feed(u):
+            async def fetch_feed(u):
                 try:
-                    r = cffi_requests.get(u, impersonate="chrome120", timeout=30, allow_redirects=True)
-                    return r.text
+                    return await fetch_text(u, impersonate="chrome120", allow_redirects=True)
                 except Exception as e:
                     logging.error(f"Monitor fetch error for {u}: {e}")
                     return None
 
             current_batch = []
             
-            for url in urls_to_monitor:
-                html = await loop.run_in_executor(None, fetch_feed, url)
-                
-                if html:
-                    soup = BeautifulSoup(html, 'html.parser')
-                    # Find all post links
-                    for a in soup.find_all('a', href=True):
-                        href = a['href']
-                        
-                        # Clean URL (remove anchor/query)
-                        href = href.split('#')[0].split('?')[0]
-                        
-                        # Filter for valid content posts
-                        is_content = False
-                        if '.html' in href:
-                             if any(cat in href for cat in ['/scripts3/', '/plugins3/', '/apps3/', '/mobile/', '/templates/']):
-                                 is_content = True
-                             # Fallback: if it's from main site and looks like a post (has numeric ID)
-                             elif 'codelist.cc' in href and re.search(r'/\d+-', href):
-                                 is_content = True
-                        
-                        if is_content:
-                             if href not in current_batch:
-                                 current_batch.append(href)
+            feeds = await asyncio.gather(*(fetch_feed(u) for u in urls_to_monitor))
+            
+            # Parsed on the CPU pool so a big listing doesn't stall the bot
+            for links in await asyncio.gather(*(executors.run_cpu(parse_post_links, html) for html in feeds if html)):
+                for href in links:
+                    if href not in current_batch:
+                        current_batch.append(href)
             
             if first_run_db_init:
                 # If this is the very first run (DB empty), mark all current posts as processed
@@ -127,11 +113,10 @@ async def monitor_codelist(client):
                     logging.info(f"Found {len(new_posts)} new posts!")
                     RSS_STATS["total_found"] += len(new_posts)
                     
-                    # Process from oldest to newest
-                    for post_url in reversed(new_posts):
+                    async def auto_process(post_url):
                         logging.info(f"Auto-processing: {post_url}")
                         try:
-                            await process_and_post_to_channel(client, post_url, BOT_USERNAME)
+                            await process_and_post_to_channel(client, post_url, BOT_USERNAME, PRIORITY_MONITOR)
                             # Mark as processed ONLY after success (or attempt)
                             await file_store.add_processed_url(post_url)
                             RSS_STATS["total_processed"] += 1
@@ -139,8 +124,10 @@ async def monitor_codelist(client):
                             logging.error(f"Failed to auto-process {post_url}: {e}")
                             # Mark as processed to prevent infinite retry loop on bad posts
                             await file_store.add_processed_url(post_url)
-                            
-                        await asyncio.sleep(10)
+                    
+                    # Queue them all at once, oldest first; the job queue runs several
+                    # at a time so one post downloads while another repacks or uploads
+                    await asyncio.gather(*(auto_process(post_url) for post_url in reversed(new_posts)))
         
             await asyncio.sleep(600) # 10 minutes
             
@@ -205,7 +192,18 @@ async def start(client, message):
         try:
             file_info = await file_store.get_file(code)
             
-            if file_info:
+            if file_info and file_info.get('parts'):
+                parts = file_info['parts']
+                for i, file_id in enumerate(parts, 1):
+                    await message.reply_document(
+                        document=file_id,
+                        caption=f"{file_info.get('caption') or 'Here is your file!'}\n\n📦 Part {i}/{len(parts)}"
+                    )
+                await message.reply_text(
+                    "ℹ️ This file was split into parts. Download all of them and open the `.001` "
+                    "with 7-Zip, or join them with `cat name.zip.0* > name.zip`."
+                )
+            elif file_info:
                 await message.reply_document(
                     document=file_info['file_id'],
                     caption=file_info.get('caption', "Here is your file!")
@@ -290,6 +288,9 @@ async def toggle_force_sub(client, callback_query: CallbackQuery):
     FORCE_SUB_ACTIVE = not FORCE_SUB_ACTIVE
     await settings_command(client, callback_query.message)
 
+# Link job id -> the inflight.Flight it leads, while it runs
+leading_flights = {}
+
 # State management for setting channel (simple in-memory)
 user_states = {}
 user_data = {}
@@ -301,11 +302,83 @@ STATE_POST_DESC = "post_wait_desc"
 STATE_POST_DEMO = "post_wait_demo"
 STATE_POST_FILE = "post_wait_file"
 
-@app.on_message(filters.command("cancel") & filters.user(ADMIN_ID))
+@app.on_message(filters.command("cancel"))
 async def cancel_command(client, message):
-    user_states.pop(message.from_user.id, None)
-    user_data.pop(message.from_user.id, None)
-    await message.reply_text("❌ Operation cancelled.")
+    """
+    /cancel stops the sender's jobs, /cancel <url> only the one for that
+    link. The admin's /cancel first leaves a /post or channel wizard;
+    /cancel all and /cancel <url> reach everyone's jobs for the admin.
+    """
+    user_id = message.from_user.id
+    is_admin = user_id == ADMIN_ID
+    target = message.command[1] if len(message.command) > 1 else None
+    
+    if is_admin and not target and user_states.pop(user_id, None):
+        user_data.pop(user_id, None)
+        await message.reply_text("❌ Operation cancelled.")
+        return
+    
+    jobs = job_queue.jobs(None if is_admin and target else user_id)
+    if target and target != "all":
+        key = normalize_url(target)
+        jobs = [job for job in jobs if job.get("url") and normalize_url(job["url"]) == key]
+    elif target == "all" and not is_admin:
+        jobs = []
+    if not jobs:
+        await message.reply_text("Nothing to cancel.")
+        return
+    
+    status_msg = await message.reply_text(f"🛑 Cancelling {len(jobs)} job(s)...")
+    cancelled = 0
+    for job in jobs:
+        status_id = job.get("status_id")
+        if await cancel_job(job, f"Cancelled by {user_id}"):
+            cancelled += 1
+            if status_id:
+                try:
+                    await client.edit_message_text(job["chat_id"], status_id, "🛑 Cancelled.")
+                except Exception:
+                    pass
+    await status_msg.edit_text(f"🛑 Cancelled {cancelled} job(s).")
+
+async def cancel_job(job, reason):
+    """
+    Cancel a job. A link job that chats are following (see inflight.py)
+    keeps running for them; only its own chat is detached from it, and it
+    is cancelled for real if those chats give up too.
+    """
+    flight = leading_flights.get(job["_id"])
+    if flight is None or not flight.followers:
+        return await job_queue.cancel(job, reason)
+    if flight.detached:
+        return False
+    logging.info(f"Job {job['_id']} detached ({reason}); {flight.followers} other chat(s) still waiting for it")
+    job["status_id"] = None
+    flight.detach(lambda: asyncio.create_task(job_queue.cancel(job, reason)))
+    return True
+
+async def watch_status_messages(interval=STATUS_CHECK_INTERVAL):
+    """
+    Cancel jobs whose status message was deleted; nobody is waiting for them.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        by_chat = {}
+        for job in job_queue.jobs():
+            if job.get("status_id"):
+                by_chat.setdefault(job["chat_id"], []).append(job)
+        
+        for chat_id, jobs in by_chat.items():
+            try:
+                messages = await app.get_messages(chat_id, [job["status_id"] for job in jobs])
+            except Exception as e:
+                logging.error(f"Status check for chat {chat_id} failed: {e}")
+                continue
+            present = {msg.id for msg in messages if not msg.empty}
+            for job in jobs:
+                if job["status_id"] not in present:
+                    logging.info(f"Status message of job {job['_id']} was deleted, cancelling it")
+                    asyncio.create_task(cancel_job(job, "Status message deleted"))
 
 @app.on_message(filters.command("post") & filters.user(ADMIN_ID))
 async def post_command(client, message):
@@ -475,11 +548,6 @@ async def handle_admin_states(client, message):
         except Exception as e:
             await status_msg.edit_text(f"Error: {e}")
 
-import concurrent.futures
-
-# Thread pool for blocking I/O
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
-
 # --- Stats Command ---
 def get_size(bytes, suffix="B"):
     factor = 1024
@@ -529,14 +597,126 @@ async def stats_command(client, message):
         f"🤖 **Bot Status**\n"
         f"⏱ **Uptime**: `{uptime_str}`\n"
         f"📦 **Memory**: `{memory_usage:.2f} MB`\n"
-        f"🆔 **PID**: `{process.pid}`"
+        f"🆔 **PID**: `{process.pid}`\n"
+        f"━━━━━━━━━━━━━━━━━━━\n"
+        f"🛠 **Pipeline**\n"
+        f"📥 **Queued jobs**: `{len(job_queue.queued)}` (running `{len(job_queue.running)}`)\n"
+        + "".join(f"• {pipeline.name}: " + ", ".join(f"`{stage}`" for stage in pipeline.stages) + "\n" for pipeline in PIPELINES)
     )
     
     await message.reply_text(stats_text)
 
 # --- Main Logic ---
 
-@app.on_message(filters.text & ~filters.command(["start", "settings", "stats", "post", "cancel"]))
+# Scraped fields kept with a cached result to rebuild the preview
+CACHED_METADATA = ('title', 'description', 'demo_url', 'image_url', 'original_url')
+
+def preview_photo(metadata):
+    image_url = metadata.get('image_url')
+    if image_url and "codelist.cc" not in image_url and "codelist.cc" not in (metadata.get('original_url') or ""):
+        return image_url
+    local_img = metadata.get('image_path')
+    if local_img and os.path.exists(local_img):
+        return local_img
+    return None
+
+async def send_preview(client, message, code, metadata, photo=None, autopost=False):
+    """
+    Reply with the formatted post linking to the stored file, and post it
+    to the channel too when autopost is set. Returns the preview message.
+    """
+    global BOT_USERNAME
+    if not BOT_USERNAME:
+         me = await client.get_me()
+         BOT_USERNAME = me.username
+         
+    bot_link = f"https://t.me/{BOT_USERNAME}?start={code}"
+    
+    title = metadata.get('title', 'New Script')
+    demo_url = metadata.get('demo_url')
+    description = metadata.get('description')
+    
+    # Stylish Caption
+    caption = f"🔥 **{title}**\n\n"
+    
+    if description:
+        desc_preview = description[:300] + "..." if len(description) > 300 else description
+        caption += f"📝 **Description**:\n{desc_preview}\n\n"
+    
+    if demo_url:
+        caption += f"🌐 **Demo**: [Live Preview]({demo_url})\n"
+        
+    caption += "\n━━━━━━━━━━━━━━━━━━━━━\n"
+    caption += "🚀 **Join Channel**: @freephplaravel\n"
+    caption += "━━━━━━━━━━━━━━━━━━━━━"
+    
+    if len(caption) > 1024:
+        caption = caption[:1021] + "..."
+    
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("📥 Download File 📥", url=bot_link)]
+    ])
+    
+    # Send to User (Preview)
+    if photo:
+        sent_msg = await message.reply_photo(
+            photo=photo,
+            caption=caption,
+            reply_markup=keyboard
+        )
+    else:
+        sent_msg = await message.reply_text(
+            text=caption,
+            reply_markup=keyboard,
+            disable_web_page_preview=True
+        )
+        
+    # Auto-Post to Channel if Admin
+    if autopost and sent_msg:
+        logging.info(f"Auto-posting to channel {CHANNEL_ID}")
+        try:
+            if photo:
+                await client.send_photo(
+                    chat_id=CHANNEL_ID,
+                    photo=photo,
+                    caption=caption,
+                    reply_markup=keyboard
+                )
+            else:
+                await client.send_message(
+                    chat_id=CHANNEL_ID,
+                    text=caption,
+                    reply_markup=keyboard,
+                    disable_web_page_preview=True
+                )
+            
+            await message.reply_text(f"✅ Posted to channel `{CHANNEL_ID}`")
+        except Exception as e:
+            await message.reply_text(f"⚠️ Failed to post to channel: {e}")
+    return sent_msg
+
+async def reply_from_cache(client, message, cached, autopost=False):
+    """
+    Answer a repeat request from its cached result: the stored document(s)
+    by file_id and the preview, without scraping or downloading anything.
+    """
+    for file_id in cached["file_ids"]:
+        await message.reply_document(document=file_id, caption=cached.get("caption"))
+    await send_preview(client, message, cached["code"], cached.get("metadata") or {}, cached.get("photo"), autopost)
+
+@app.on_message(filters.command("uncache") & filters.user(ADMIN_ID))
+async def uncache_command(client, message):
+    if len(message.command) < 2:
+        await message.reply_text("Usage: `/uncache <url>` or `/uncache all`")
+        return
+    target = message.command[1]
+    if target.lower() == "all":
+        removed = await file_store.invalidate_cached_result()
+    else:
+        removed = await file_store.invalidate_cached_result(normalize_url(target))
+    await message.reply_text(f"🗑 Removed {removed} cached result(s).")
+
+@app.on_message(filters.text & ~filters.command(["start", "settings", "stats", "post", "cancel", "uncache"]))
 async def handle_message(client, message):
     # Ignore group messages here, let plugins handle groups.
     # We only want to process PMs or specific commands unless explicitly handled.
@@ -562,154 +742,223 @@ async def handle_message(client, message):
     is_codelist = "codelist.cc" in url
     should_autopost = is_admin and is_codelist and CHANNEL_ID
     
+    cache_key = normalize_url(url)
+    if await answer_from_cache(client, message, cache_key, should_autopost):
+        return
+    
     status_msg = await message.reply_text("Initializing...")
     
-    work_dir = f"work_{message.chat.id}_{message.id}"
+    if cache_key in inflight.flights:
+        # Already being processed for another chat; follow that job without taking a queue slot
+        await deliver_link(client, message, status_msg, url, should_autopost)
+        return
+    
+    try:
+        job = await job_queue.submit(
+            "link", f"{message.chat.id}:{cache_key}", PRIORITY_ADMIN if is_admin else PRIORITY_USER,
+            user_id=message.from_user.id, context=(message, status_msg),
+            url=url, chat_id=message.chat.id, message_id=message.id, status_id=status_msg.id,
+            autopost=bool(should_autopost)
+        )
+    except QueueFull as e:
+        await status_msg.edit_text(f"⏳ {e}")
+        return
+    if job["status_id"] != status_msg.id:
+        await status_msg.edit_text("⏳ This link is already in your queue.")
+
+async def answer_from_cache(client, message, cache_key, should_autopost=False):
+    """
+    Reply from the cached result for a link; False if there is none (or it no longer works).
+    """
+    cached = await file_store.get_cached_result(cache_key) if RESULT_CACHE_TTL else None
+    if not cached:
+        return False
+    try:
+        await reply_from_cache(client, message, cached, should_autopost)
+        return True
+    except Exception as e:
+        # A file_id Telegram no longer accepts; process the link again
+        logging.error(f"Cached result for {cache_key} failed: {e}")
+        await file_store.invalidate_cached_result(cache_key)
+        return False
+
+async def run_link_job(job, context=None):
+    """
+    Job queue handler for links sent to the bot. After a restart the
+    request and status messages are fetched again by id.
+    """
+    if context:
+        message, status_msg = context
+    else:
+        message = await app.get_messages(job["chat_id"], job["message_id"])
+        status_msg = await app.get_messages(job["chat_id"], job["status_id"])
+    await deliver_link(app, message, status_msg, job["url"], job.get("autopost", False), job)
+
+def show_queue_position(job, position):
+    if not job.get("status_id"):
+        return
+    asyncio.get_running_loop().create_task(app.edit_message_text(
+        job["chat_id"], job["status_id"],
+        f"📥 Your link is in the queue.\n📍 **Position in queue**: {position}"
+    ))
+
+async def drop_status(status_msg, job=None):
+    """
+    Delete the status message of a job that is delivering its result.
+    The job forgets it first, so watch_status_messages doesn't take the
+    missing message for a cancellation.
+    """
+    if job is not None:
+        job["status_id"] = None
+    await status_msg.delete()
+
+async def deliver_link(client, message, status_msg, url, should_autopost=False, job=None):
+    """
+    Answer a link from the cache, by following the job already processing
+    it, or by processing it here. `job` is the link job this runs for, if any.
+    """
+    # It may have been processed for someone else while this job was queued
+    cache_key = normalize_url(url)
+    if await answer_from_cache(client, message, cache_key, should_autopost):
+        await drop_status(status_msg, job)
+        return
+    
+    def follow_status(text):
+        try:
+            loop = asyncio.get_running_loop()
+            loop.create_task(status_msg.edit_text(f"👥 Same link is already being processed.\n\n{text}"))
+        except Exception:
+            pass
+    
+    try:
+        # Requests for a link that is already being processed wait for that job
+        result, leader = await inflight.run(
+            cache_key,
+            lambda flight: process_link(client, message, url, status_msg, flight, cache_key, should_autopost, job),
+            on_status=follow_status
+        )
+        if not leader:
+            if result:
+                await drop_status(status_msg, job)
+                await reply_from_cache(client, message, result, should_autopost)
+            else:
+                await status_msg.edit_text("Processing failed. Please check the logs.")
+    except Exception as e:
+        logging.error(f"Error: {e}")
+        # Not if the job was detached from this chat or its status is gone
+        if job is None or job.get("status_id"):
+            await status_msg.edit_text(f"An error occurred: {str(e)}")
+
+async def process_link(client, message, url, status_msg, flight, cache_key, should_autopost=False, job=None):
+    """
+    Process, upload and preview a link for one chat; status texts are
+    published on `flight` for chats waiting on the same link. Once the
+    flight is detached (see cancel_job), this chat gets nothing more and
+    the work only goes on for the others.
+    Returns the result as cached (see reply_from_cache), or None.
+    """
+    work_dir = workspace.acquire(f"work_{message.chat.id}_{message.id}")
+    # Parts of a split output are sent while the next one is still being written
+    uploader = VolumeUploader(client, message.chat.id)
+    if job is not None:
+        leading_flights[job["_id"]] = flight
+    
+    async def show_status(text):
+        if not flight.detached:
+            await status_msg.edit_text(text)
     
     try:
         # 1. Download with progress
-        download_tracker = ProgressTracker(status_msg, "Downloading...")
+        download_tracker = ProgressTracker(status_msg, "Downloading...", on_text=flight.publish)
         
         def download_progress_callback(current, total):
+            if flight.detached:
+                # Keep publishing for the followers only
+                download_tracker.message = None
             try:
                 loop = asyncio.get_running_loop()
                 loop.create_task(download_tracker.update(current, total))
             except Exception:
                 pass
 
-        loop = asyncio.get_running_loop()
-        
+        def queue_callback(position):
+            text = f"⏳ Server is busy, your job is queued.\n📍 **Position in queue**: {position}"
+            flight.publish(text)
+            try:
+                loop = asyncio.get_running_loop()
+                loop.create_task(show_status(text))
+            except Exception:
+                pass
+
         # Determine if we should add copyright files (only for admin autopost?)
         add_copyright = False # Default manual
         
-        executor = None 
-        zip_path, metadata = await loop.run_in_executor(
-            executor, 
-            lambda: process_url(url, work_dir, progress_callback=download_progress_callback, add_copyright=add_copyright)
-        )
+        # An archive (or output) uploaded before is sent by file_id instead
+        fingerprint = Fingerprint(file_store.find_by_hash)
+        existing = None
+        try:
+            zip_path, metadata = await process_url_async(
+                url, work_dir, progress_callback=download_progress_callback, add_copyright=add_copyright,
+                queue_callback=queue_callback, volume_callback=uploader.add, fingerprint=fingerprint
+            )
+        except Duplicate as e:
+            zip_path, metadata, existing = None, e.metadata, e.doc
         
-        if zip_path and os.path.exists(zip_path):
-            await status_msg.edit_text("Processing complete. Uploading...")
+        if existing or (zip_path and os.path.exists(zip_path)):
+            flight.publish("Processing complete. Uploading...")
+            await show_status("Processing complete. Uploading...")
             
             # 2. Upload
             caption_file = f"{metadata.get('title', 'File')}\n\nUploaded by Bot"
             
-            msg = await client.send_document(
-                chat_id=message.chat.id,
-                document=zip_path,
-                caption=caption_file
-            )
-            
-            file_id = msg.document.file_id
+            file_ids, reused = await upload_or_reuse(uploader, fingerprint, zip_path, caption_file, existing)
+            if flight.detached:
+                # The file_ids stay valid; only the followers get the files
+                await uploader.delete_sent()
+            elif reused:
+                for file_id in file_ids:
+                    await client.send_document(chat_id=message.chat.id, document=file_id, caption=caption_file)
             
             # 3. Store
-            code = await file_store.save_file(file_id, caption=caption_file)
-            global BOT_USERNAME
-            if not BOT_USERNAME:
-                 me = await client.get_me()
-                 BOT_USERNAME = me.username
-                 
-            bot_link = f"https://t.me/{BOT_USERNAME}?start={code}"
+            code = await file_store.save_file(
+                file_ids[0], caption=caption_file, parts=file_ids if len(file_ids) > 1 else None,
+                source_hash=fingerprint.source, content_hash=fingerprint.content,
+                variant=fingerprint.variant
+            )
             
             # 4. Reply with formatted post (Preview)
-            title = metadata.get('title', 'New Script')
-            image_url = metadata.get('image_url')
-            demo_url = metadata.get('demo_url')
-            description = metadata.get('description')
-            
-            # Stylish Caption
-            caption = f"🔥 **{title}**\n\n"
-            
-            if description:
-                desc_preview = description[:300] + "..." if len(description) > 300 else description
-                caption += f"📝 **Description**:\n{desc_preview}\n\n"
-            
-            if demo_url:
-                caption += f"🌐 **Demo**: [Live Preview]({demo_url})\n"
-                
-            caption += "\n━━━━━━━━━━━━━━━━━━━━━\n"
-            caption += "🚀 **Join Channel**: @freephplaravel\n"
-            caption += "━━━━━━━━━━━━━━━━━━━━━"
-            
-            if len(caption) > 1024:
-                caption = caption[:1021] + "..."
-            
-            keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("📥 Download File 📥", url=bot_link)]
-            ])
-            
-            await status_msg.delete()
-            
-            # Send to User (Preview)
             sent_msg = None
+            if not flight.detached:
+                await drop_status(status_msg, job)
+                sent_msg = await send_preview(client, message, code, metadata, preview_photo(metadata), should_autopost)
             
-            local_img = metadata.get('image_path')
-            use_local_img = local_img and os.path.exists(local_img)
+            result = {
+                "code": code,
+                "file_ids": file_ids,
+                "caption": caption_file,
+                "metadata": {k: metadata.get(k) for k in CACHED_METADATA},
+                # Re-sent by file_id; the scraped image is gone with the work dir
+                "photo": sent_msg.photo.file_id if sent_msg and sent_msg.photo else None,
+            }
             
-            if image_url and "codelist.cc" not in image_url and "codelist.cc" not in (metadata.get('original_url') or ""):
-                sent_msg = await message.reply_photo(
-                    photo=image_url,
-                    caption=caption,
-                    reply_markup=keyboard
-                )
-            elif use_local_img:
-                sent_msg = await message.reply_photo(
-                    photo=local_img,
-                    caption=caption,
-                    reply_markup=keyboard
-                )
-            else:
-                sent_msg = await message.reply_text(
-                    text=caption,
-                    reply_markup=keyboard,
-                    disable_web_page_preview=True
-                )
-                
-            # Auto-Post to Channel if Admin
-            if should_autopost and sent_msg:
-                logging.info(f"Auto-posting to channel {CHANNEL_ID}")
-                try:
-                    if image_url and "codelist.cc" not in image_url and "codelist.cc" not in (metadata.get('original_url') or ""):
-                        await client.send_photo(
-                            chat_id=CHANNEL_ID,
-                            photo=image_url,
-                            caption=caption,
-                            reply_markup=keyboard
-                        )
-                    elif use_local_img:
-                        await client.send_photo(
-                            chat_id=CHANNEL_ID,
-                            photo=local_img,
-                            caption=caption,
-                            reply_markup=keyboard
-                        )
-                    else:
-                        await client.send_message(
-                            chat_id=CHANNEL_ID,
-                            text=caption,
-                            reply_markup=keyboard,
-                            disable_web_page_preview=True
-                        )
-                    
-                    await message.reply_text(f"✅ Posted to channel `{CHANNEL_ID}`")
-                except Exception as e:
-                    await message.reply_text(f"⚠️ Failed to post to channel: {e}")
+            # 5. Remember the result, so the next request for this link is answered at once
+            if RESULT_CACHE_TTL:
+                await file_store.cache_result(cache_key, result, RESULT_CACHE_TTL)
+            return result
             
         else:
-            await status_msg.edit_text("Processing failed. Please check the logs.")
-
-    except Exception as e:
-        logging.error(f"Error: {e}")
-        await status_msg.edit_text(f"An error occurred: {str(e)}")
+            await show_status("Processing failed. Please check the logs.")
+            return None
     finally:
-        if os.path.exists(work_dir):
-            try:
-                shutil.rmtree(work_dir)
-            except:
-                pass
+        if job is not None:
+            leading_flights.pop(job["_id"], None)
+        uploader.cancel()
+        workspace.release(work_dir)
 
 if __name__ == "__main__":
     async def main():
+        # Fork the CPU processes while the bot is still small and single-threaded
+        await executors.start()
         await app.start()
         
         me = await app.get_me()
@@ -717,11 +966,31 @@ if __name__ == "__main__":
         BOT_USERNAME = me.username
         logging.info(f"Bot started as @{BOT_USERNAME}")
         
+        # Load persisted mirror health
+        await host_health.attach(file_store)
+        
+        # Find extraction tools once instead of on every job
+        await executors.run_io(probe_extractors)
+        copyright_cache.load()
+        
+        # Clean up work dirs left by crashed jobs, now and periodically
+        asyncio.create_task(workspace.run_janitor())
+        
+        # Resume the job queue where the last run left it
+        job_queue.register("link", run_link_job)
+        job_queue.register("post", lambda job, context: run_post_job(app, job, context))
+        job_queue.on_position = show_queue_position
+        await job_queue.attach(file_store)
+        if STATUS_CHECK_INTERVAL:
+            asyncio.create_task(watch_status_messages())
+        
         # Start Monitor
         asyncio.create_task(monitor_codelist(app))
         
         await idle()
         await app.stop()
+        await close_sessions()
+        executors.shutdown()
 
     loop = asyncio.get_event_loop()
     loop.run_until_complete(main())
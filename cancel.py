@@ -0,0 +1,56 @@
+import threading
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelToken:
+    """
+    Stops a job's blocking work from outside. Code running on an executor
+    thread calls check() between steps (files, chunks) and attaches its
+    child processes, which cancel() kills right away.
+    """
+
+    def __init__(self):
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._procs = set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="Cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            procs = list(self._procs)
+        for proc in procs:
+            _kill(proc)
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+    def attach(self, proc):
+        with self._lock:
+            self._procs.add(proc)
+            cancelled = self._event.is_set()
+        if cancelled:
+            _kill(proc)
+
+    def detach(self, proc):
+        with self._lock:
+            self._procs.discard(proc)
+
+
+def _kill(proc):
+    try:
+        proc.kill()
+    except OSError:
+        # Already gone
+        pass
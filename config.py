@@ -29,3 +29,73 @@ RSS_STATS = {
     "total_found": 0,
     "total_processed": 0
 }
+
+# Downloads
+DOWNLOAD_CONNECTIONS = int(os.getenv("DOWNLOAD_CONNECTIONS", 4))
+SEGMENTED_MIN_SIZE = int(os.getenv("SEGMENTED_MIN_SIZE_MB", 16)) * 1024 * 1024
+# Resumable .part files live here (shared across jobs so they survive restarts)
+PARTIAL_DIR = os.getenv("PARTIAL_DIR", "partials")
+PARTIAL_MAX_AGE = int(os.getenv("PARTIAL_MAX_AGE_HOURS", 24)) * 3600
+# Race codelist mirrors against each other and keep the fastest
+MIRROR_RACING = os.getenv("MIRROR_RACING", "true").lower() == "true"
+RACE_TIMEOUT = int(os.getenv("RACE_TIMEOUT", 20))
+# Seconds the other mirrors get to beat the first one that answered
+RACE_GRACE = float(os.getenv("RACE_GRACE", 2))
+# Host health / circuit breaker
+HEALTH_WINDOW = int(os.getenv("HEALTH_WINDOW", 20))
+CIRCUIT_THRESHOLD = int(os.getenv("CIRCUIT_THRESHOLD", 3))
+CIRCUIT_BASE_DELAY = int(os.getenv("CIRCUIT_BASE_DELAY", 60))
+CIRCUIT_MAX_DELAY = int(os.getenv("CIRCUIT_MAX_DELAY", 6 * 3600))
+# Simultaneous downloads per mirror host
+HOST_MAX_CONCURRENT = int(os.getenv("HOST_MAX_CONCURRENT", 2))
+# Pipe downloads straight into the extractor (ZIP in-process, RAR via bsdtar)
+STREAM_EXTRACT = os.getenv("STREAM_EXTRACT", "false").lower() == "true"
+# Processes for CPU-bound work (HTML parsing, image processing, deflate; 0 = one per CPU core)
+# and threads for blocking file, hashing and extractor work
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", 0)) or os.cpu_count() or 1
+IO_WORKERS = int(os.getenv("IO_WORKERS", 8))
+# Chunks of one repack compressed at once on the CPU pool (0 = CPU_WORKERS) and the input bytes they may hold in memory
+REPACK_WORKERS = int(os.getenv("REPACK_WORKERS", 0)) or CPU_WORKERS
+REPACK_MEMORY_BUDGET = int(os.getenv("REPACK_MEMORY_MB", 256)) * 1024 * 1024
+# CPU vs size trade-off when repacking: fast, balanced or small
+COMPRESSION_PROFILE = os.getenv("COMPRESSION_PROFILE", "balanced").lower()
+# Entries dropped from every repacked archive: exact file names and globs
+# (comma-separated, matched against the base name), a regex searched in
+# the full path, and a size limit in MB (0 = no limit)
+CLEAN_NAMES = [n.strip() for n in os.getenv("CLEAN_NAMES", "Downloaded from CODELIST.CC.url,codelist.cc.txt").split(",") if n.strip()]
+CLEAN_GLOBS = [g.strip() for g in os.getenv("CLEAN_GLOBS", "").split(",") if g.strip()]
+CLEAN_PATTERN = os.getenv("CLEAN_PATTERN", "")
+CLEAN_MAX_FILE_SIZE = int(os.getenv("CLEAN_MAX_FILE_MB", 0)) * 1024 * 1024
+# Job work dirs: RAM-backed (tmpfs) while the expected footprint fits the budget, disk otherwise
+RAM_WORK_DIR = os.getenv("RAM_WORK_DIR", "/dev/shm/uploader-work")
+WORK_DIR = os.getenv("WORK_DIR", ".")
+RAM_WORK_BUDGET = int(os.getenv("RAM_WORK_BUDGET_MB", 1024)) * 1024 * 1024
+# Work dirs left by crashed jobs are removed after this long
+WORK_DIR_MAX_AGE = int(os.getenv("WORK_DIR_MAX_AGE_HOURS", 6)) * 3600
+JANITOR_INTERVAL = int(os.getenv("JANITOR_INTERVAL_MINUTES", 30)) * 60
+# Disk and RAM kept free for everything else; jobs that would eat into it wait in a queue
+ADMISSION_DISK_RESERVE = int(os.getenv("ADMISSION_DISK_RESERVE_MB", 1024)) * 1024 * 1024
+ADMISSION_RAM_RESERVE = int(os.getenv("ADMISSION_RAM_RESERVE_MB", 256)) * 1024 * 1024
+# Per-job extraction quotas (0 = no limit): uncompressed size, file count,
+# compression ratio and path depth
+EXTRACT_MAX_BYTES = int(os.getenv("EXTRACT_MAX_MB", 20 * 1024)) * 1024 * 1024
+EXTRACT_MAX_FILES = int(os.getenv("EXTRACT_MAX_FILES", 200000))
+EXTRACT_MAX_RATIO = int(os.getenv("EXTRACT_MAX_RATIO", 200))
+EXTRACT_MAX_DEPTH = int(os.getenv("EXTRACT_MAX_DEPTH", 40))
+# Outputs larger than this are uploaded as numbered volumes (Telegram caps files at 2 GB; 0 = never split)
+SPLIT_VOLUME_SIZE = int(os.getenv("SPLIT_VOLUME_MB", 1950)) * 1024 * 1024
+# Repeat requests for a link are answered from the last result for this long (0 = no cache)
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL_HOURS", 72)) * 3600
+# Processing jobs run at once (auto-posts may take at most POST_JOB_WORKERS of them),
+# links a user may have queued, and restarts a job survives before it is dropped
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 5))
+POST_JOB_WORKERS = int(os.getenv("POST_JOB_WORKERS", 3))
+USER_MAX_JOBS = int(os.getenv("USER_MAX_JOBS", 2))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+# Jobs whose status message was deleted are cancelled; seconds between checks (0 = off)
+STATUS_CHECK_INTERVAL = int(os.getenv("STATUS_CHECK_INTERVAL", 30))
+# Auto-post jobs in each processing stage at once; jobs move through download -> extract/repack -> upload,
+# so with several posts running one downloads while another repacks and a third uploads (user links aren't limited here)
+PIPELINE_DOWNLOADS = int(os.getenv("PIPELINE_DOWNLOADS", 2))
+PIPELINE_PROCESSING = int(os.getenv("PIPELINE_PROCESSING", 1))
+PIPELINE_UPLOADS = int(os.getenv("PIPELINE_UPLOADS", 2))
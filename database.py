@@ -17,6 +17,11 @@ class MongoFileStore:
         self.collection = self.db.CODELIST
         self.users = self.db.USERS
         self.processed = self.db.PROCESSED_POSTS
+        self.host_health = self.db.HOST_HEALTH
+        self.url_cache = self.db.URL_CACHE
+        self.jobs = self.db.JOBS
+        self._cache_indexes = False
+        self._hash_indexes = False
 
     async def add_user(self, user_id, first_name):
         await self.users.update_one(
@@ -35,13 +40,62 @@ class MongoFileStore:
             upsert=True
         )
 
+    async def get_host_health(self):
+        return await self.host_health.find({}).to_list(length=None)
+
+    async def save_host_health(self, host, doc):
+        await self.host_health.update_one(
+            {"host": host},
+            {"$set": doc},
+            upsert=True
+        )
+
+    async def get_cached_result(self, url):
+        # Expired entries are also removed by the TTL index, but only once a minute
+        doc = await self.url_cache.find_one({"url": url})
+        if doc and doc["expires_at"] > datetime.datetime.utcnow():
+            return doc
+        return None
+
+    async def cache_result(self, url, result, ttl):
+        """
+        Remember what a source URL produced (code, file_ids, caption,
+        metadata, preview photo) for ttl seconds.
+        """
+        if not self._cache_indexes:
+            await self.url_cache.create_index("url", unique=True)
+            await self.url_cache.create_index("expires_at", expireAfterSeconds=0)
+            self._cache_indexes = True
+        doc = dict(result, url=url, expires_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl))
+        await self.url_cache.update_one({"url": url}, {"$set": doc}, upsert=True)
+
+    async def invalidate_cached_result(self, url=None):
+        # url=None drops the whole cache; returns the number of entries removed
+        result = await self.url_cache.delete_many({} if url is None else {"url": url})
+        return result.deleted_count
+
+    async def get_pending_jobs(self):
+        return await self.jobs.find({"state": {"$in": ["queued", "running"]}}).to_list(length=None)
+
+    async def save_job(self, job):
+        await self.jobs.replace_one({"_id": job["_id"]}, job, upsert=True)
+
+    async def update_job(self, job_id, fields):
+        await self.jobs.update_one({"_id": job_id}, {"$set": fields})
+
+    async def delete_job(self, job_id):
+        await self.jobs.delete_one({"_id": job_id})
+
     async def get_total_users(self):
         return await self.users.count_documents({})
 
     async def get_all_users(self):
         return self.users.find({})
 
-    async def save_file(self, file_id, caption=None):
+    async def save_file(self, file_id, caption=None, parts=None, source_hash=None, content_hash=None, variant=None):
+        # parts: file_ids of every volume, in order, when the upload was split
+        # source_hash / content_hash: SHA-256 of the downloaded archive and of the upload
+        # variant: how the archive was cleaned (see dedup.Fingerprint)
         # Generate a unique 8-char code
         while True:
             code = secrets.token_urlsafe(6)
@@ -53,6 +107,10 @@ class MongoFileStore:
             "code": code,
             "file_id": file_id,
             "caption": caption,
+            "parts": parts,
+            "source_hash": source_hash,
+            "content_hash": content_hash,
+            "variant": variant,
             "created_at": time.time()
         })
         return code
@@ -60,4 +118,18 @@ class MongoFileStore:
     async def get_file(self, code):
         return await self.collection.find_one({"code": code})
 
+    async def find_by_hash(self, sha256, variant=None):
+        """
+        An earlier upload of the same output, or of the same archive
+        cleaned the same way (variant), if any.
+        """
+        if not self._hash_indexes:
+            await self.collection.create_index("source_hash", sparse=True)
+            await self.collection.create_index("content_hash", sparse=True)
+            self._hash_indexes = True
+        return await self.collection.find_one(
+            {"$or": [{"source_hash": sha256, "variant": variant}, {"content_hash": sha256}]},
+            sort=[("created_at", -1)]
+        )
+
 file_store = MongoFileStore(MONGO_URI)
@@ -0,0 +1,67 @@
+import hashlib
+
+HASH_READ_SIZE = 1024 * 1024
+
+
+class Duplicate(Exception):
+    """
+    The job's archive was uploaded before; `doc` is its CODELIST document
+    and `metadata` what the job had scraped so far.
+    """
+
+    def __init__(self, doc, metadata=None):
+        super().__init__(f"Already uploaded as {doc.get('code')}")
+        self.doc = doc
+        self.metadata = metadata
+
+
+def file_sha256(*paths):
+    """
+    SHA-256 of the given files read back to back (all volumes of a split output).
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(HASH_READ_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+    return digest.hexdigest()
+
+
+def file_ids_of(doc):
+    return doc.get('parts') or [doc['file_id']]
+
+
+class Fingerprint:
+    """
+    Content hashes of one job, filled in by the processor: `source` for
+    the downloaded archive and `content` for the repacked output, which is
+    built deterministically so the same files always hash the same.
+    `variant` identifies everything else that shapes the output (clean
+    rules, copyright files); the same archive cleaned another way is a
+    different upload.
+    lookup(sha256, variant=None) is an async search of earlier uploads;
+    a known source of the same variant stops the job with Duplicate
+    before anything is repacked.
+    """
+
+    def __init__(self, lookup=None):
+        self.lookup = lookup
+        self.source = None
+        self.content = None
+        self.variant = None
+
+    async def check_source(self, sha256):
+        self.source = sha256
+        if self.lookup:
+            doc = await self.lookup(sha256, self.variant)
+            if doc:
+                print(f"Archive {sha256[:12]} already uploaded as {doc.get('code')}")
+                raise Duplicate(doc)
+
+    async def find_content(self):
+        if self.lookup and self.content:
+            return await self.lookup(self.content)
+        return None
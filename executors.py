@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import CPU_WORKERS, IO_WORKERS
+
+
+def _warm_up():
+    return None
+
+
+class Executors:
+    """
+    Where blocking work runs. CPU-bound steps (HTML parsing, image decoding,
+    deflate) go to a process pool sized to the cores so they aren't
+    serialised by the GIL; blocking file, hashing and subprocess work goes
+    to a bounded thread pool of its own. Work sent to the CPU pool must be
+    a module-level function with picklable arguments and result. If a
+    worker process dies (OOM kill, crash), the pool is replaced.
+    """
+
+    def __init__(self, cpu_workers, io_workers):
+        self.cpu_workers = max(1, cpu_workers)
+        self.io_workers = max(1, io_workers)
+        self._cpu = None
+        self._io = None
+        # Repack threads take the CPU pool too
+        self._lock = threading.Lock()
+
+    @property
+    def cpu(self):
+        with self._lock:
+            if self._cpu is None:
+                self._cpu = ProcessPoolExecutor(max_workers=self.cpu_workers)
+            return self._cpu
+
+    def replace_cpu(self, broken):
+        """
+        Drop a pool that raised BrokenProcessPool; the next use starts a new
+        one. Safe to call from several callers that saw the same pool break.
+        """
+        with self._lock:
+            if self._cpu is not broken:
+                return
+            logging.error("A CPU worker process died; starting a new pool")
+            self._cpu = None
+        broken.shutdown(wait=False)
+
+    @property
+    def io(self):
+        if self._io is None:
+            self._io = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="io")
+        return self._io
+
+    async def start(self):
+        """
+        Fork the CPU workers up front, while the bot is still small and
+        has few threads, instead of in the middle of the first job.
+        """
+        await asyncio.gather(*(self.run_cpu(_warm_up) for _ in range(self.cpu_workers)))
+        logging.info(f"Execution pools ready ({self.cpu_workers} CPU processes, {self.io_workers} I/O threads)")
+
+    async def run_cpu(self, func, *args):
+        loop = asyncio.get_running_loop()
+        pool = self.cpu
+        try:
+            return await loop.run_in_executor(pool, func, *args)
+        except BrokenProcessPool:
+            # Maybe another job's worker died; retry once on a fresh pool
+            self.replace_cpu(pool)
+            return await loop.run_in_executor(self.cpu, func, *args)
+
+    async def run_io(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.io, func, *args)
+
+    async def run_io_cancellable(self, token, func, *args):
+        """
+        run_io for work inside a job's work dir. If the caller is cancelled,
+        so is the cancel.CancelToken (work that watches it stops early), and
+        this waits for the thread to finish, so nothing still touches the
+        files the caller cleans up.
+        """
+        future = asyncio.get_running_loop().run_in_executor(self.io, func, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            token.cancel()
+            try:
+                await future
+            except Exception:
+                pass
+            raise
+
+    def shutdown(self):
+        if self._cpu is not None:
+            self._cpu.shutdown(wait=False, cancel_futures=True)
+        if self._io is not None:
+            self._io.shutdown(wait=False)
+
+
+executors = Executors(CPU_WORKERS, IO_WORKERS)
@@ -0,0 +1,172 @@
+import time
+import asyncio
+import logging
+import statistics
+from config import HEALTH_WINDOW, CIRCUIT_THRESHOLD, CIRCUIT_BASE_DELAY, CIRCUIT_MAX_DELAY
+
+# Assumptions for hosts we have no history for (keeps the configured order)
+PRIOR_THROUGHPUT = 5 * 1024 * 1024
+DEFAULT_EXPECTED_SIZE = 100 * 1024 * 1024
+
+
+def classify_error(error):
+    text = str(error).lower()
+    if 'http error 4' in text:
+        return 'http_4xx'
+    if 'http error 5' in text:
+        return 'http_5xx'
+    if 'timed out' in text or 'timeout' in text:
+        return 'timeout'
+    if 'resolve' in text or 'connect' in text or 'reset' in text:
+        return 'connection'
+    if 'error page' in text or 'too small' in text or 'not an archive' in text:
+        return 'content'
+    return 'other'
+
+
+class HostHealth:
+    """
+    Rolling record of recent outcomes for one mirror host, plus its
+    circuit breaker state.
+    """
+
+    def __init__(self, host, doc=None):
+        doc = doc or {}
+        self.host = host
+        # Each outcome: {'ok': bool, 'throughput': bytes/s or None, 'error': class or None, 'at': ts}
+        self.outcomes = doc.get('outcomes', [])
+        self.errors = doc.get('errors', {})
+        self.consecutive_failures = doc.get('consecutive_failures', 0)
+        self.trips = doc.get('trips', 0)
+        self.open_until = doc.get('open_until', 0)
+
+    def to_doc(self):
+        return {
+            'host': self.host,
+            'outcomes': self.outcomes,
+            'errors': self.errors,
+            'consecutive_failures': self.consecutive_failures,
+            'trips': self.trips,
+            'open_until': self.open_until,
+        }
+
+    def _push(self, outcome):
+        self.outcomes.append(outcome)
+        del self.outcomes[:-HEALTH_WINDOW]
+
+    def record_success(self, nbytes, seconds):
+        throughput = nbytes / seconds if seconds > 0 and nbytes > 0 else None
+        self._push({'ok': True, 'throughput': throughput, 'error': None, 'at': time.time()})
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_until = 0
+
+    def record_failure(self, error):
+        error_class = classify_error(error)
+        self._push({'ok': False, 'throughput': None, 'error': error_class, 'at': time.time()})
+        self.errors[error_class] = self.errors.get(error_class, 0) + 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= CIRCUIT_THRESHOLD:
+            # Open (or re-open after a failed half-open probe) with exponential backoff
+            self.trips += 1
+            delay = min(CIRCUIT_BASE_DELAY * 2 ** (self.trips - 1), CIRCUIT_MAX_DELAY)
+            self.open_until = time.time() + delay
+            logging.warning(f"Circuit opened for {self.host} for {delay}s ({self.consecutive_failures} consecutive failures)")
+
+    @property
+    def is_open(self):
+        return time.time() < self.open_until
+
+    @property
+    def success_rate(self):
+        if not self.outcomes:
+            return 1.0
+        return sum(1 for o in self.outcomes if o['ok']) / len(self.outcomes)
+
+    @property
+    def median_throughput(self):
+        samples = [o['throughput'] for o in self.outcomes if o['ok'] and o['throughput']]
+        if not samples:
+            return PRIOR_THROUGHPUT
+        return statistics.median(samples)
+
+    def expected_seconds(self, size=None):
+        """
+        Expected time to finish a download, inflated by the failure rate.
+        """
+        size = size or DEFAULT_EXPECTED_SIZE
+        return size / self.median_throughput / max(self.success_rate, 0.05)
+
+    def retry_delay(self, attempt):
+        """
+        Backoff between download retries; grows with the host's recent failures.
+        """
+        return min(2 * 2 ** (attempt + self.consecutive_failures), 60)
+
+
+class HostHealthRegistry:
+    """
+    Health models for all mirror hosts, persisted through an attached store
+    (MongoFileStore) so they survive restarts.
+    """
+
+    def __init__(self):
+        self.hosts = {}
+        self.store = None
+        # Pending writes; the loop only keeps weak references to tasks
+        self.saves = set()
+
+    def get(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = HostHealth(host)
+        return self.hosts[host]
+
+    async def attach(self, store):
+        self.store = store
+        try:
+            for doc in await store.get_host_health():
+                self.hosts[doc['host']] = HostHealth(doc['host'], doc)
+            logging.info(f"Loaded health for {len(self.hosts)} hosts")
+        except Exception as e:
+            logging.error(f"Error loading host health: {e}")
+
+    def _persist(self, health):
+        if not self.store:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self.store.save_host_health(health.host, health.to_doc()))
+        except RuntimeError:
+            return
+        self.saves.add(task)
+        task.add_done_callback(self._saved)
+
+    def _saved(self, task):
+        self.saves.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Error saving host health: {task.exception()}")
+
+    def record_success(self, host, nbytes, seconds):
+        health = self.get(host)
+        health.record_success(nbytes, seconds)
+        self._persist(health)
+
+    def record_failure(self, host, error):
+        health = self.get(host)
+        health.record_failure(error)
+        self._persist(health)
+
+    def order(self, candidates, size=None):
+        """
+        Sort (host, link) candidates by expected completion time. Hosts with
+        an open circuit are dropped, unless every candidate is open.
+        """
+        closed = [c for c in candidates if not self.get(c[0]).is_open]
+        if not closed:
+            closed = list(candidates)
+        skipped = [c[0] for c in candidates if c not in closed]
+        if skipped:
+            print(f"Skipping hosts with open circuit: {skipped}")
+        return sorted(closed, key=lambda c: self.get(c[0]).expected_seconds(size))
+
+
+host_health = HostHealthRegistry()
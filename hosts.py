@@ -0,0 +1,226 @@
+import os
+import re
+import asyncio
+from urllib.parse import urlparse, unquote, urlsplit, urlunsplit, parse_qsl, urlencode
+from bs4 import BeautifulSoup
+from net import get_session, fetch, fetch_text
+from config import HOST_MAX_CONCURRENT
+from executors import executors
+
+ARCHIVE_EXTENSIONS = ('.rar', '.zip', '.7z', '.tar', '.gz', '.tgz', '.bz2', '.xz')
+# Query parameters that only say where a link was clicked
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid')
+
+# name -> adapter instance, in registration (= fallback priority) order
+HOST_ADAPTERS = {}
+
+
+def register(cls):
+    adapter = cls()
+    HOST_ADAPTERS[adapter.name] = adapter
+    return cls
+
+
+def get_adapter(name):
+    return HOST_ADAPTERS[name]
+
+
+def adapter_for_url(url):
+    for adapter in HOST_ADAPTERS.values():
+        if adapter.matches(url):
+            return adapter
+    return None
+
+
+def filename_from_url(url, default):
+    name = os.path.basename(unquote(urlparse(url).path))
+    if name.lower().endswith(ARCHIVE_EXTENSIONS):
+        return name
+    return default
+
+
+def normalize_url(url):
+    """
+    Canonical form of a source link, so the same page sent in different
+    ways maps to one cache entry: https, lower-case host without "www.",
+    no fragment, tracking parameters or trailing slash.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    ]
+    return urlunsplit(('https', host, parts.path.rstrip('/') or '/', urlencode(query), ''))
+
+
+class HostAdapter:
+    """
+    A download mirror. Subclasses describe how to find the mirror's links on a
+    codelist page and implement resolve(); the download itself (pooled
+    session, segments, resume, health) is shared by every adapter.
+    """
+
+    name = None
+    domains = ()
+    # Key in codelist metadata, and how to find the link on a post page
+    metadata_key = None
+    link_regex = None
+    link_contains = None
+    impersonate = "chrome"
+    max_concurrent = HOST_MAX_CONCURRENT
+    default_filename = "download.rar"
+
+    def __init__(self):
+        self._semaphore = None
+
+    def matches(self, url):
+        return any(domain in url for domain in self.domains)
+
+    @property
+    def semaphore(self):
+        # Created lazily so it binds to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    def session(self, url):
+        return get_session(url, self.impersonate)
+
+    def find_link(self, html, soup):
+        if self.link_regex:
+            matches = re.findall(self.link_regex, html)
+            if matches:
+                return matches[0]
+        if self.link_contains:
+            for a in soup.find_all('a', href=True):
+                if self.link_contains in a['href']:
+                    return a['href']
+        return None
+
+    def target(self, download_url, session=None):
+        """
+        Download target for the shared downloader. The Content-Disposition
+        filename wins over the one guessed from the URL.
+        """
+        return {
+            'url': download_url,
+            'filename': filename_from_url(download_url, self.default_filename),
+            'session': session or self.session(download_url),
+            'use_remote_name': True,
+        }
+
+    async def resolve(self, url):
+        raise NotImplementedError
+
+
+def parse_direct_link(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    for a in soup.find_all('a', href=True):
+        if '/download/' in a['href']:
+            return a['href']
+    return None
+
+
+@register
+class UploadEeAdapter(HostAdapter):
+    name = 'upload.ee'
+    domains = ('upload.ee',)
+    metadata_key = 'upload_ee_url'
+    link_regex = r'(https?://www\.upload\.ee/files/[^\s"<]+)'
+    link_contains = 'upload.ee'
+
+    async def resolve(self, url):
+        html = await fetch_text(url, session=self.session(url))
+        direct_link = parse_direct_link(html)
+        if not direct_link:
+            raise Exception("Could not find direct download link on page.")
+        return self.target(direct_link)
+
+
+# Krakenfiles wants the token as multipart form data
+KRAKEN_BOUNDARY = "----WebKitFormBoundary7MA4YWxkTrZu0gW"
+
+
+def parse_kraken_form(html):
+    """
+    (token, file hash) from a Krakenfiles file page, or None.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    token_input = soup.find('input', id='dl-token') or soup.find('input', attrs={'name': 'token'})
+    hash_el = soup.find(attrs={'data-file-hash': True})
+    if not token_input or not hash_el:
+        return None
+    return token_input['value'], hash_el['data-file-hash']
+
+
+@register
+class KrakenfilesAdapter(HostAdapter):
+    name = 'krakenfiles'
+    domains = ('krakenfiles.com',)
+    metadata_key = 'krakenfiles_url'
+    link_regex = r'(https?://krakenfiles\.com/view/[^\s"<]+)'
+    link_contains = 'krakenfiles.com'
+
+    async def resolve(self, url):
+        session = self.session(url)
+        html = await fetch_text(url, session=session)
+        form = await executors.run_cpu(parse_kraken_form, html)
+        if not form:
+            raise Exception("Could not find Krakenfiles download token on page.")
+
+        token, file_hash = form
+        body = (
+            f"--{KRAKEN_BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="token"\r\n\r\n'
+            f"{token}\r\n"
+            f"--{KRAKEN_BOUNDARY}--\r\n"
+        )
+        response = await fetch(
+            f"https://krakenfiles.com/download/{file_hash}", method="POST", session=session,
+            data=body, headers={
+                "Content-Type": f"multipart/form-data; boundary={KRAKEN_BOUNDARY}",
+                "Cache-Control": "no-cache",
+                "hash": file_hash,
+                "Referer": url,
+            }
+        )
+        response.raise_for_status()
+        download_url = response.json().get('url')
+        if not download_url:
+            raise Exception("Krakenfiles returned no download link.")
+        return self.target(download_url)
+
+
+@register
+class WorkuploadAdapter(HostAdapter):
+    name = 'workupload'
+    domains = ('workupload.com',)
+    metadata_key = 'workupload_url'
+    link_regex = r'(https?://workupload\.com/file/[^\s"<]+)'
+    link_contains = 'workupload.com/file/'
+    impersonate = "chrome120"
+
+    async def resolve(self, url):
+        # Get Page to set cookies on the pooled session; the download is on the same host
+        session = self.session(url)
+        await fetch_text(url, session=session)
+        file_id = url.split('/file/')[-1].strip('/')
+        return self.target(f"https://workupload.com/start/{file_id}", session)
+
+
+@register
+class PixeldrainAdapter(HostAdapter):
+    name = 'pixeldrain'
+    domains = ('pixeldrain.com',)
+    metadata_key = 'pixeldrain_url'
+    link_regex = r'(https?://pixeldrain\.com/u/[^\s"<]+)'
+    link_contains = 'pixeldrain.com/u/'
+    impersonate = "chrome120"
+
+    async def resolve(self, url):
+        # https://pixeldrain.com/u/tn5KZgLz -> https://pixeldrain.com/api/file/tn5KZgLz
+        file_id = url.split('/u/')[-1].strip('/')
+        return self.target(f"https://pixeldrain.com/api/file/{file_id}")
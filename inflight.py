@@ -0,0 +1,101 @@
+import asyncio
+import logging
+
+
+class Flight:
+    """
+    One job in progress. The leader publishes status texts; followers get
+    them via wait(on_status) and, in the end, the leader's result or error.
+    `followers` counts the callers still waiting.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.future = asyncio.get_running_loop().create_future()
+        self.listeners = []
+        self.status = None
+        self.followers = 0
+        self.detached = False
+        self._on_abandoned = None
+
+    def detach(self, on_abandoned):
+        """
+        The chat that started the job no longer wants it, but followers do:
+        the work goes on for them (the leader checks `detached` and stops
+        reporting to its own chat). on_abandoned() is called if the last
+        follower leaves before the job is done.
+        """
+        self.detached = True
+        self._on_abandoned = on_abandoned
+
+    def publish(self, status):
+        self.status = status
+        for listener in list(self.listeners):
+            try:
+                listener(status)
+            except Exception as e:
+                logging.error(f"Status listener for {self.key} failed: {e}")
+
+    async def wait(self, on_status=None):
+        self.followers += 1
+        if on_status:
+            self.listeners.append(on_status)
+            if self.status:
+                on_status(self.status)
+        try:
+            # A follower giving up must not cancel the job for everyone else
+            return await asyncio.shield(self.future)
+        finally:
+            self.followers -= 1
+            if on_status:
+                self.listeners.remove(on_status)
+            if self._on_abandoned and not self.followers and not self.future.done():
+                self._on_abandoned()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical jobs: the first caller for a key runs the
+    work, later callers wait for its result instead of starting their own.
+    """
+
+    def __init__(self):
+        self.flights = {}
+
+    def _finish(self, flight, result=None, error=None):
+        self.flights.pop(flight.key, None)
+        if error is None:
+            flight.future.set_result(result)
+        else:
+            flight.future.set_exception(error)
+            if not flight.followers:
+                # Retrieved, so asyncio doesn't log it as never retrieved
+                flight.future.exception()
+
+    async def run(self, key, work, on_status=None):
+        """
+        Await work(flight) unless a job for `key` is already running, in
+        which case wait for that one (following its status with on_status).
+        Returns (result, leader).
+        """
+        flight = self.flights.get(key)
+        if flight is not None:
+            logging.info(f"Joining job in progress for {key} ({flight.followers + 1} waiting)")
+            return await flight.wait(on_status), False
+
+        flight = Flight(key)
+        self.flights[key] = flight
+        try:
+            result = await work(flight)
+        except asyncio.CancelledError:
+            # Followers are not cancelled themselves; they see a failed job
+            self._finish(flight, error=Exception("The job was cancelled"))
+            raise
+        except BaseException as e:
+            self._finish(flight, error=e)
+            raise
+        self._finish(flight, result)
+        return result, True
+
+
+inflight = SingleFlight()
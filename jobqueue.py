@@ -0,0 +1,233 @@
+import time
+import asyncio
+import logging
+import secrets
+from config import JOB_WORKERS, POST_JOB_WORKERS, USER_MAX_JOBS, JOB_MAX_ATTEMPTS
+from cancel import Cancelled
+
+# Lower runs first
+PRIORITY_ADMIN = 0
+PRIORITY_MONITOR = 1
+PRIORITY_USER = 2
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Processing jobs in priority order (admin, monitor, users; oldest first
+    within a priority), at most `workers` at a time and at most
+    kind_limits[kind] of one kind. Jobs are stored in Mongo (JOBS) while
+    queued or running, so after a restart they are picked up again.
+
+    Handlers are registered per kind as handler(job, context): `job` is the
+    stored document, `context` whatever in-memory extras submit() was given
+    (None for a job recovered after a restart).
+    """
+
+    def __init__(self, workers, kind_limits=None, user_limit=0, max_attempts=3):
+        self.workers = workers
+        self.kind_limits = kind_limits or {}
+        self.user_limit = user_limit
+        self.max_attempts = max_attempts
+        self.handlers = {}
+        self.queued = []
+        self.running = {}
+        self.context = {}
+        self.futures = {}
+        self.tasks = {}
+        # job id -> reason, for running jobs being cancelled
+        self.cancelling = {}
+        self.store = None
+        # on_position(job, position) is called when a queued job moves up
+        self.on_position = None
+        self._wakeup = None
+
+    @property
+    def wakeup(self):
+        # Created lazily so it binds to the running loop
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    async def attach(self, store):
+        """
+        Load the jobs left by the previous run and start dispatching.
+        Jobs that were running are queued again, up to max_attempts.
+        """
+        self.store = store
+        for job in await store.get_pending_jobs():
+            if job["state"] == "running":
+                job["attempts"] += 1
+                if job["attempts"] >= self.max_attempts:
+                    logging.error(f"Dropping job {job['_id']} ({job['kind']} {job['key']}) after {job['attempts']} attempts")
+                    await store.delete_job(job["_id"])
+                    continue
+                job["state"] = "queued"
+                await store.save_job(job)
+            self.queued.append(job)
+        if self.queued:
+            logging.info(f"Recovered {len(self.queued)} queued jobs")
+        self._sort()
+        asyncio.create_task(self._dispatch())
+
+    def _sort(self):
+        self.queued.sort(key=lambda job: (job["priority"], job["created_at"]))
+
+    def find(self, kind, key):
+        for job in self.queued + list(self.running.values()):
+            if job["kind"] == kind and job["key"] == key:
+                return job
+        return None
+
+    def jobs(self, user_id=None):
+        """
+        Queued and running jobs, optionally only those of one user.
+        """
+        return [job for job in self.queued + list(self.running.values())
+                if user_id is None or job.get("user_id") == user_id]
+
+    def user_jobs(self, user_id):
+        return len(self.jobs(user_id))
+
+    def position(self, job):
+        """
+        1-based place among the queued jobs, 0 once it runs.
+        """
+        for i, queued in enumerate(self.queued, 1):
+            if queued["_id"] == job["_id"]:
+                return i
+        return 0
+
+    async def submit(self, kind, key, priority=PRIORITY_USER, user_id=None, context=None, **fields):
+        """
+        Queue a job, or return the queued or running job of the same kind
+        and key. Raises QueueFull if the user already has user_limit jobs.
+        """
+        existing = self.find(kind, key)
+        if existing:
+            return existing
+        if (self.user_limit and user_id is not None and priority != PRIORITY_ADMIN
+                and self.user_jobs(user_id) >= self.user_limit):
+            raise QueueFull(f"You already have {self.user_limit} links in the queue. Please wait for them to finish.")
+
+        job = dict(fields, _id=secrets.token_hex(8), kind=kind, key=key, priority=priority, user_id=user_id,
+                   state="queued", attempts=0, created_at=time.time())
+        if self.store:
+            await self.store.save_job(job)
+        if context is not None:
+            self.context[job["_id"]] = context
+        self.futures[job["_id"]] = asyncio.get_running_loop().create_future()
+        self.queued.append(job)
+        self._sort()
+        self.wakeup.set()
+        return job
+
+    async def wait(self, job):
+        """
+        The job's result. Jobs recovered after a restart can be waited on
+        too, as long as they haven't finished yet.
+        """
+        future = self.futures.get(job["_id"])
+        if future is None:
+            future = self.futures[job["_id"]] = asyncio.get_running_loop().create_future()
+        return await asyncio.shield(future)
+
+    async def cancel(self, job, reason="Cancelled"):
+        """
+        Drop a queued job, or stop a running one and wait until it has
+        cleaned up. Its waiters get Cancelled. False if the job is gone.
+        """
+        job_id = job["_id"]
+        if job in self.queued:
+            self.queued.remove(job)
+            await self._finish(job, error=Cancelled(reason))
+            return True
+        task = self.tasks.get(job_id)
+        if task is None:
+            return False
+        self.cancelling[job_id] = reason
+        task.cancel()
+        await asyncio.wait({task})
+        if self.cancelling.pop(job_id, None) is not None:
+            # Cancelled before _run got to start
+            await self._finish(job, error=Cancelled(reason))
+        return True
+
+    def _kind_free(self, kind):
+        limit = self.kind_limits.get(kind)
+        return not limit or sum(1 for job in self.running.values() if job["kind"] == kind) < limit
+
+    async def _dispatch(self):
+        while True:
+            self.wakeup.clear()
+            for job in list(self.queued):
+                if len(self.running) >= self.workers:
+                    break
+                if self._kind_free(job["kind"]):
+                    self.queued.remove(job)
+                    self.running[job["_id"]] = job
+                    self.tasks[job["_id"]] = asyncio.create_task(self._run(job))
+            self._report_positions()
+            await self.wakeup.wait()
+
+    def _report_positions(self):
+        for i, job in enumerate(self.queued, 1):
+            if job.get("position") != i:
+                job["position"] = i
+                if self.on_position:
+                    try:
+                        self.on_position(job, i)
+                    except Exception as e:
+                        logging.error(f"Queue position update failed: {e}")
+
+    async def _run(self, job):
+        job_id = job["_id"]
+        result = error = None
+        try:
+            job["state"] = "running"
+            if self.store:
+                await self.store.update_job(job_id, {"state": "running", "started_at": time.time()})
+            result = await self.handlers[job["kind"]](job, self.context.get(job_id))
+        except asyncio.CancelledError:
+            reason = self.cancelling.pop(job_id, None)
+            if reason is None:
+                # Shutting down: the stored job stays "running" and is retried on the next start
+                self.running.pop(job_id, None)
+                self.tasks.pop(job_id, None)
+                raise
+            logging.info(f"Job {job_id} ({job['kind']} {job['key']}) cancelled: {reason}")
+            error = Cancelled(reason)
+        except Exception as e:
+            logging.error(f"Job {job_id} ({job['kind']} {job['key']}) failed: {e}")
+            error = e
+        await self._finish(job, result, error)
+
+    async def _finish(self, job, result=None, error=None):
+        job_id = job["_id"]
+        self.running.pop(job_id, None)
+        self.tasks.pop(job_id, None)
+        self.context.pop(job_id, None)
+        if self.store:
+            try:
+                await self.store.delete_job(job_id)
+            except Exception as e:
+                logging.error(f"Could not remove finished job {job_id}: {e}")
+        self.wakeup.set()
+
+        future = self.futures.pop(job_id, None)
+        if future is not None and not future.done():
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+                # Nobody may be waiting; don't let asyncio log it as unretrieved
+                future.exception()
+
+
+job_queue = JobQueue(JOB_WORKERS, {"post": POST_JOB_WORKERS}, USER_MAX_JOBS, JOB_MAX_ATTEMPTS)
@@ -0,0 +1,659 @@
+import os
+import time
+import json
+import shutil
+import hashlib
+import asyncio
+from urllib.parse import urlparse
+from curl_cffi.requests import AsyncSession
+from config import DOWNLOAD_CONNECTIONS, SEGMENTED_MIN_SIZE, PARTIAL_DIR, PARTIAL_MAX_AGE
+
+# Defaults for the async networking layer
+DEFAULT_IMPERSONATE = "chrome"
+MAX_CLIENTS_PER_SESSION = 10
+# (connect, read) timeouts. A flat total timeout would kill large downloads.
+DOWNLOAD_TIMEOUT = (15, 60)
+PAGE_TIMEOUT = 30
+# Never split a file into segments smaller than this
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+# How often (in bytes per segment) the resume sidecar is rewritten
+SIDECAR_SAVE_INTERVAL = 4 * 1024 * 1024
+# Mirror racing: stop sampling a mirror after this many bytes or seconds
+RACE_SAMPLE_BYTES = 2 * 1024 * 1024
+RACE_WINDOW = 3
+
+
+# Leading bytes of the archive formats we handle
+ARCHIVE_SIGNATURES = [
+    (b'Rar!\x1a\x07', 'rar'),
+    (b'PK\x03\x04', 'zip'),
+    (b'PK\x05\x06', 'zip'),
+    (b'PK\x07\x08', 'zip'),
+    (b'7z\xbc\xaf\x27\x1c', '7z'),
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bzip2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+]
+
+
+class BadContentError(Exception):
+    """
+    The host answered with an error page (HTML/JSON) instead of a file.
+    Retrying the same URL will not help; move on to the next mirror.
+    """
+
+
+class SinkError(Exception):
+    """
+    Raised by stream_download when its sink (the extractor) failed rather
+    than the transfer. The sink's own exception is the __cause__.
+    """
+
+
+def sniff_content(head, content_type=None):
+    """
+    Identify the archive format from the first bytes of a body.
+    Returns 'rar', 'zip', '7z', ... or None for unknown binary data, and
+    raises BadContentError for HTML or JSON error bodies.
+    """
+    for signature, archive_format in ARCHIVE_SIGNATURES:
+        if head.startswith(signature):
+            return archive_format
+    
+    content_type = (content_type or '').lower()
+    stripped = head.lstrip()[:64].lower()
+    if ('text/html' in content_type or 'application/json' in content_type
+            or stripped.startswith((b'<!doctype', b'<html', b'<head', b'<?xml', b'{', b'['))):
+        preview = head[:200].decode('utf-8', errors='ignore')
+        raise BadContentError(f"Got error page instead of archive ({content_type or 'no content-type'}): {preview!r}")
+    return None
+
+
+def sniff_file(path):
+    with open(path, 'rb') as f:
+        return sniff_content(f.read(512))
+
+
+class SessionPool:
+    """
+    Long-lived AsyncSessions shared per (host, impersonation profile).
+    Requests to the same host reuse pooled keep-alive connections instead of
+    paying for a new TLS handshake on every call.
+    """
+
+    def __init__(self, max_clients=MAX_CLIENTS_PER_SESSION):
+        self.max_clients = max_clients
+        self._sessions = {}
+
+    def get(self, url, impersonate=DEFAULT_IMPERSONATE):
+        host = urlparse(url).netloc.lower()
+        key = (host, impersonate)
+        session = self._sessions.get(key)
+        if session is None:
+            session = AsyncSession(impersonate=impersonate, max_clients=self.max_clients)
+            self._sessions[key] = session
+        return session
+
+    async def close(self):
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            try:
+                await session.close()
+            except Exception as e:
+                print(f"Error closing session: {e}")
+
+
+session_pool = SessionPool()
+
+
+def get_session(url, impersonate=DEFAULT_IMPERSONATE):
+    return session_pool.get(url, impersonate)
+
+
+async def close_sessions():
+    await session_pool.close()
+
+
+async def fetch(url, method="GET", impersonate=DEFAULT_IMPERSONATE, session=None, **kwargs):
+    """
+    Perform a (non-streaming) request on the pooled session for the URL's host.
+    """
+    session = session or get_session(url, impersonate)
+    kwargs.setdefault("timeout", PAGE_TIMEOUT)
+    return await session.request(method, url, **kwargs)
+
+
+async def fetch_text(url, impersonate=DEFAULT_IMPERSONATE, session=None, **kwargs):
+    response = await fetch(url, impersonate=impersonate, session=session, **kwargs)
+    response.raise_for_status()
+    return response.text
+
+
+def filename_from_headers(headers, default):
+    cd = headers.get('content-disposition')
+    if cd:
+        if 'filename="' in cd:
+            return cd.split('filename="')[1].split('"')[0]
+        elif 'filename=' in cd:
+            return cd.split('filename=')[1].split(';')[0].strip()
+    return default
+
+
+def remote_filename(headers, default, use_remote_name=True):
+    """
+    The name to give a download: the Content-Disposition filename if
+    use_remote_name is set and the response has one, else `default`.
+    """
+    if not use_remote_name:
+        return default
+    return os.path.basename(filename_from_headers(headers, default)) or default
+
+
+def _resolve_save_path(dest_path, headers, use_remote_name):
+    filename = remote_filename(headers, os.path.basename(dest_path), use_remote_name)
+    return os.path.join(os.path.dirname(dest_path), filename)
+
+
+class _AggregateProgress:
+    """
+    Sums bytes from several segment workers into one progress_callback stream.
+    """
+
+    def __init__(self, total, callback=None, done=0):
+        self.total = total
+        self.done = done
+        self.callback = callback
+
+    def add(self, n):
+        self.done += n
+        if self.callback and self.total > 0:
+            self.callback(self.done, self.total)
+
+
+def _response_info(url, response):
+    """
+    Size, range support and validators from a response to a Range request.
+    """
+    info = {
+        'url': response.url or url,
+        'headers': response.headers,
+        'size': 0,
+        'accept_ranges': False,
+        'etag': response.headers.get('etag'),
+        'last_modified': response.headers.get('last-modified'),
+    }
+    content_range = response.headers.get('content-range', '')
+    if response.status_code == 206 and '/' in content_range:
+        total = content_range.rsplit('/', 1)[-1].strip()
+        if total.isdigit():
+            info['size'] = int(total)
+            info['accept_ranges'] = True
+    else:
+        info['size'] = int(response.headers.get('content-length', 0))
+    return info
+
+
+# Enough for every signature in ARCHIVE_SIGNATURES
+PROBE_BYTES = 16
+
+
+async def probe_download(url, session, headers=None):
+    """
+    Ask for the first bytes to learn size, range support and validators;
+    they are kept in info['head'] for sniff_content. A small range GET
+    works on hosts that reject or mishandle HEAD.
+    """
+    probe_headers = dict(headers or {})
+    probe_headers['Range'] = f'bytes=0-{PROBE_BYTES - 1}'
+    response = None
+    try:
+        response = await session.get(url, stream=True, headers=probe_headers, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        info = _response_info(url, response)
+        info['head'] = b''
+        async for chunk in response.aiter_content():
+            info['head'] = chunk[:PROBE_BYTES]
+            break
+        return info
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Probe failed for {url}: {e}")
+        return None
+    finally:
+        if response is not None:
+            try:
+                await response.aclose()
+            except Exception:
+                pass
+
+
+async def sample_download(url, session, headers=None, sample_bytes=RACE_SAMPLE_BYTES, window=RACE_WINDOW):
+    """
+    Read the first bytes of `url` to measure time-to-first-byte and early
+    throughput. Returns {'info', 'ttfb', 'throughput', 'data'}; raises on
+    HTTP errors. Callers bound stalled hosts with their own timeout.
+    """
+    req_headers = dict(headers or {})
+    req_headers['Range'] = 'bytes=0-'
+    started = time.monotonic()
+    response = await session.get(url, stream=True, headers=req_headers, timeout=DOWNLOAD_TIMEOUT)
+    try:
+        response.raise_for_status()
+        info = _response_info(url, response)
+        data = bytearray()
+        first_byte_at = None
+        async for chunk in response.aiter_content():
+            if not chunk:
+                continue
+            if first_byte_at is None:
+                first_byte_at = time.monotonic()
+                sniff_content(chunk, response.headers.get('content-type'))
+            data += chunk
+            if len(data) >= sample_bytes or time.monotonic() - started >= window:
+                break
+        
+        if first_byte_at is None:
+            raise Exception("Empty response body")
+        elapsed = max(time.monotonic() - first_byte_at, 1e-3)
+        return {
+            'info': info,
+            'ttfb': first_byte_at - started,
+            'throughput': len(data) / elapsed,
+            'data': bytes(data),
+        }
+    finally:
+        try:
+            await response.aclose()
+        except Exception:
+            pass
+
+
+def _preallocate(path, size):
+    with open(path, 'wb') as f:
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError:
+                pass
+        f.truncate(size)
+
+
+def prune_partials(max_age=PARTIAL_MAX_AGE):
+    """
+    Drop abandoned .part files (and sidecars) nobody has resumed in max_age seconds.
+    """
+    if not os.path.isdir(PARTIAL_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(PARTIAL_DIR):
+        path = os.path.join(PARTIAL_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class PartialDownload:
+    """
+    A `.part` file in `directory` (PARTIAL_DIR by default) plus a JSON
+    sidecar recording the URL, validators (ETag/Last-Modified), size and
+    how far each segment got. Keyed by URL, so a retry or a fresh job
+    after a restart picks it up. The directory should be on the same
+    filesystem as the destination, so finish() is a rename, not a copy.
+    """
+
+    _active = set()
+
+    def __init__(self, url, directory=PARTIAL_DIR):
+        key = hashlib.sha1(url.encode()).hexdigest()
+        if key in PartialDownload._active:
+            # Same URL already downloading in this process; don't share the file
+            key = f"{key}_{os.urandom(4).hex()}"
+        self.key = key
+        self.url = url
+        self.directory = directory
+        self.path = os.path.join(directory, key + ".part")
+        self.meta_path = self.path + ".json"
+        self.meta = None
+        PartialDownload._active.add(key)
+
+    def load(self):
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self.path):
+            return None
+        self.meta = meta
+        return meta
+
+    def save(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def matches(self, info):
+        """
+        True if the remote file still looks like the one we started on.
+        """
+        meta = self.meta
+        if not meta or meta.get('url') != self.url:
+            return False
+        if not info['accept_ranges'] or meta.get('size') != info['size']:
+            return False
+        for validator in ('etag', 'last_modified'):
+            if meta.get(validator) and info.get(validator) and meta[validator] != info[validator]:
+                return False
+        return True
+
+    def start(self, info, segments):
+        os.makedirs(self.directory, exist_ok=True)
+        self.meta = {
+            'url': self.url,
+            'size': info['size'],
+            'etag': info.get('etag'),
+            'last_modified': info.get('last_modified'),
+            # [start, end, pos]; end is None when the size is unknown
+            'segments': [[start, end, start] for start, end in segments],
+        }
+        if info['size'] > 0:
+            _preallocate(self.path, info['size'])
+        else:
+            open(self.path, 'wb').close()
+        self.save()
+
+    def bytes_done(self):
+        return sum(pos - start for start, end, pos in self.meta['segments'])
+
+    def finish(self, dest_path):
+        shutil.move(self.path, dest_path)
+        self.discard()
+
+    def discard(self):
+        for path in (self.path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def release(self):
+        PartialDownload._active.discard(self.key)
+
+
+async def _fetch_segment(session, url, partial, index, progress, headers=None):
+    """
+    Fetch one [start, end, pos] segment of a PartialDownload, continuing from pos.
+    """
+    segment = partial.meta['segments'][index]
+    start, end, pos = segment
+    if end is not None and pos > end:
+        return True
+    
+    seg_headers = dict(headers or {})
+    ranged = pos > 0 or len(partial.meta['segments']) > 1
+    if ranged:
+        seg_headers['Range'] = f"bytes={pos}-{'' if end is None else end}"
+    
+    response = None
+    try:
+        response = await session.get(url, stream=True, headers=seg_headers, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        
+        if ranged and response.status_code != 206:
+            if len(partial.meta['segments']) > 1:
+                raise Exception(f"Range request returned {response.status_code}")
+            # Server ignored Range on a single stream: start over from zero
+            print("Server ignored Range, restarting from byte 0...")
+            progress.add(-(pos - start))
+            pos = start
+            with open(partial.path, 'r+b') as f:
+                f.truncate(0)
+        elif ranged:
+            content_range = response.headers.get('content-range', '')
+            if not content_range.startswith(f"bytes {pos}-"):
+                raise Exception(f"Unexpected Content-Range '{content_range}' for offset {pos}")
+        
+        unsaved = 0
+        with open(partial.path, 'r+b') as f:
+            f.seek(pos)
+            async for chunk in response.aiter_content():
+                if not chunk:
+                    continue
+                if pos == 0:
+                    # Abort on an error page at the first chunk, not after the whole body
+                    partial.meta['format'] = sniff_content(chunk, response.headers.get('content-type'))
+                if end is not None:
+                    chunk = chunk[:end + 1 - pos]
+                f.write(chunk)
+                pos += len(chunk)
+                unsaved += len(chunk)
+                progress.add(len(chunk))
+                if unsaved >= SIDECAR_SAVE_INTERVAL:
+                    f.flush()
+                    segment[2] = pos
+                    partial.save()
+                    unsaved = 0
+                if end is not None and pos > end:
+                    break
+        
+        segment[2] = pos
+        if end is None or pos > end:
+            return True
+        raise Exception(f"Segment {start}-{end} ended early at {pos}")
+    finally:
+        segment[2] = pos
+        partial.save()
+        if response is not None:
+            try:
+                await response.aclose()
+            except Exception:
+                pass
+
+
+def initial_segments(info, connections=DOWNLOAD_CONNECTIONS):
+    size = info['size']
+    if connections > 1 and info['accept_ranges'] and size >= SEGMENTED_MIN_SIZE:
+        segments = plan_segments(size, connections)
+        print(f"Segmented download: {len(segments)} connections for {size} bytes")
+        return segments
+    return [(0, size - 1 if info['accept_ranges'] and size > 0 else None)]
+
+
+def seed_partial(url, sample, connections=DOWNLOAD_CONNECTIONS, partial_dir=PARTIAL_DIR):
+    """
+    Store the bytes a race sample already fetched as the start of the
+    resumable .part file in partial_dir, so the winner's download continues
+    after them.
+    """
+    info = sample['info']
+    if not info['accept_ranges'] or info['size'] <= 0:
+        return
+    partial = PartialDownload(url, partial_dir)
+    try:
+        if partial.load() is not None and partial.matches(info):
+            return
+        partial.start(info, initial_segments(info, connections))
+        partial.meta['format'] = sniff_content(sample['data'][:512])
+        segment = partial.meta['segments'][0]
+        data = sample['data'][:segment[1] + 1]
+        with open(partial.path, 'r+b') as f:
+            f.write(data)
+        segment[2] = len(data)
+        partial.save()
+    finally:
+        partial.release()
+
+
+def plan_segments(size, connections):
+    count = max(1, min(connections, size // MIN_SEGMENT_SIZE))
+    step = size // count
+    segments = []
+    for i in range(count):
+        start = i * step
+        end = size - 1 if i == count - 1 else start + step - 1
+        segments.append((start, end))
+    return segments
+
+
+async def _download_partial(session, url, partial, progress, headers=None):
+    """
+    Run every unfinished segment of `partial` in parallel.
+    """
+    tasks = [
+        asyncio.ensure_future(_fetch_segment(session, url, partial, i, progress, headers))
+        for i in range(len(partial.meta['segments']))
+    ]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    # One failed segment stops the rest; their progress is already in the sidecar
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        if task.exception() is not None:
+            raise task.exception()
+    return all(task.result() for task in done)
+
+
+async def download_file_async(url, dest_path, retries=3, progress_callback=None,
+                              impersonate=DEFAULT_IMPERSONATE, headers=None, session=None,
+                              use_remote_name=False, connections=DOWNLOAD_CONNECTIONS,
+                              retry_delay=None, partial_dir=PARTIAL_DIR):
+    """
+    Download `url` into `dest_path` on a pooled AsyncSession.
+
+    Bytes land in a resumable .part file in partial_dir (see PartialDownload;
+    keep it on the filesystem of dest_path); retries and later jobs continue
+    with Range requests, unless the remote ETag, Last-Modified or size changed. Large files on hosts that honour Range are
+    fetched over `connections` parallel segments, everything else over a
+    single stream. With use_remote_name=True, the filename from
+    Content-Disposition (if any) replaces the basename of dest_path.
+    retry_delay(attempt) -> seconds overrides the flat 2 s pause between
+    attempts. Returns the saved path, or None.
+    """
+    print(f"Downloading {url}...")
+    session = session or get_session(url, impersonate)
+    prune_partials()
+    partial = PartialDownload(url, partial_dir)
+
+    try:
+        for attempt in range(retries):
+            try:
+                info = await probe_download(url, session, headers)
+                if info is None:
+                    raise Exception("Could not reach download URL.")
+                content_type = info['headers'].get('content-type', '').lower()
+                if 'text/html' in content_type or 'application/json' in content_type:
+                    raise BadContentError(f"Got error page instead of archive ({content_type})")
+                save_path = _resolve_save_path(dest_path, info['headers'], use_remote_name)
+                
+                if partial.load() is not None:
+                    if partial.matches(info):
+                        print(f"Resuming download at {partial.bytes_done()} bytes")
+                    else:
+                        print("Remote file changed or not resumable, restarting download...")
+                        partial.discard()
+                        partial.meta = None
+                
+                if partial.meta is None:
+                    partial.start(info, initial_segments(info, connections))
+                
+                progress = _AggregateProgress(info['size'], progress_callback, partial.bytes_done())
+                if await _download_partial(session, info['url'], partial, progress, headers):
+                    partial.finish(save_path)
+                    return save_path
+            except asyncio.CancelledError:
+                raise
+            except BadContentError:
+                partial.discard()
+                raise
+            except Exception as e:
+                print(f"Download attempt {attempt+1} failed: {e}")
+                await asyncio.sleep(retry_delay(attempt) if retry_delay else 2)
+        return None
+    finally:
+        partial.release()
+
+
+async def _to_sink(call):
+    try:
+        return await call
+    except Exception as e:
+        raise SinkError(e) from e
+
+
+async def stream_download(url, open_sink, session=None, impersonate=DEFAULT_IMPERSONATE,
+                          headers=None, progress_callback=None, prefix=b'', hasher=None):
+    """
+    Stream `url` straight into an extractor instead of a file.
+    open_sink(archive_format) is called once the first chunk has been
+    sniffed and returns an object with async write(chunk), close() and
+    abort(); it may raise ziptools.StreamingUnsupported. `prefix` holds bytes
+    already fetched (e.g. by a race sample); the rest is requested with Range.
+    Every byte is also fed to `hasher` (e.g. hashlib.sha256()) if given.
+    Errors of the sink are raised as SinkError, so the caller can tell them
+    from a failing host.
+    Returns (bytes_streamed, archive_format, response_headers).
+    """
+    print(f"Streaming {url}...")
+    session = session or get_session(url, impersonate)
+    req_headers = dict(headers or {})
+    if prefix:
+        req_headers['Range'] = f'bytes={len(prefix)}-'
+    
+    response = await session.get(url, stream=True, headers=req_headers, timeout=DOWNLOAD_TIMEOUT)
+    sink = None
+    try:
+        response.raise_for_status()
+        if prefix and response.status_code != 206:
+            # Full body came back; the prefix would be duplicated
+            prefix = b''
+        content_type = response.headers.get('content-type')
+        total_size = int(response.headers.get('content-length', 0))
+        total_size = total_size + len(prefix) if total_size else 0
+        done = 0
+        archive_format = None
+        
+        async for chunk in response.aiter_content():
+            if not chunk:
+                continue
+            if sink is None:
+                archive_format = sniff_content((prefix or chunk)[:512], content_type)
+                try:
+                    sink = open_sink(archive_format)
+                except Exception as e:
+                    raise SinkError(e) from e
+                if prefix:
+                    if hasher:
+                        hasher.update(prefix)
+                    await _to_sink(sink.write(prefix))
+                    done += len(prefix)
+            if hasher:
+                hasher.update(chunk)
+            await _to_sink(sink.write(chunk))
+            done += len(chunk)
+            if progress_callback and total_size > 0:
+                progress_callback(done, total_size)
+        
+        if sink is None:
+            raise Exception("Empty response body")
+        await _to_sink(sink.close())
+        return done, archive_format, response.headers
+    except BaseException:
+        if sink is not None:
+            await sink.abort()
+        raise
+    finally:
+        try:
+            await response.aclose()
+        except Exception:
+            pass
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from config import PIPELINE_DOWNLOADS, PIPELINE_PROCESSING, PIPELINE_UPLOADS
+
+
+class Stage:
+    """
+    One step of processing (download, extract/repack, upload) with its own
+    concurrency. A job holds a stage only while it is in it, so while one
+    job repacks the next can download and the previous one upload. Jobs
+    waiting for a stage are served in arrival order. A limit of 0 only
+    counts the jobs in the stage.
+    """
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = max(0, limit)
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # Created lazily so it binds to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._semaphore
+
+    async def __aenter__(self):
+        if self.limit:
+            self.waiting += 1
+            if self.semaphore.locked():
+                logging.info(f"Waiting for {self.name} stage ({self.active} active, {self.waiting} waiting)")
+            try:
+                await self.semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.active -= 1
+        if self.limit:
+            self.semaphore.release()
+
+    def __str__(self):
+        if not self.limit:
+            return f"{self.name}: {self.active} active"
+        return f"{self.name}: {self.active}/{self.limit} active, {self.waiting} waiting"
+
+
+class Pipeline:
+    """
+    The stages a job goes through. Auto-posts share post_pipeline, whose
+    limits make a burst of posts overlap; links sent by users go through
+    user_pipeline, which only counts them, so one user's large extraction
+    never holds up another user's link (the job queue and admission
+    control still bound them).
+    """
+
+    def __init__(self, name, downloads=0, processing=0, uploads=0):
+        self.name = name
+        self.download = Stage("download", downloads)
+        self.process = Stage("process", processing)
+        self.upload = Stage("upload", uploads)
+        self.stages = (self.download, self.process, self.upload)
+
+
+post_pipeline = Pipeline("auto-post", PIPELINE_DOWNLOADS, PIPELINE_PROCESSING, PIPELINE_UPLOADS)
+user_pipeline = Pipeline("user")
+PIPELINES = (post_pipeline, user_pipeline)
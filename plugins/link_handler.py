@@ -1,12 +1,13 @@
 import re
-import asyncio
 import time
 import logging
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from database import file_store
 from utils import process_and_post_to_channel
-from processor import search_codelist
+from jobqueue import QueueFull
+from cancel import Cancelled
+from processor import search_codelist_async
 from config import CHANNEL_ID
 
 # Rate Limiting Configuration
@@ -76,17 +77,15 @@ async def handle_codecanyon_link(client: Client, message: Message):
 
     try:
         # 3. Search Codelist.cc for the item
-        loop = asyncio.get_running_loop()
-        
         # Strategy 1: Search with full extracted name
-        codelist_url = await loop.run_in_executor(None, search_codelist, item_name)
+        codelist_url = await search_codelist_async(item_name)
         
         # Strategy 2: Search with Brand Name (First word) if full search fails
         if not codelist_url and item_name:
             brand_name = item_name.split()[0]
             if len(brand_name) > 3: # Only if brand name is significant
                 await status_msg.edit_text(f"🔎 Checking database for: **{brand_name}**...")
-                codelist_url = await loop.run_in_executor(None, search_codelist, brand_name)
+                codelist_url = await search_codelist_async(brand_name)
         
         if not codelist_url:
             await status_msg.edit_text("❌ **Item not found in our sources.**\n\nWe will add it to our request list.")
@@ -112,7 +111,16 @@ async def handle_codecanyon_link(client: Client, message: Message):
             # Initiate Upload Process
             # We pass the Codelist URL to the processor
             me = await client.get_me()
-            post_msg = await process_and_post_to_channel(client, codelist_url, me.username)
+            try:
+                post_msg = await process_and_post_to_channel(
+                    client, codelist_url, me.username, status_msg=status_msg, user_id=message.from_user.id
+                )
+            except QueueFull as e:
+                await status_msg.edit_text(f"⏳ {e}")
+                return
+            except Cancelled:
+                # /cancel already updated the status message (or it was deleted)
+                return
             
             if post_msg:
                 # Mark as processed in DB to prevent duplicate uploads
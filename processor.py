@@ -1,77 +1,105 @@
 import os
-import requests
 import zipfile
 import shutil
 from bs4 import BeautifulSoup
 import time
 import subprocess
+import tempfile
 import rarfile
 import re
 from PIL import Image
 import io
+import asyncio
+import threading
+import hashlib
+from concurrent.futures.process import BrokenProcessPool
 from curl_cffi import requests
+from net import get_session, fetch, fetch_text, download_file_async, probe_download, sample_download, seed_partial, sniff_content, sniff_file, stream_download, remote_filename, BadContentError, SinkError
+from config import MIRROR_RACING, RACE_TIMEOUT, RACE_GRACE, STREAM_EXTRACT, REPACK_WORKERS, REPACK_MEMORY_BUDGET, COMPRESSION_PROFILE, SPLIT_VOLUME_SIZE, PARTIAL_DIR
+from ziptools import rewrite_zip, write_tree, precompress, StreamingUnsupported, VolumeWriter, volume_paths
+from health import host_health
+from hosts import HOST_ADAPTERS, get_adapter, adapter_for_url, parse_direct_link
+from rules import clean_rules
+from workspace import workspace, estimate_footprint
+from admission import admission
+from quotas import extraction_quota, written_bytes, QuotaExceeded, WATCH_INTERVAL
+from dedup import Duplicate, file_sha256
+from pipeline import user_pipeline
+from executors import executors
+from cancel import CancelToken, Cancelled
 
-def search_codelist(query):
+# Codelist categories whose pages are posts
+POST_CATEGORIES = ('/scripts3/', '/plugins3/', '/apps3/', '/mobile/', '/templates/')
+
+def parse_post_links(html):
     """
-    Search codelist.cc for a query and return the first result URL.
-    Uses DLE search endpoint (POST).
+    Post URLs on a codelist listing page, in page order, without duplicates.
     """
-    search_url = "https://codelist.cc/index.php?do=search"
-    params = {
-        "subaction": "search",
-        "story": query
-    }
-    
-    try:
-        # Use POST for DLE search
-        r = requests.post(search_url, data=params, impersonate="chrome120", timeout=30)
-        if r.status_code != 200:
-            return None
-        
-        soup = BeautifulSoup(r.text, 'html.parser')
-        
-        # 1. Look for articles with the new structure
-        # <h3 class="post__title"> <a href="...">Title</a> </h3>
-        
-        results = []
+    soup = BeautifulSoup(html, 'html.parser')
+    links = []
+    for a in soup.find_all('a', href=True):
+        # Clean URL (remove anchor/query)
+        href = a['href'].split('#')[0].split('?')[0]
         
-        # Method A: Standard Search Results
-        for article in soup.find_all('article'):
-            title_h3 = article.find('h3', class_='post__title')
-            if title_h3:
-                a_tag = title_h3.find('a', href=True)
-                if a_tag:
-                    results.append((a_tag.get_text(strip=True), a_tag['href']))
+        # Filter for valid content posts
+        is_content = False
+        if '.html' in href:
+            if any(cat in href for cat in POST_CATEGORIES):
+                is_content = True
+            # Fallback: if it's from main site and looks like a post (has numeric ID)
+            elif 'codelist.cc' in href and re.search(r'/\d+-', href):
+                is_content = True
         
-        # Method B: Fallback (older themes or different views)
-        if not results:
-            for h2 in soup.find_all('h2', class_='post-titleEntry'):
-                a_tag = h2.find('a', href=True)
-                if a_tag:
-                    results.append((a_tag.get_text(strip=True), a_tag['href']))
-        
-        # Filter results for relevance
-        # If we have results, check if they actually contain the query keywords
-        # This prevents returning "Latest Posts" when search yields nothing
-        
-        query_words = query.lower().split()
-        # Use first few meaningful words for strict checking
-        # e.g. "Wowy - Multi-language" -> check for "wowy"
-        key_word = query_words[0] if query_words else ""
-        
-        for title, url in results:
-            if key_word in title.lower():
-                return url
-                
-        # If no strict match, but we have results and the query was long, 
-        # maybe return the first one if it shares *some* words?
-        # For now, let's be strict to avoid bad matches.
-        
-        return None
+        if is_content and href not in links:
+            links.append(href)
+    return links
 
-    except Exception as e:
-        print(f"Search error: {e}")
-        return None
+def parse_search_results(html, query):
+    """
+    Pick the first relevant post URL out of a DLE search results page.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # 1. Look for articles with the new structure
+    # <h3 class="post__title"> <a href="...">Title</a> </h3>
+    
+    results = []
+    
+    # Method A: Standard Search Results
+    for article in soup.find_all('article'):
+        title_h3 = article.find('h3', class_='post__title')
+        if title_h3:
+            a_tag = title_h3.find('a', href=True)
+            if a_tag:
+                results.append((a_tag.get_text(strip=True), a_tag['href']))
+    
+    # Method B: Fallback (older themes or different views)
+    if not results:
+        for h2 in soup.find_all('h2', class_='post-titleEntry'):
+            a_tag = h2.find('a', href=True)
+            if a_tag:
+                results.append((a_tag.get_text(strip=True), a_tag['href']))
+    
+    # Filter results for relevance
+    # If we have results, check if they actually contain the query keywords
+    # This prevents returning "Latest Posts" when search yields nothing
+    
+    query_words = query.lower().split()
+    # Use first few meaningful words for strict checking
+    # e.g. "Wowy - Multi-language" -> check for "wowy"
+    key_word = query_words[0] if query_words else ""
+    
+    for title, url in results:
+        if key_word in title.lower():
+            return url
+            
+    # If no strict match, but we have results and the query was long, 
+    # maybe return the first one if it shares *some* words?
+    # For now, let's be strict to avoid bad matches.
+    
+    return None
+
+SEARCH_URL = "https://codelist.cc/index.php?do=search"
 
 # Configuration
 TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tools")
@@ -134,13 +162,6 @@ def setup_tools():
         print("Failed to bootstrap 7-Zip.")
         return None
 
-# Helper to create a robust scraper
-def get_scraper_session():
-    # curl_cffi requests doesn't need a session for simple gets, but we can use one
-    # to maintain headers/cookies if needed. For now we can just use requests directly
-    # with impersonate parameter.
-    return requests.Session()
-
 def download_file(url, dest_path, retries=3, progress_callback=None):
     print(f"Downloading {url}...")
     for attempt in range(retries):
@@ -165,186 +186,104 @@ def download_file(url, dest_path, retries=3, progress_callback=None):
             time.sleep(2)
     return False
 
-def get_direct_link(url):
-    try:
-        response = requests.get(url, impersonate="chrome")
-        soup = BeautifulSoup(response.text, 'html.parser')
-        for a in soup.find_all('a', href=True):
-            if '/download/' in a['href']:
-                return a['href']
-    except Exception as e:
-        print(f"Error fetching page: {e}")
-    return None
+# Retry with different impersonations if first attempt fails
+IMAGE_IMPERSONATIONS = ["chrome", "chrome120", "safari15_3", "okhttp"]
+
+def image_request_headers(referer=None):
+    # Add Referer to pass hotlink protection
+    # Do NOT set User-Agent manually when using impersonate, it causes conflicts/blocks
+    return {
+        "Referer": referer if referer else "https://codelist.cc/",
+        "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Sec-Fetch-Dest": "image",
+        "Sec-Fetch-Mode": "no-cors",
+        "Sec-Fetch-Site": "same-origin"
+    }
+
+def curl_image_command(img_url, save_path, referer=None):
+    return [
+        "curl", "-L",
+        "-H", "User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "-H", f"Referer: {referer if referer else 'https://codelist.cc/'}",
+        "--connect-timeout", "15",
+        "--max-time", "30",
+        "--output", save_path,
+        img_url
+    ]
 
-def process_and_save_image(img_url, work_dir, session=None, referer=None):
+def load_cover_image(data):
+    """
+    Open and verify raw image bytes. Returns a PIL image or None.
+    """
     try:
-        if not work_dir:
-            return None
-            
-        print(f"Processing image: {img_url}")
-        
-        # Add Referer to pass hotlink protection
-        # Do NOT set User-Agent manually when using impersonate, it causes conflicts/blocks
-        headers = {
-            "Referer": referer if referer else "https://codelist.cc/",
-            "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Sec-Fetch-Dest": "image",
-            "Sec-Fetch-Mode": "no-cors",
-            "Sec-Fetch-Site": "same-origin"
-        }
-
-        print(f"Downloading image using curl_cffi impersonate...")
+        img = Image.open(io.BytesIO(data))
+        img.verify() # Verify it's actually an image
+        return Image.open(io.BytesIO(data)) # Re-open after verify
+    except Exception:
+        print(f"Invalid image content received. First 200 bytes: {data[:200]}")
+        return None
+
+def prepare_cover_image(img, work_dir):
+    """
+    Filter out small images, crop the watermark strip and save as JPEG in work_dir.
+    """
+    width, height = img.size
+    
+    # Filter small images (icons, logos)
+    # Relaxed logic to allow banners that might be short in height
+    if width < 250 or height < 150:
+        print(f"Skipping small image ({width}x{height})")
+        return None
         
-        # Retry with different impersonations if first attempt fails
-        impersonations = ["chrome", "chrome120", "safari15_3", "okhttp"]
+    # Crop bottom part (watermark)
+    # Only crop if image is reasonably tall to avoid destroying it
+    # Increased crop pixels to ensure logo removal (Aggressive mode)
+    
+    # Standard Codelist watermark area seems to be around 60-80px but can be larger
+    if height > 500:
+        crop_pixels = 110
+    elif height > 400:
+        crop_pixels = 90
+    elif height >= 300: 
+        crop_pixels = 70
+    else:
+        # Smaller crop for smaller images
+        crop_pixels = 65
+         
+    if height > (crop_pixels + 50): # Ensure we have enough image left
+        new_height = height - crop_pixels
+        img = img.crop((0, 0, width, new_height))
+        print(f"Cropped {crop_pixels}px from bottom. New size: {width}x{new_height}")
+    
+    # Save to work_dir
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
         
-        success = False
-        for imp in impersonations:
-            try:
-                print(f"Attempting download with impersonate='{imp}'...")
-                if session:
-                    # Update session headers temporarily
-                    response = session.get(img_url, stream=True, timeout=15, headers=headers, impersonate=imp)
-                else:
-                     response = requests.get(img_url, stream=True, timeout=15, impersonate=imp, headers=headers)
-                
-                if response.status_code == 200:
-                    # Check content type
-                    content_type = response.headers.get('Content-Type', '').lower()
-                    if 'image' in content_type:
-                        # Verify we actually have content
-                        if response.content and len(response.content) > 0:
-                            success = True
-                            break # Success!
-                        else:
-                            print("Got empty body despite 200 OK, retrying...")
-                    else:
-                        print(f"Got {content_type} instead of image, retrying...")
-                else:
-                    print(f"Status code {response.status_code}, retrying...")
-                
-            except Exception as e:
-                print(f"Attempt failed: {e}")
-                time.sleep(1)
+    filename = f"cover_{int(time.time())}.jpg"
+    save_path = os.path.join(work_dir, filename)
+    
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
         
-        if not success:
-            print("Python download attempts failed. Trying fallback to system curl...")
-            try:
-                # Fallback to system curl
-                if not os.path.exists(work_dir):
-                    os.makedirs(work_dir)
-                
-                filename = f"cover_{int(time.time())}.jpg"
-                save_path = os.path.join(work_dir, filename)
-                
-                cmd = [
-                    "curl", "-L",
-                    "-H", "User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    "-H", f"Referer: {referer if referer else 'https://codelist.cc/'}",
-                    "--connect-timeout", "15",
-                    "--max-time", "30",
-                    "--output", save_path,
-                    img_url
-                ]
-                
-                print(f"Running curl: {' '.join(cmd)}")
-                subprocess.run(cmd, check=True, capture_output=True)
-                
-                if os.path.exists(save_path) and os.path.getsize(save_path) > 1000:
-                    print("Curl download successful!")
-                    # Verify it's an image
-                    try:
-                        img = Image.open(save_path)
-                        img.verify() # Check integrity
-                        img = Image.open(save_path) # Reopen for processing
-                        
-                        # Use this image for the rest of processing
-                        success = True
-                    except Exception as e:
-                        print(f"Curl downloaded file is not a valid image: {e}")
-                        os.remove(save_path)
-                        return None
-                else:
-                    print("Curl failed or file too small.")
-                    return None
-                    
-            except Exception as e:
-                print(f"Curl fallback failed: {e}")
-                return None
+    img.save(save_path, "JPEG", quality=90)
+    return save_path
 
-        if not success:
-             print("All download attempts failed.")
-             return None
-             
-        if 'img' not in locals():
-            response.raise_for_status()
-            
-            # Debug info
-            content_type = response.headers.get('Content-Type', '')
-            
-            # Strict check: If it's definitely text/html, reject it.
-            if 'text' in content_type.lower() or 'html' in content_type.lower():
-                print(f"Warning: URL returned {content_type} instead of image. First 200 bytes: {response.content[:200]}")
-                return None
-                
-            try:
-                img = Image.open(io.BytesIO(response.content))
-                img.verify() # Verify it's actually an image
-                img = Image.open(io.BytesIO(response.content)) # Re-open after verify
-            except Exception as img_e:
-                 print(f"Invalid image content received. First 200 bytes: {response.content[:200]}")
-                 return None
-
-        width, height = img.size
-        
-        # Filter small images (icons, logos)
-        # Relaxed logic to allow banners that might be short in height
-        if width < 250 or height < 150:
-            print(f"Skipping small image ({width}x{height})")
+def save_cover_image(data, work_dir):
+    """
+    Bytes-in, path-out wrapper around load/prepare, safe to run in an executor.
+    """
+    try:
+        img = load_cover_image(data)
+        if img is None:
             return None
-            
-        # Crop bottom part (watermark)
-        # Only crop if image is reasonably tall to avoid destroying it
-        # Increased crop pixels to ensure logo removal (Aggressive mode)
-        
-        # Standard Codelist watermark area seems to be around 60-80px but can be larger
-        if height > 500:
-            crop_pixels = 110
-        elif height > 400:
-            crop_pixels = 90
-        elif height >= 300: 
-            crop_pixels = 70
-        else:
-            # Smaller crop for smaller images
-            crop_pixels = 65
-             
-        if height > (crop_pixels + 50): # Ensure we have enough image left
-            new_height = height - crop_pixels
-            img = img.crop((0, 0, width, new_height))
-            print(f"Cropped {crop_pixels}px from bottom. New size: {width}x{new_height}")
-        
-        # Save to work_dir
-        if not os.path.exists(work_dir):
-            os.makedirs(work_dir)
-            
-        filename = f"cover_{int(time.time())}.jpg"
-        save_path = os.path.join(work_dir, filename)
-        
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-            
-        img.save(save_path, "JPEG", quality=90)
-        return save_path
-        
+        return prepare_cover_image(img, work_dir)
     except Exception as e:
         print(f"Failed to process image: {e}")
         return None
 
-def extract_metadata_from_codelist(url, work_dir=None):
-    print(f"Scraping metadata from {url}...")
-    
-    metadata = {
+def empty_metadata():
+    return {
         'title': None,
         'image_url': None,
         'image_path': None,
@@ -355,376 +294,486 @@ def extract_metadata_from_codelist(url, work_dir=None):
         'pixeldrain_url': None,
         'description': None
     }
+
+def parse_codelist_page(html):
+    """
+    Parse a codelist.cc post page.
+    Returns (metadata, codelist_images). metadata['image_url'] holds the og:image
+    (if any); image_path is left for the caller to fill in.
+    """
+    metadata = empty_metadata()
+    soup = BeautifulSoup(html, 'html.parser')
     
-    # Use a session to persist cookies/clearance
-    session = requests.Session()
+    # 1. Extract Title
+    title_tag = soup.find('h1', class_='entry-title')
+    if title_tag:
+        metadata['title'] = title_tag.get_text(strip=True)
+        
+    # 1a. Extract Description
+    # Heuristic: Text before "Demo:"
+    full_text = soup.get_text(separator=' ', strip=True)
+    if "Demo:" in full_text:
+         parts = full_text.split("Demo:")
+         if len(parts) > 0:
+             raw_desc = parts[0].strip()
+             # Remove metadata (usually ends with "views")
+             if "views" in raw_desc:
+                 raw_desc = raw_desc.split("views")[-1].strip()
+             # Clean up any "By admin..." artifacts if "views" wasn't found or didn't catch it
+             elif "By admin" in raw_desc:
+                 raw_desc = raw_desc.split("By admin")[-1].strip()
+                 
+             # Take the last logical chunk if it's too long
+             if len(raw_desc) > 1000:
+                 raw_desc = raw_desc[-1000:]
+             
+             metadata['description'] = raw_desc
+
+    # 1b. og:image from Codelist (often the main post image)
+    og_image = soup.find('meta', property='og:image')
+    if og_image and og_image.get('content'):
+        metadata['image_url'] = og_image['content']
+        
+    # Collect images from codelist.cc as fallback
+    codelist_images = []
+    for img in soup.find_all('img', src=True):
+        src = img['src'].strip()
+        # Clean up URL if it has spaces or newlines
+        if src:
+            codelist_images.append(src)
+        
+    # 2. Extract mirror links (one per registered host adapter)
+    for adapter in HOST_ADAPTERS.values():
+        metadata[adapter.metadata_key] = adapter.find_link(html, soup)
+
+    # 3. Extract Demo link (Generic)
+    # Look for "Demo:" text and the following link
+    demo_url = None
     
-    try:
-        response = session.get(url, impersonate="chrome")
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
+    # Method A: Specific CodeCanyon check (Legacy, but robust for CC)
+    for a in soup.find_all('a', href=True):
+        if 'codecanyon.net/item' in a['href']:
+            demo_url = a['href']
+            break
+    
+    # Method B: Generic "Demo:" finder if not found
+    if not demo_url:
+        # Look for text node containing "Demo:"
+        # We search in the entry-content to avoid sidebar noise
+        content_div = soup.find('div', class_='entry-content') or soup
         
-        # 1. Extract Title
-        title_tag = soup.find('h1', class_='entry-title')
-        if title_tag:
-            metadata['title'] = title_tag.get_text(strip=True)
+        # 1. Search for "Demo:" text node
+        demo_text_node = content_div.find(string=lambda t: 'Demo:' in t if t else False)
+        if demo_text_node:
+            # Check siblings for the first link
+            # Sometimes it's immediate sibling, sometimes separated by whitespace
             
-        # 1a. Extract Description
-        # Heuristic: Text before "Demo:"
-        full_text = soup.get_text(separator=' ', strip=True)
-        if "Demo:" in full_text:
-             parts = full_text.split("Demo:")
-             if len(parts) > 0:
-                 raw_desc = parts[0].strip()
-                 # Remove metadata (usually ends with "views")
-                 if "views" in raw_desc:
-                     raw_desc = raw_desc.split("views")[-1].strip()
-                 # Clean up any "By admin..." artifacts if "views" wasn't found or didn't catch it
-                 elif "By admin" in raw_desc:
-                     raw_desc = raw_desc.split("By admin")[-1].strip()
-                     
-                 # Take the last logical chunk if it's too long
-                 if len(raw_desc) > 1000:
-                     raw_desc = raw_desc[-1000:]
-                 
-                 metadata['description'] = raw_desc
-
-        # 1b. Try to get og:image from Codelist first (often the main post image)
-        og_image = soup.find('meta', property='og:image')
-        if og_image and og_image.get('content'):
-            img_url = og_image['content']
-            metadata['image_url'] = img_url # Set URL immediately as fallback
-            if work_dir:
-                 print(f"Found og:image: {img_url}, processing...")
-                 local_path = process_and_save_image(img_url, work_dir, session, referer=url)
-                 if local_path:
-                     metadata['image_path'] = local_path
+            # Check next element (<a> tag)
+            next_el = demo_text_node.next_element
+            while next_el and next_el.name != 'a':
+                next_el = next_el.next_element
+                # Safety break if we go too far
+                if next_el and next_el.name in ['br', 'div', 'p']:
+                    break
             
-        # Collect images from codelist.cc as fallback
-        codelist_images = []
-        for img in soup.find_all('img', src=True):
-            src = img['src'].strip()
-            # Clean up URL if it has spaces or newlines
-            if src:
-                codelist_images.append(src)
+            if next_el and next_el.name == 'a' and next_el.get('href'):
+                demo_url = next_el.get('href')
             
-        # 2. Extract upload.ee link
-        matches = re.findall(r'(https?://www\.upload\.ee/files/[^\s"<]+)', response.text)
-        if matches:
-            metadata['upload_ee_url'] = matches[0]
-        else:
-             for a in soup.find_all('a', href=True):
-                if 'upload.ee' in a['href']:
-                    metadata['upload_ee_url'] = a['href']
+            # If that failed, check parent's links (e.g. <span>Demo: <a...></span>)
+            if not demo_url and demo_text_node.parent:
+                for a in demo_text_node.parent.find_all('a', href=True):
+                    demo_url = a.get('href')
                     break
 
-        # 2b. Extract Krakenfiles link
-        matches_kf = re.findall(r'(https?://krakenfiles\.com/view/[^\s"<]+)', response.text)
-        if matches_kf:
-            metadata['krakenfiles_url'] = matches_kf[0]
-        else:
-             for a in soup.find_all('a', href=True):
-                if 'krakenfiles.com' in a['href']:
-                    metadata['krakenfiles_url'] = a['href']
-                    break
+    if demo_url:
+        print(f"Found Demo URL: {demo_url}")
+        # Ensure domain is codecanyon.net if it's a lolinez wrapper
+        if 'www.lolinez.com' in demo_url:
+             # Extract the real URL after the query parameter if possible
+             parts = demo_url.split('?')
+             if len(parts) > 1:
+                 # It might be codecanyon or ANY other site now
+                 demo_url = parts[-1]
+        
+        metadata['demo_url'] = demo_url
 
-        # 2c. Extract Workupload link
-        matches_wu = re.findall(r'(https?://workupload\.com/file/[^\s"<]+)', response.text)
-        if matches_wu:
-            metadata['workupload_url'] = matches_wu[0]
-        else:
-             for a in soup.find_all('a', href=True):
-                if 'workupload.com/file/' in a['href']:
-                    metadata['workupload_url'] = a['href']
-                    break
-                    
-        # 2d. Extract Pixeldrain link
-        matches_pd = re.findall(r'(https?://pixeldrain\.com/u/[^\s"<]+)', response.text)
-        if matches_pd:
-            metadata['pixeldrain_url'] = matches_pd[0]
-        else:
-             for a in soup.find_all('a', href=True):
-                if 'pixeldrain.com/u/' in a['href']:
-                    metadata['pixeldrain_url'] = a['href']
-                    break
+    return metadata, codelist_images
+
+# Headers for CodeCanyon
+CODECANYON_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9"
+}
 
-        # 3. Extract Demo link (Generic)
-        # Look for "Demo:" text and the following link
-        demo_url = None
+def parse_codecanyon_images(html):
+    """
+    Return de-duplicated preview image candidates from a CodeCanyon item page.
+    """
+    cc_soup = BeautifulSoup(html, 'html.parser')
+    candidates = []
+
+    # 1. Open Graph Image (Most reliable)
+    og_image = cc_soup.find('meta', property='og:image')
+    if og_image:
+        candidates.append(og_image['content'])
+
+    # 2. Look for specific Envato image classes
+    header_img = cc_soup.find('img', class_='item-header__image')
+    if header_img and header_img.get('src'):
+         candidates.append(header_img['src'])
+    
+    # 3. Scan all images for envatousercontent
+    for img in cc_soup.find_all('img', src=True):
+         src = img['src']
+         if 'envatousercontent.com' in src:
+             # Exclude obviously small icons if possible by name
+             if 'avatar' not in src and 'icon' not in src:
+                candidates.append(src)
+    
+    # Remove duplicates while preserving order
+    unique_candidates = []
+    for c in candidates:
+        if c not in unique_candidates:
+            unique_candidates.append(c)
+    
+    print(f"Found {len(unique_candidates)} image candidates on CodeCanyon.")
+    return unique_candidates
+
+def codelist_image_candidates(codelist_images):
+    """
+    Normalise codelist.cc <img> sources and keep the ones that look like post images.
+    """
+    candidates = []
+    for img_src in codelist_images:
         
-        # Method A: Specific CodeCanyon check (Legacy, but robust for CC)
-        for a in soup.find_all('a', href=True):
-            if 'codecanyon.net/item' in a['href']:
-                demo_url = a['href']
-                break
+        # Handle relative URLs
+        if img_src.startswith('/'):
+            img_src = "https://codelist.cc" + img_src
         
-        # Method B: Generic "Demo:" finder if not found
-        if not demo_url:
-            # Look for text node containing "Demo:"
-            # We search in the entry-content to avoid sidebar noise
-            content_div = soup.find('div', class_='entry-content') or soup
-            
-            # 1. Search for "Demo:" text node
-            demo_text_node = content_div.find(string=lambda t: 'Demo:' in t if t else False)
-            if demo_text_node:
-                # Check siblings for the first link
-                # Sometimes it's immediate sibling, sometimes separated by whitespace
-                
-                # Check next element (<a> tag)
-                next_el = demo_text_node.next_element
-                while next_el and next_el.name != 'a':
-                    next_el = next_el.next_element
-                    # Safety break if we go too far
-                    if next_el and next_el.name in ['br', 'div', 'p']:
-                        break
-                
-                if next_el and next_el.name == 'a' and next_el.get('href'):
-                    demo_url = next_el.get('href')
-                
-                # If that failed, check parent's links (e.g. <span>Demo: <a...></span>)
-                if not demo_url and demo_text_node.parent:
-                    for a in demo_text_node.parent.find_all('a', href=True):
-                        demo_url = a.get('href')
-                        break
+        # Clean URL: remove any accidental concatenation or whitespace
+        img_src = img_src.split()[0]  # Take first part if spaces exist
+        img_src = img_src.strip()
 
-        if demo_url:
-            print(f"Found Demo URL: {demo_url}")
-            # Ensure domain is codecanyon.net if it's a lolinez wrapper
-            if 'www.lolinez.com' in demo_url:
-                 # Extract the real URL after the query parameter if possible
-                 parts = demo_url.split('?')
-                 if len(parts) > 1:
-                     # It might be codecanyon or ANY other site now
-                     demo_url = parts[-1]
-            
-            metadata['demo_url'] = demo_url
-            
-            # Scrape CodeCanyon for image ONLY if it is actually CodeCanyon
-            if 'codecanyon.net' in demo_url:
-                codecanyon_url = demo_url # Alias for CC scraping
-                try:
-                # Add headers for CodeCanyon
-                # ... existing CodeCanyon scraping logic ...
-                    cc_headers = {
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8",
-                        "Accept-Language": "en-US,en;q=0.9"
-                    }
-                    cc_response = requests.get(codecanyon_url, impersonate="chrome120", headers=cc_headers)
-                    cc_soup = BeautifulSoup(cc_response.text, 'html.parser')
-            
-                    candidates = []
-
-                    # 1. Open Graph Image (Most reliable)
-                    og_image = cc_soup.find('meta', property='og:image')
-                    if og_image:
-                        candidates.append(og_image['content'])
-
-                    # 2. Look for specific Envato image classes
-                    header_img = cc_soup.find('img', class_='item-header__image')
-                    if header_img and header_img.get('src'):
-                         candidates.append(header_img['src'])
-                    
-                    # 3. Scan all images for envatousercontent
-                    for img in cc_soup.find_all('img', src=True):
-                         src = img['src']
-                         if 'envatousercontent.com' in src:
-                             # Exclude obviously small icons if possible by name
-                             if 'avatar' not in src and 'icon' not in src:
-                                candidates.append(src)
-                    
-                    # Remove duplicates while preserving order
-                    unique_candidates = []
-                    for c in candidates:
-                        if c not in unique_candidates:
-                            unique_candidates.append(c)
-                    
-                    candidates = unique_candidates
-                    print(f"Found {len(candidates)} image candidates on CodeCanyon.")
-                    
-                    # Try candidates
-                    for img_url in candidates:
-                         if work_dir:
-                             print(f"Processing candidate: {img_url}")
-                             local_path = process_and_save_image(img_url, work_dir, session=None, referer=codecanyon_url)
-                             if local_path:
-                                 metadata['image_path'] = local_path
-                                 metadata['image_url'] = img_url
-                                 print(f"Success with CodeCanyon image: {local_path}")
-                                 break
-                         else:
-                             metadata['image_url'] = img_url
-                             break
-
-                except Exception as e:
-                    print(f"Error scraping CodeCanyon: {e}")
-
-        # Fallback to codelist image if we don't have a valid processed image
-        if not metadata['image_path']:
-            print("Trying fallback to Codelist images...")
-            for img_src in codelist_images:
-                
-                # Handle relative URLs
-                if img_src.startswith('/'):
-                    img_src = "https://codelist.cc" + img_src
-                
-                # Clean URL: remove any accidental concatenation or whitespace
-                img_src = img_src.split()[0]  # Take first part if spaces exist
-                img_src = img_src.strip()
-
-                # Look for the main post image, usually ends with .jpg or .png and is not a small icon
-                # Codelist usually puts the main image in the post body
-                if 'wp-content/uploads' in img_src or '/uploads/posts/' in img_src:
-                    if work_dir:
-                        local_path = process_and_save_image(img_src, work_dir, session, referer=url)
-                        if local_path:
-                            metadata['image_path'] = local_path
-                            metadata['image_url'] = img_src # Ensure we have the URL too
-                            print(f"Using processed Codelist image: {local_path}")
-                            break
-                    else:
-                        metadata['image_url'] = img_src
-                        print(f"Using Codelist image: {img_src}")
-                        break
-                
-    except Exception as e:
-        print(f"Error scraping codelist: {e}")
-        
-    return metadata
+        # Look for the main post image, usually ends with .jpg or .png and is not a small icon
+        # Codelist usually puts the main image in the post body
+        if 'wp-content/uploads' in img_src or '/uploads/posts/' in img_src:
+            candidates.append(img_src)
+    return candidates
 
-def clean_files(extract_dir):
-    files_to_delete = [
-        "Downloaded from CODELIST.CC.url",
-        "codelist.cc.txt"
-    ]
-    print("Cleaning files...")
-    for root, dirs, files in os.walk(extract_dir):
-        for name in files:
-            if name in files_to_delete:
-                file_path = os.path.join(root, name)
-                print(f"Deleting {file_path}")
-                os.remove(file_path)
-
-def add_copyright_files(extract_dir):
-    if not os.path.exists(COPYRIGHT_DIR):
-        print(f"Copyright directory not found at {COPYRIGHT_DIR}")
-        return
-
-    print("Adding copyright files...")
-    for filename in os.listdir(COPYRIGHT_DIR):
-        src_file = os.path.join(COPYRIGHT_DIR, filename)
-        if os.path.isfile(src_file):
-            dst_file = os.path.join(extract_dir, filename)
-            shutil.copy2(src_file, dst_file)
-
-def repack_to_zip(extract_dir, output_zip_path):
+# How often the copyright directory is checked for changes
+COPYRIGHT_RESCAN_INTERVAL = 10
+
+class CopyrightCache:
+    """
+    The files in COPYRIGHT_DIR, deflated once into ready-to-append ZIP
+    entries. The directory is re-scanned at most every
+    COPYRIGHT_RESCAN_INTERVAL seconds and reloaded when a file is added,
+    removed or modified.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._entries = []
+        self._signature = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        if not os.path.isdir(self.directory):
+            return ()
+        return tuple(sorted(
+            (e.name, e.stat().st_size, e.stat().st_mtime_ns)
+            for e in os.scandir(self.directory) if e.is_file()
+        ))
+
+    def _load(self, signature):
+        if not signature:
+            print(f"Copyright directory not found or empty at {self.directory}")
+        entries = []
+        for filename, _, _ in signature:
+            with open(os.path.join(self.directory, filename), 'rb') as f:
+                data = f.read()
+            entries.append(precompress(filename, data))
+        self._entries = entries
+        self._signature = signature
+        print(f"Loaded {len(entries)} copyright files")
+
+    def load(self):
+        with self._lock:
+            self._checked = time.monotonic()
+            self._load(self._scan())
+
+    def entries(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked >= COPYRIGHT_RESCAN_INTERVAL:
+                self._checked = now
+                signature = self._scan()
+                if signature != self._signature:
+                    self._load(signature)
+            return self._entries
+
+copyright_cache = CopyrightCache(COPYRIGHT_DIR)
+
+def output_variant(add_copyright):
+    """
+    What besides the archive decides the cleaned output: the clean rules
+    and, with add_copyright, the copyright files. See dedup.Fingerprint.
+    """
+    injected = [(info.filename, info.CRC) for info, _ in copyright_cache.entries()] if add_copyright else None
+    return hashlib.sha256(repr((clean_rules.signature, injected)).encode()).hexdigest()[:16]
+
+# Below this much data a process pool costs more than it saves
+PARALLEL_REPACK_MIN_SIZE = 8 * 1024 * 1024
+
+def open_output(output_path, on_volume=None):
+    """
+    Where a cleaned ZIP is written: the plain path, or volumes of
+    SPLIT_VOLUME_SIZE handed to on_volume(path) as each one is finished.
+    """
+    if on_volume is None:
+        return output_path
+    return VolumeWriter(output_path, SPLIT_VOLUME_SIZE, on_volume)
+
+def output_path_of(dst):
+    return dst.volumes[0] if isinstance(dst, VolumeWriter) else dst
+
+def repack_to_zip(extract_dir, output_zip_path, add_entries=(), on_volume=None, cancel=None):
+    """
+    Single pass over the extracted tree: entries matching clean_rules are
+    skipped as they are found and precompressed add_entries are spliced in,
+    replacing any file of the same name. Returns the path written (the
+    first volume when split). A cancelled CancelToken stops the write.
+    """
     print(f"Creating {output_zip_path}...")
-    with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(extract_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, extract_dir)
-                zipf.write(file_path, arcname)
-    print("Repack complete.")
-
-def process_workupload_url(url, work_dir, progress_callback=None, add_copyright=False):
-    print(f"Processing Workupload URL: {url}")
-    download_dir = os.path.join(work_dir, "downloads")
+    injected = {info.filename for info, _ in add_entries}
+    files = []
+    dropped = 0
+    for root, dirs, names in os.walk(extract_dir):
+        for file in names:
+            file_path = os.path.join(root, file)
+            arcname = os.path.relpath(file_path, extract_dir)
+            size = os.path.getsize(file_path)
+            reason = clean_rules.drop_reason(arcname, size)
+            if reason or arcname in injected:
+                print(f"Dropping {arcname} ({reason or 'replaced'})")
+                dropped += 1
+                continue
+            files.append((arcname, file_path, size))
     
-    if os.path.exists(download_dir): shutil.rmtree(download_dir)
-    os.makedirs(download_dir)
+    total = sum(size for _, _, size in files)
+    workers = REPACK_WORKERS if total >= PARALLEL_REPACK_MIN_SIZE else 1
+    dst = open_output(output_zip_path, on_volume)
+    pool = executors.cpu
+    try:
+        write_tree(files, dst, workers, REPACK_MEMORY_BUDGET, COMPRESSION_PROFILE, add_entries, pool,
+                   cancel.check if cancel else None)
+    except BrokenProcessPool:
+        # Part of the output may be written (and uploaded); fail this job, heal the pool for the next
+        executors.replace_cpu(pool)
+        raise
+    print(f"Repack complete ({len(files)} files, {dropped} dropped, {len(add_entries)} added, {workers} workers).")
+    return output_path_of(dst)
 
+# Extraction tools and what they can do, probed once (see probe_extractors)
+EXTRACTORS = None
+
+def probe_extractors():
+    """
+    Find unrar and 7-Zip once and check what this 7-Zip build supports.
+    """
+    global EXTRACTORS
+    if EXTRACTORS is not None:
+        return EXTRACTORS
+    
+    tools = {'unrar': shutil.which('unrar'), '7z': setup_tools(), '7z_rar': False, '7z_mmt': False}
+    seven_zip = tools['7z']
+    if seven_zip:
+        try:
+            res = subprocess.run([seven_zip, 'i'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
+            tools['7z_rar'] = b' Rar' in res.stdout
+            
+            # Old p7zip builds reject -mmt on extraction; try it on a throwaway archive
+            probe_dir = tempfile.mkdtemp()
+            probe_zip = os.path.join(probe_dir, "probe.zip")
+            with zipfile.ZipFile(probe_zip, 'w') as z:
+                z.writestr("probe.txt", "probe")
+            res = subprocess.run([seven_zip, 't', probe_zip, '-mmt=on'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
+            tools['7z_mmt'] = res.returncode == 0
+            shutil.rmtree(probe_dir, ignore_errors=True)
+        except Exception as e:
+            print(f"Error probing {seven_zip}: {e}")
+    
+    print(f"Extractors: unrar={tools['unrar']}, 7z={seven_zip} (rar: {tools['7z_rar']}, multithreaded: {tools['7z_mmt']})")
+    EXTRACTORS = tools
+    return EXTRACTORS
+
+def detect_archive_format(path):
     try:
-        session = requests.Session()
-        # 1. Get Page to set cookies
-        resp = session.get(url, impersonate="chrome120")
-        resp.raise_for_status()
-        
-        file_id = url.split('/file/')[-1]
-        download_url = f"https://workupload.com/start/{file_id}"
-        
-        print(f"Download URL: {download_url}")
-        
-        # 2. Download
-        filename = "download.rar"
-        
-        dl_resp = session.get(download_url, stream=True, impersonate="chrome120")
-        dl_resp.raise_for_status()
-        
-        cd = dl_resp.headers.get('content-disposition')
-        if cd:
-            if 'filename="' in cd:
-                filename = cd.split('filename="')[1].split('"')[0]
-            elif 'filename=' in cd:
-                filename = cd.split('filename=')[1].split(';')[0]
-                
-        save_path = os.path.join(download_dir, filename)
-        
-        total_size = int(dl_resp.headers.get('content-length', 0))
-        downloaded_size = 0
-        
-        with open(save_path, 'wb') as f:
-            for chunk in dl_resp.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded_size += len(chunk)
-                    if progress_callback and total_size > 0:
-                        progress_callback(downloaded_size, total_size)
-                        
-        print(f"Downloaded to {save_path}")
-        return process_archive(save_path, work_dir, add_copyright)
+        return sniff_file(path)
+    except BadContentError:
+        return None
 
-    except Exception as e:
-        print(f"Workupload processing failed: {e}")
+def _list_7z(archive_path):
+    res = subprocess.run(
+        [EXTRACTORS['7z'], 'l', '-slt', '-p-', archive_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=120
+    )
+    if res.returncode != 0:
         return None
+    entries = []
+    # Technical listing: one "Key = value" block per entry after the ---------- line
+    body = res.stdout.decode('utf-8', errors='ignore').split('----------', 1)[-1]
+    for block in body.split('\n\n'):
+        fields = dict(line.split(' = ', 1) for line in block.splitlines() if ' = ' in line)
+        if 'Path' in fields and fields.get('Folder') != '+':
+            entries.append((fields['Path'], int(fields.get('Size') or 0)))
+    return entries
 
-def process_pixeldrain_url(url, work_dir, progress_callback=None, add_copyright=False):
-    print(f"Processing Pixeldrain URL: {url}")
-    download_dir = os.path.join(work_dir, "downloads")
+def list_archive(archive_path, archive_format):
+    """
+    (name, uncompressed size) for every file in an archive, or None if it can't be listed.
+    """
+    try:
+        if archive_format == 'zip':
+            with zipfile.ZipFile(archive_path) as z:
+                return [(i.filename, i.file_size) for i in z.infolist() if not i.is_dir()]
+        if archive_format == 'rar':
+            with rarfile.RarFile(archive_path) as r:
+                return [(i.filename, i.file_size) for i in r.infolist() if not i.is_dir()]
+        if probe_extractors()['7z']:
+            return _list_7z(archive_path)
+    except Exception as e:
+        print(f"Could not list {archive_path}: {e}")
+    return None
+
+def _run_extractor(cmd, extract_dir, cancel=None):
+    extraction_quota.run(cmd, extract_dir, cancel)
+
+def _extract_zipfile(archive_path, extract_dir, cancel=None):
+    # zipfile strips '..' and absolute paths from member names
+    with zipfile.ZipFile(archive_path) as z:
+        for member in z.infolist():
+            if cancel:
+                cancel.check()
+            z.extract(member, extract_dir)
+
+def _extract_unrar(archive_path, extract_dir, cancel=None):
+    _run_extractor([EXTRACTORS['unrar'], 'x', '-y', '-p-', archive_path, extract_dir + os.sep], extract_dir, cancel)
+
+def _extract_7z(archive_path, extract_dir, cancel=None):
+    cmd = [EXTRACTORS['7z'], 'x', archive_path, f'-o{extract_dir}', '-y', '-p-']
+    if EXTRACTORS['7z_mmt']:
+        cmd.append('-mmt=on')
+    _run_extractor(cmd, extract_dir, cancel)
+
+def extractors_for(archive_format):
+    """
+    (name, function) extractors to try for a format, fastest first.
+    """
+    tools = probe_extractors()
+    candidates = []
+    if archive_format == 'zip':
+        candidates.append(('zipfile', _extract_zipfile))
+    if archive_format in ('rar', None) and tools['unrar']:
+        candidates.append(('unrar', _extract_unrar))
+    if tools['7z'] and (archive_format != 'rar' or tools['7z_rar'] or not tools['unrar']):
+        candidates.append(('7-Zip', _extract_7z))
+    return candidates
+
+def extract_archive(rar_path, extract_dir, archive_format=None, cancel=None):
+    if archive_format is None:
+        archive_format = detect_archive_format(rar_path)
     
-    if os.path.exists(download_dir): shutil.rmtree(download_dir)
-    os.makedirs(download_dir)
+    entries = list_archive(rar_path, archive_format)
+    if entries is not None:
+        extraction_quota.check_listing(entries, os.path.getsize(rar_path))
+    
+    print(f"Extracting {rar_path} (format: {archive_format or 'unknown'})...")
+    errors = []
+    for name, extractor in extractors_for(archive_format):
+        # Start each attempt from an empty directory
+        if os.path.exists(extract_dir):
+            shutil.rmtree(extract_dir)
+        os.makedirs(extract_dir)
+        print(f"Using {name}...")
+        try:
+            extractor(rar_path, extract_dir, cancel)
+            print(f"{name} extraction successful.")
+            return
+        except (QuotaExceeded, Cancelled):
+            raise
+        except Exception as e:
+            print(f"{name} extraction failed: {e}")
+            errors.append(f"{name} failed: {e}")
+    
+    if not errors:
+        errors.append(f"no extractor available for {archive_format or 'unknown'} archives")
+    raise Exception(f"Extraction failed. Ensure 'unrar' or 'p7zip-rar' is installed. Details: {' | '.join(errors)}")
+
+def finalize_extracted(extract_dir, work_dir, archive_name, add_copyright=False, on_volume=None, cancel=None):
+    """
+    Repack the extracted tree as <name>_cleaned.zip, dropping junk and
+    adding the copyright files on the way.
+    """
+    output_path = cleaned_zip_path(work_dir, archive_name)
+    return repack_to_zip(extract_dir, output_path, copyright_cache.entries() if add_copyright else [], on_volume, cancel)
+
+def cleaned_zip_path(work_dir, archive_name):
+    return os.path.join(work_dir, f"{os.path.splitext(archive_name)[0]}_cleaned.zip")
 
+def rewrite_zip_archive(zip_path, work_dir, add_copyright=False, on_volume=None, cancel=None):
+    """
+    Clean a ZIP by copying the compressed bytes of the entries we keep
+    straight into the output; nothing is extracted or recompressed.
+    """
+    injected = copyright_cache.entries() if add_copyright else []
+    injected_names = {info.filename for info, _ in injected}
+    
+    def keep(info):
+        reason = clean_rules.drop_reason(info.filename, info.file_size)
+        # A top-level file of the same name is replaced by the copyright version
+        if reason or info.filename in injected_names:
+            print(f"Dropping {info.filename} ({reason or 'replaced'})")
+            return False
+        return True
+    
+    output_path = cleaned_zip_path(work_dir, os.path.basename(zip_path))
+    print(f"Rewriting {zip_path} -> {output_path}...")
+    dst = open_output(output_path, on_volume)
     try:
-        # https://pixeldrain.com/u/tn5KZgLz -> https://pixeldrain.com/api/file/tn5KZgLz
-        file_id = url.split('/u/')[-1]
-        download_url = f"https://pixeldrain.com/api/file/{file_id}"
-        print(f"Download URL: {download_url}")
-        
-        session = requests.Session()
-        dl_resp = session.get(download_url, stream=True, impersonate="chrome120")
-        dl_resp.raise_for_status()
-        
-        filename = "download.rar"
-        cd = dl_resp.headers.get('content-disposition')
-        if cd:
-            if 'filename="' in cd:
-                filename = cd.split('filename="')[1].split('"')[0]
-            elif 'filename=' in cd:
-                filename = cd.split('filename=')[1].split(';')[0]
-                
-        save_path = os.path.join(download_dir, filename)
-        
-        total_size = int(dl_resp.headers.get('content-length', 0))
-        downloaded_size = 0
-        
-        with open(save_path, 'wb') as f:
-            for chunk in dl_resp.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded_size += len(chunk)
-                    if progress_callback and total_size > 0:
-                        progress_callback(downloaded_size, total_size)
-                        
-        print(f"Downloaded to {save_path}")
-        return process_archive(save_path, work_dir, add_copyright)
+        copied, dropped = rewrite_zip(zip_path, dst, keep, injected, cancel.check if cancel else None)
+    except BaseException:
+        if isinstance(dst, VolumeWriter) and dst.volumes:
+            # Parts already handed out belong to the failed rewrite; a
+            # fallback writes new ones under the same names
+            on_volume(None)
+        raise
+    print(f"Rewrite complete ({copied} entries copied, {dropped} dropped, {len(injected)} added).")
+    return output_path_of(dst)
 
-    except Exception as e:
-        print(f"Pixeldrain processing failed: {e}")
-        return None
+def process_archive(rar_path, work_dir, add_copyright=False, archive_format=None, on_volume=None, cancel=None):
+    """
+    Clean a downloaded archive into <name>_cleaned.zip. Cancelling the
+    CancelToken kills the extractor or stops the repack with Cancelled.
+    """
+    if archive_format == 'zip' or (archive_format is None and zipfile.is_zipfile(rar_path)):
+        try:
+            return rewrite_zip_archive(rar_path, work_dir, add_copyright, on_volume, cancel)
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, EOFError, ValueError) as e:
+            print(f"Raw ZIP rewrite failed ({e}), extracting instead...")
+    
+    extract_dir = os.path.join(work_dir, "extracted")
+    extract_archive(rar_path, extract_dir, archive_format, cancel)
+    return finalize_extracted(extract_dir, work_dir, os.path.basename(rar_path), add_copyright, on_volume, cancel)
+
+# --- Async API ---
+# Network steps run on pooled AsyncSessions (see net.py), so one event loop can
+# drive many concurrent scrapes and downloads. Parsing, extraction and repacking
+# are blocking and run on the pools in executors.py.
 
-def process_krakenfiles_url(url, work_dir, progress_callback=None, add_copyright=False):
-    print(f"Processing Krakenfiles URL: {url}")
+def _prepare_work_dirs(work_dir):
     download_dir = os.path.join(work_dir, "downloads")
     extract_dir = os.path.join(work_dir, "extracted")
     
@@ -733,184 +782,587 @@ def process_krakenfiles_url(url, work_dir, progress_callback=None, add_copyright
     
     os.makedirs(download_dir)
     os.makedirs(extract_dir)
+    return download_dir
 
+async def search_codelist_async(query):
+    params = {
+        "subaction": "search",
+        "story": query
+    }
+    
     try:
-        try:
-            from pykraken.kraken import Kraken
-        except ImportError:
-            raise Exception("py-kraken module not found. Please run 'pip install py-kraken'")
-
-        k = Kraken()
-        # py-kraken logic
-        # It seems py-kraken might need 'requests' but we have it.
-        # k.get_download_link(url) returns the force-download url
-        
-        print("Getting download link via py-kraken...")
-        download_url = k.get_download_link(url)
-        
-        if not download_url:
-             raise Exception("py-kraken returned None for download link.")
-             
-        print(f"Download URL: {download_url}")
-        
-        # Download using our robust downloader
-        filename = "download.rar" # Default
-        # Try to extract filename from URL if possible or just use default
-        
-        save_path = os.path.join(download_dir, filename)
-        
-        # Use our download_file function which handles retries and headers
-        # Note: force-download might not need referer, but adding it doesn't hurt
-        if not download_file(download_url, save_path, progress_callback=progress_callback):
-             raise Exception("Download failed.")
-             
-        # Check if file is valid (not html error page)
-        if os.path.exists(save_path) and os.path.getsize(save_path) < 1000:
-             # Read content to check for error
-             with open(save_path, 'rb') as f:
-                 content = f.read(200)
-                 print(f"File too small. Content: {content}")
-             raise Exception("Downloaded file is too small (likely error page).")
-
-        return process_archive(save_path, work_dir, add_copyright)
-
+        r = await fetch(SEARCH_URL, method="POST", data=params, impersonate="chrome120")
+        if r.status_code != 200:
+            return None
+        return await executors.run_cpu(parse_search_results, r.text, query)
     except Exception as e:
-        print(f"Krakenfiles processing failed: {e}")
+        print(f"Search error: {e}")
         return None
 
-def process_archive(rar_path, work_dir, add_copyright=False):
-    extract_dir = os.path.join(work_dir, "extracted")
-    if not os.path.exists(extract_dir):
-        os.makedirs(extract_dir)
+async def get_direct_link_async(url):
+    try:
+        html = await fetch_text(url)
+        return await executors.run_cpu(parse_direct_link, html)
+    except Exception as e:
+        print(f"Error fetching page: {e}")
+    return None
 
-    print(f"Extracting {rar_path}...")
-    extraction_success = False
-    error_msg = ""
-    
-    # Priority 1: Try unrar
-    if shutil.which('unrar'):
-        print("Using unrar...")
-        cmd_unrar = ['unrar', 'x', '-y', '-p-', rar_path, extract_dir]
-        res_unrar = subprocess.run(cmd_unrar, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if res_unrar.returncode == 0:
-            extraction_success = True
-            print("Unrar successful.")
-        else:
-            error_msg = res_unrar.stderr.decode('utf-8', errors='ignore')
-            print(f"Unrar failed: {error_msg}")
-    
-    # Priority 2: Try 7-Zip
-    if not extraction_success:
-        seven_zip = setup_tools()
-        if seven_zip:
-            print(f"Using {seven_zip}...")
-            cmd = [seven_zip, 'x', rar_path, f'-o{extract_dir}', '-y', '-p-']
-            res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if res.returncode == 0:
-                extraction_success = True
-                print("7-Zip extraction successful.")
-            else:
-                current_err = res.stderr.decode('utf-8', errors='ignore')
-                error_msg += f" | 7-Zip failed: {current_err}"
-                print(f"7-Zip extraction failed: {current_err}")
-        else:
-             error_msg += " | 7-Zip tool missing."
-             
-    if not extraction_success:
-        raise Exception(f"Extraction failed. Ensure 'unrar' or 'p7zip-rar' is installed. Details: {error_msg}")
+async def process_and_save_image_async(img_url, work_dir, referer=None, session=None):
+    if not work_dir:
+        return None
         
-    # Clean
-    clean_files(extract_dir)
+    print(f"Processing image: {img_url}")
+    headers = image_request_headers(referer)
+    data = None
+    
+    for imp in IMAGE_IMPERSONATIONS:
+        try:
+            print(f"Attempting download with impersonate='{imp}'...")
+            if session:
+                response = await session.get(img_url, timeout=15, headers=headers, impersonate=imp)
+            else:
+                response = await fetch(img_url, impersonate=imp, headers=headers, timeout=15)
+            
+            if response.status_code == 200:
+                content_type = response.headers.get('Content-Type', '').lower()
+                if 'image' in content_type and response.content:
+                    data = response.content
+                    break
+                print(f"Got {content_type} (or empty body) instead of image, retrying...")
+            else:
+                print(f"Status code {response.status_code}, retrying...")
+        except Exception as e:
+            print(f"Attempt failed: {e}")
+            await asyncio.sleep(1)
     
-    # Add Copyright Files
-    if add_copyright:
-        add_copyright_files(extract_dir)
+    if data is None:
+        print("Python download attempts failed. Trying fallback to system curl...")
+        try:
+            if not os.path.exists(work_dir):
+                os.makedirs(work_dir)
+            save_path = os.path.join(work_dir, f"curl_{int(time.time())}.img")
+            proc = await asyncio.create_subprocess_exec(
+                *curl_image_command(img_url, save_path, referer),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            await proc.wait()
+            
+            if proc.returncode == 0 and os.path.exists(save_path) and os.path.getsize(save_path) > 1000:
+                with open(save_path, 'rb') as f:
+                    data = f.read()
+            if os.path.exists(save_path):
+                os.remove(save_path)
+        except Exception as e:
+            print(f"Curl fallback failed: {e}")
     
-    # Repack
-    filename = os.path.basename(rar_path)
-    output_name = f"{os.path.splitext(filename)[0]}_cleaned.zip"
-    output_path = os.path.join(work_dir, output_name)
-    repack_to_zip(extract_dir, output_path)
+    if data is None:
+        print("All download attempts failed.")
+        return None
     
-    return output_path
+    return await executors.run_cpu(save_cover_image, data, work_dir)
 
-def process_url(url, work_dir, progress_callback=None, add_copyright=False):
-    metadata = None
-    zip_path = None
+async def extract_metadata_from_codelist_async(url, work_dir=None):
+    print(f"Scraping metadata from {url}...")
+    metadata = empty_metadata()
+    # Pooled per-host session keeps cookies/clearance between page and images
+    session = get_session(url)
     
-    # Determine if it's a codelist URL
-    if "codelist.cc" in url:
-        print("Detected codelist.cc URL. Extracting metadata...")
-        metadata = extract_metadata_from_codelist(url, work_dir)
+    try:
+        html = await fetch_text(url, session=session)
+        metadata, codelist_images = await executors.run_cpu(parse_codelist_page, html)
         
-        # Collect candidates
-        candidates = []
-        if metadata.get('upload_ee_url'): candidates.append(('upload.ee', metadata['upload_ee_url']))
-        if metadata.get('krakenfiles_url'): candidates.append(('krakenfiles', metadata['krakenfiles_url']))
-        if metadata.get('workupload_url'): candidates.append(('workupload', metadata['workupload_url']))
-        if metadata.get('pixeldrain_url'): candidates.append(('pixeldrain', metadata['pixeldrain_url']))
+        if metadata['image_url'] and work_dir:
+            print(f"Found og:image: {metadata['image_url']}, processing...")
+            local_path = await process_and_save_image_async(metadata['image_url'], work_dir, referer=url, session=session)
+            if local_path:
+                metadata['image_path'] = local_path
         
-        if not candidates:
-             raise Exception("Could not find supported download link (upload.ee, krakenfiles, workupload, pixeldrain) on the provided codelist.cc page.")
-             
-        for host, link in candidates:
-            print(f"Attempting download from {host}: {link}")
+        demo_url = metadata['demo_url']
+        if demo_url and 'codecanyon.net' in demo_url:
             try:
-                if host == 'upload.ee':
-                    zip_path = process_upload_ee_url(link, work_dir, progress_callback, add_copyright)
-                elif host == 'krakenfiles':
-                    zip_path = process_krakenfiles_url(link, work_dir, progress_callback, add_copyright)
-                elif host == 'workupload':
-                    zip_path = process_workupload_url(link, work_dir, progress_callback, add_copyright)
-                elif host == 'pixeldrain':
-                    zip_path = process_pixeldrain_url(link, work_dir, progress_callback, add_copyright)
-                
-                if zip_path and os.path.exists(zip_path):
-                    print(f"Successfully processed using {host}")
-                    break # Success!
-                else:
-                    print(f"Failed to process with {host} (no file returned)")
+                cc_html = (await fetch(demo_url, impersonate="chrome120", headers=CODECANYON_HEADERS)).text
+                candidates = await executors.run_cpu(parse_codecanyon_images, cc_html)
+                for img_url in candidates:
+                    if work_dir:
+                        print(f"Processing candidate: {img_url}")
+                        local_path = await process_and_save_image_async(img_url, work_dir, referer=demo_url)
+                        if local_path:
+                            metadata['image_path'] = local_path
+                            metadata['image_url'] = img_url
+                            print(f"Success with CodeCanyon image: {local_path}")
+                            break
+                    else:
+                        metadata['image_url'] = img_url
+                        break
             except Exception as e:
-                print(f"Error processing with {host}: {e}")
-                # Continue to next candidate
+                print(f"Error scraping CodeCanyon: {e}")
+        
+        if not metadata['image_path']:
+            print("Trying fallback to Codelist images...")
+            for img_src in codelist_image_candidates(codelist_images):
+                if work_dir:
+                    local_path = await process_and_save_image_async(img_src, work_dir, referer=url, session=session)
+                    if local_path:
+                        metadata['image_path'] = local_path
+                        metadata['image_url'] = img_src
+                        print(f"Using processed Codelist image: {local_path}")
+                        break
+                else:
+                    metadata['image_url'] = img_src
+                    print(f"Using Codelist image: {img_src}")
+                    break
     
-    else:
-        # Direct link provided (assume upload.ee or krakenfiles)
-        if "krakenfiles.com" in url:
-            zip_path = process_krakenfiles_url(url, work_dir, progress_callback, add_copyright)
-        elif "workupload.com" in url:
-            zip_path = process_workupload_url(url, work_dir, progress_callback, add_copyright)
-        elif "pixeldrain.com" in url:
-            zip_path = process_pixeldrain_url(url, work_dir, progress_callback, add_copyright)
-        else:
-            # Process as upload.ee
-            zip_path = process_upload_ee_url(url, work_dir, progress_callback, add_copyright)
+    except Exception as e:
+        print(f"Error scraping codelist: {e}")
     
-    return zip_path, metadata
+    return metadata
 
-def process_upload_ee_url(url, work_dir, progress_callback=None, add_copyright=False):
-    download_dir = os.path.join(work_dir, "downloads")
+async def download_target(host, target, download_dir, progress_callback=None, partial_dir=PARTIAL_DIR):
+    """
+    Download a target resolved by a host adapter, within the adapter's
+    concurrency limit, feeding the outcome into the host's health model.
+    """
+    print(f"Download URL: {target['url']}")
+    health = host_health.get(host)
+    try:
+        async with get_adapter(host).semaphore:
+            started = time.monotonic()
+            save_path = await download_file_async(
+                target['url'], os.path.join(download_dir, target['filename']),
+                progress_callback=progress_callback, session=target['session'],
+                use_remote_name=target['use_remote_name'], retry_delay=health.retry_delay,
+                partial_dir=partial_dir
+            )
+            if not save_path:
+                raise Exception("Download failed.")
+        
+        # The stream was already sniffed at its first chunk; this also covers resumed files
+        archive_format = sniff_file(save_path)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        host_health.record_failure(host, e)
+        raise
+    
+    host_health.record_success(host, os.path.getsize(save_path), time.monotonic() - started)
+    save_path = _fix_extension(save_path, archive_format)
+    print(f"Downloaded to {save_path} (format: {archive_format or 'unknown'})")
+    return save_path, archive_format
+
+def _fix_extension(path, archive_format):
+    """
+    Give the file the extension of its detected format (e.g. download.rar that is really a ZIP).
+    """
+    if archive_format not in ('rar', 'zip', '7z'):
+        return path
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == f".{archive_format}":
+        return path
+    if ext.lower() not in ('.rar', '.zip', '.7z'):
+        stem = path
+    new_path = f"{stem}.{archive_format}"
+    os.replace(path, new_path)
+    return new_path
+
+class ProcessStreamSink:
+    """
+    Pipes download chunks into an extractor subprocess reading stdin. Its
+    output is checked against the extraction quota every WATCH_INTERVAL
+    while it runs, and the extractor is killed as soon as it is exceeded.
+    """
+
+    def __init__(self, cmd, extract_dir):
+        self.cmd = cmd
+        self.extract_dir = extract_dir
+        self.proc = None
+        self.error = None
+        self._stderr = None
+        self._watcher = None
+
+    async def _start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            *self.cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        # Keep stderr drained so a chatty extractor can't block on it
+        self._stderr = asyncio.ensure_future(self.proc.stderr.read())
+        self._watcher = asyncio.ensure_future(self._watch())
+
+    async def _watch(self):
+        # On a timer, not per chunk: a small archive can expand hugely
+        try:
+            while self.proc.returncode is None:
+                await asyncio.sleep(WATCH_INTERVAL)
+                written = written_bytes(self.proc)
+                if written is not None:
+                    # Extractors write little besides the extracted files
+                    extraction_quota.check_totals(written, 0)
+                await executors.run_io(extraction_quota.check_tree, self.extract_dir)
+        except QuotaExceeded as e:
+            print(f"Killing {self.cmd[0]}: {e}")
+            self.error = e
+            if self.proc.returncode is None:
+                self.proc.kill()
+
+    async def _stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+
+    async def write(self, chunk):
+        if self.proc is None:
+            await self._start()
+        if self.error:
+            raise self.error
+        try:
+            self.proc.stdin.write(chunk)
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # Killed by the watcher, or exited early; report why
+            if self.error:
+                raise self.error
+            raise
+
+    async def close(self):
+        if self.proc is None:
+            await self._start()
+        self.proc.stdin.close()
+        await self.proc.wait()
+        await self._stop_watching()
+        if self.error:
+            raise self.error
+        err = (await self._stderr).decode('utf-8', errors='ignore')
+        if self.proc.returncode != 0:
+            raise Exception(f"{self.cmd[0]} failed: {err}")
+        await executors.run_io(extraction_quota.check_tree, self.extract_dir)
+
+    async def abort(self):
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.kill()
+            await self.proc.wait()
+        await self._stop_watching()
+
+def open_extract_sink(archive_format, extract_dir):
+    if archive_format == 'zip':
+        # Rewriting the entries raw beats extracting and recompressing them
+        raise StreamingUnsupported("ZIPs are rewritten from the downloaded file")
+    if archive_format == 'rar' and shutil.which('bsdtar'):
+        # libarchive reads RAR sequentially from stdin and refuses '..' paths
+        return ProcessStreamSink(['bsdtar', '-xf', '-', '-C', extract_dir], extract_dir)
+    raise StreamingUnsupported(f"No streaming extractor for format {archive_format}")
+
+async def stream_process_target(host, target, work_dir, progress_callback=None, add_copyright=False, sample=None, on_volume=None, fingerprint=None, cancel=None, pipeline=user_pipeline):
+    """
+    Download and extract at the same time; the archive itself never lands on disk.
+    The archive is hashed on the way through for fingerprint.check_source.
+    Only formats that must be extracted anyway are streamed (see open_extract_sink).
+    """
+    _prepare_work_dirs(work_dir)
     extract_dir = os.path.join(work_dir, "extracted")
+    prefix = sample['data'] if sample and sample['info']['accept_ranges'] else b''
+    hasher = hashlib.sha256()
     
-    if os.path.exists(download_dir): shutil.rmtree(download_dir)
-    if os.path.exists(extract_dir): shutil.rmtree(extract_dir)
+    async with pipeline.download:
+        try:
+            async with get_adapter(host).semaphore:
+                started = time.monotonic()
+                nbytes, archive_format, headers = await stream_download(
+                    target['url'], lambda fmt: open_extract_sink(fmt, extract_dir),
+                    session=target['session'], progress_callback=progress_callback, prefix=prefix,
+                    hasher=hasher
+                )
+        except SinkError as e:
+            # The extractor failed, not the host
+            raise e.__cause__
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            host_health.record_failure(host, e)
+            raise
     
-    os.makedirs(download_dir)
-    os.makedirs(extract_dir)
+    host_health.record_success(host, nbytes, time.monotonic() - started)
+    archive_name = remote_filename(headers, target['filename'], target['use_remote_name'])
+    print(f"Streamed and extracted {archive_name} ({nbytes} bytes, {archive_format})")
+    if fingerprint:
+        await fingerprint.check_source(hasher.hexdigest())
+    async with pipeline.process:
+        return await executors.run_io_cancellable(cancel, finalize_extracted, extract_dir, work_dir, archive_name, add_copyright, on_volume, cancel)
+
+async def expected_download(target, sample=None):
+    """
+    (Content-Length, archive format) of a target, from the race sample or
+    a small probe; 0 and None where unknown.
+    """
+    if sample:
+        info, head = sample['info'], sample['data']
+    else:
+        info = await probe_download(target['url'], target['session'])
+        if not info:
+            return 0, None
+        head = info['head']
+    try:
+        archive_format = sniff_content(head[:512], info['headers'].get('content-type'))
+    except BadContentError:
+        # The download itself reports it (and counts it against the host)
+        archive_format = None
+    return info['size'], archive_format
+
+def peak_footprint(path, archive_format):
+    """
+    Peak work dir size once the archive is on disk: ZIPs are rewritten
+    (archive + output), everything else is extracted first.
+    """
+    size = os.path.getsize(path)
+    if archive_format == 'zip':
+        return 2 * size
+    entries = list_archive(path, archive_format)
+    if entries is None:
+        return estimate_footprint(size, archive_format)
+    return 2 * size + sum(entry_size for _, entry_size in entries)
+
+async def _place_job(work_dir, nbytes, cancel, held=0):
+    """
+    (disk, ram) needs of a job with this footprint (None if unknown), after moving its work dir to disk if it outgrew RAM.
+    `held` bytes of it are already in the work dir, so no longer in what psutil reports free.
+    """
+    if await executors.run_io_cancellable(cancel, workspace.fit, work_dir, nbytes):
+        return 0, max(nbytes - held, 0)
+    return max((nbytes or 0) - held, 0), 0
+
+def _trim_work_dir(work_dir):
+    # Only the repacked output is needed from here on
+    for name in ("downloads", "extracted"):
+        shutil.rmtree(os.path.join(work_dir, name), ignore_errors=True)
+
+def _volume_handler(volume_callback):
+    """
+    Volumes are finished on an executor thread; hand them to the loop.
+    """
+    if volume_callback is None:
+        return None
+    loop = asyncio.get_running_loop()
+    return lambda path: loop.call_soon_threadsafe(volume_callback, path)
+
+async def download_and_process_target(host, target, work_dir, progress_callback=None, add_copyright=False, sample=None, queue_callback=None, volume_callback=None, fingerprint=None, pipeline=user_pipeline):
+    """
+    With volume_callback, the output is split into SPLIT_VOLUME_SIZE parts and
+    volume_callback(path) is called as each part is finished, so uploads can
+    start while the rest is still being written. volume_callback(None) means
+    the parts handed out so far are void (the attempt failed).
+    A dedup.Fingerprint gets the variant and the hashes of the archive and output;
+    an archive uploaded before raises Duplicate instead of being processed.
+    Cancelling the task stops the download, kills the extractor and stops
+    the repack; it returns once no thread touches work_dir any more.
+    """
+    cancel = CancelToken()
+    if fingerprint:
+        fingerprint.variant = await executors.run_io(output_variant, add_copyright)
+    size, archive_format = await expected_download(target, sample)
+    disk, ram = await _place_job(work_dir, estimate_footprint(size, archive_format), cancel)
+    on_volume = _volume_handler(volume_callback)
     
-    # 1. Get Link
-    direct_link = get_direct_link(url)
-    if not direct_link:
-        raise Exception("Could not find direct download link on page.")
+    async with admission.admit(disk, ram, queue_callback) as slot:
+        zip_path = None
+        if STREAM_EXTRACT:
+            try:
+                zip_path = await stream_process_target(host, target, work_dir, progress_callback, add_copyright, sample, on_volume, fingerprint, cancel, pipeline)
+            except (asyncio.CancelledError, BadContentError, QuotaExceeded, Duplicate):
+                if volume_callback:
+                    volume_callback(None)
+                raise
+            except StreamingUnsupported as e:
+                print(f"Streaming extraction not possible ({e}), downloading to disk instead...")
+            except Exception as e:
+                print(f"Streaming extraction failed ({e}), downloading to disk instead...")
+            if not zip_path and volume_callback:
+                volume_callback(None)
         
-    # 2. Download
-    filename = direct_link.split('/')[-1]
-    rar_path = os.path.join(download_dir, filename)
-    if not download_file(direct_link, rar_path, progress_callback=progress_callback):
-        raise Exception("Download failed.")
+        if not zip_path:
+            if sample:
+                # Keep the bytes the race already fetched
+                seed_partial(target['url'], sample, partial_dir=workspace.partial_dir(work_dir))
+            download_dir = _prepare_work_dirs(work_dir)
+            async with pipeline.download:
+                save_path, archive_format = await download_target(host, target, download_dir, progress_callback, workspace.partial_dir(work_dir))
+                if fingerprint:
+                    # Segmented and resumed downloads arrive out of order; hash the finished file
+                    await fingerprint.check_source(await executors.run_io_cancellable(cancel, file_sha256, save_path))
+            
+            # The archive's listing gives a better estimate than Content-Length
+            peak = await executors.run_io_cancellable(cancel, peak_footprint, save_path, archive_format)
+            await slot.resize(*await _place_job(work_dir, peak, cancel, os.path.getsize(save_path)))
+            try:
+                async with pipeline.process:
+                    zip_path = await executors.run_io_cancellable(cancel, process_archive, save_path, work_dir, add_copyright, archive_format, on_volume, cancel)
+            except BaseException:
+                if volume_callback:
+                    volume_callback(None)
+                raise
         
-    # 3. Process Archive
-    return process_archive(rar_path, work_dir, add_copyright)
+        if fingerprint:
+            fingerprint.content = await executors.run_io_cancellable(cancel, file_sha256, *volume_paths(zip_path))
+        await executors.run_io_cancellable(cancel, _trim_work_dir, work_dir)
+    return zip_path
+
+async def process_mirror_async(host, url, work_dir, progress_callback=None, add_copyright=False, queue_callback=None, volume_callback=None, fingerprint=None, pipeline=user_pipeline):
+    print(f"Processing {host} URL: {url}")
+    try:
+        target = await get_adapter(host).resolve(url)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        host_health.record_failure(host, e)
+        raise
+    return await download_and_process_target(host, target, work_dir, progress_callback, add_copyright,
+                                             queue_callback=queue_callback, volume_callback=volume_callback,
+                                             fingerprint=fingerprint, pipeline=pipeline)
+
+def _expected_seconds(sample):
+    size = sample['info']['size']
+    if size > 0:
+        return sample['ttfb'] + size / max(sample['throughput'], 1)
+    return sample['ttfb'] + 1 / max(sample['throughput'], 1)
+
+async def race_mirrors(candidates, timeout=RACE_TIMEOUT, grace=RACE_GRACE):
+    """
+    Resolve every candidate mirror at once and sample its first bytes.
+    Once one has answered, the others get `grace` seconds to answer too,
+    so a stalled mirror doesn't hold up the race for `timeout`.
+    Returns ([(host, link, target, sample)], unfinished): the mirrors that
+    answered, fastest expected completion first, and the (host, link)
+    candidates still pending when the race ended, which are cancelled.
+    Mirrors that failed are in neither list.
+    """
+    async def trial(host, link):
+        try:
+            target = await get_adapter(host).resolve(link)
+            sample = await sample_download(target['url'], target['session'])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            host_health.record_failure(host, e)
+            raise
+        print(f"Race {host}: ttfb {sample['ttfb']:.2f}s, {sample['throughput'] / 1024 / 1024:.2f} MB/s")
+        return host, link, target, sample
+    
+    def answered():
+        return any(task.done() and task.exception() is None for task in tasks)
+    
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    tasks = [asyncio.ensure_future(trial(host, link)) for host, link in candidates]
+    pending = set(tasks)
+    try:
+        # Failures don't end the race; wait for an answer
+        while pending and not answered() and loop.time() < deadline:
+            _, pending = await asyncio.wait(pending, timeout=deadline - loop.time(), return_when=asyncio.FIRST_COMPLETED)
+        if pending and answered():
+            _, pending = await asyncio.wait(pending, timeout=max(0, min(grace, deadline - loop.time())))
+        timed_out = loop.time() >= deadline
+    finally:
+        for task in pending:
+            task.cancel()
+    
+    results = []
+    unfinished = []
+    for (host, link), task in zip(candidates, tasks):
+        if task in pending:
+            if timed_out:
+                host_health.record_failure(host, "Race timed out")
+            unfinished.append((host, link))
+        elif task.exception() is None:
+            results.append(task.result())
+        else:
+            print(f"Race trial failed: {task.exception()}")
+    results.sort(key=lambda r: _expected_seconds(r[3]))
+    return results, unfinished
+
+async def _process_candidates_hedged(candidates, work_dir, progress_callback=None, add_copyright=False, queue_callback=None, volume_callback=None, fingerprint=None, pipeline=user_pipeline):
+    results, unfinished = await race_mirrors(candidates)
+    
+    for host, link, target, sample in results:
+        print(f"Committing to {host}: {link}")
+        try:
+            zip_path = await download_and_process_target(host, target, work_dir, progress_callback, add_copyright, sample, queue_callback, volume_callback, fingerprint, pipeline)
+            if zip_path and os.path.exists(zip_path):
+                print(f"Successfully processed using {host}")
+                return zip_path
+        except (asyncio.CancelledError, QuotaExceeded, Duplicate):
+            # Every mirror serves the same archive
+            raise
+        except Exception as e:
+            print(f"Error processing with {host}: {e}")
+    
+    # Mirrors still pending when the race ended get a sequential chance;
+    # ones that failed it are not retried (and not counted against twice)
+    return await _process_candidates_sequential(unfinished, work_dir, progress_callback, add_copyright, queue_callback, volume_callback, fingerprint, pipeline)
+
+async def _process_candidates_sequential(candidates, work_dir, progress_callback=None, add_copyright=False, queue_callback=None, volume_callback=None, fingerprint=None, pipeline=user_pipeline):
+    for host, link in candidates:
+        print(f"Attempting download from {host}: {link}")
+        try:
+            zip_path = await process_mirror_async(host, link, work_dir, progress_callback, add_copyright, queue_callback, volume_callback, fingerprint, pipeline)
+            if zip_path and os.path.exists(zip_path):
+                print(f"Successfully processed using {host}")
+                return zip_path
+            else:
+                print(f"Failed to process with {host} (no file returned)")
+        except (asyncio.CancelledError, QuotaExceeded, Duplicate):
+            # Every mirror serves the same archive
+            raise
+        except Exception as e:
+            print(f"Error processing with {host}: {e}")
+    return None
+
+async def process_url_async(url, work_dir, progress_callback=None, add_copyright=False, hedged=MIRROR_RACING, queue_callback=None, volume_callback=None, fingerprint=None, pipeline=user_pipeline):
+    """
+    Download and clean the archive behind a codelist post or direct host
+    link. Returns (zip_path, metadata).
+    With hedged=True, codelist posts listing several mirrors race them and
+    commit to the fastest instead of trying them strictly in order.
+    queue_callback(position) is called while the job waits for disk/RAM.
+    volume_callback(path) receives output volumes as they are finished
+    (see download_and_process_target). With a dedup.Fingerprint, an archive
+    uploaded before raises Duplicate carrying the metadata. `pipeline`
+    is the pipeline.Pipeline whose stages the job goes through.
+    """
+    metadata = None
+    zip_path = None
+    
+    try:
+        if "codelist.cc" in url:
+            print("Detected codelist.cc URL. Extracting metadata...")
+            metadata = await extract_metadata_from_codelist_async(url, work_dir)
+            
+            candidates = [
+                (adapter.name, metadata[adapter.metadata_key])
+                for adapter in HOST_ADAPTERS.values() if metadata.get(adapter.metadata_key)
+            ]
+            
+            if not candidates:
+                 supported = ", ".join(HOST_ADAPTERS)
+                 raise Exception(f"Could not find supported download link ({supported}) on the provided codelist.cc page.")
+            
+            # Best expected completion first; hosts with an open circuit are skipped
+            candidates = host_health.order(candidates)
+            
+            if hedged and len(candidates) > 1:
+                zip_path = await _process_candidates_hedged(candidates, work_dir, progress_callback, add_copyright, queue_callback, volume_callback, fingerprint, pipeline)
+            else:
+                zip_path = await _process_candidates_sequential(candidates, work_dir, progress_callback, add_copyright, queue_callback, volume_callback, fingerprint, pipeline)
+        
+        else:
+            # Direct mirror link (anything unrecognised is treated as upload.ee)
+            adapter = adapter_for_url(url) or get_adapter('upload.ee')
+            zip_path = await process_mirror_async(adapter.name, url, work_dir, progress_callback, add_copyright, queue_callback, volume_callback, fingerprint, pipeline)
+    except Duplicate as e:
+        e.metadata = metadata
+        raise
+    
+    return zip_path, metadata
 
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import logging
+import subprocess
+import psutil
+from config import EXTRACT_MAX_BYTES, EXTRACT_MAX_FILES, EXTRACT_MAX_RATIO, EXTRACT_MAX_DEPTH
+
+# How often a running extractor's output is measured
+WATCH_INTERVAL = 0.5
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def path_depth(name):
+    return len([p for p in name.replace('\\', '/').split('/') if p not in ('', '.')])
+
+
+def tree_usage(path):
+    """
+    (bytes, files) currently under a directory.
+    """
+    total = 0
+    count = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+            count += 1
+    return total, count
+
+
+def written_bytes(proc):
+    """
+    Bytes a process has written so far (Linux), or None if the OS can't tell.
+    """
+    try:
+        counters = psutil.Process(proc.pid).io_counters()
+    except (psutil.Error, AttributeError):
+        return None
+    return getattr(counters, 'write_chars', None)
+
+
+class ExtractionQuota:
+    """
+    Per-job limits on what an archive may expand to: total bytes, file
+    count, overall compression ratio and path depth (0 turns a limit off).
+    """
+
+    def __init__(self, max_bytes, max_files, max_ratio, max_depth):
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_ratio = max_ratio
+        self.max_depth = max_depth
+
+    def check_totals(self, nbytes, nfiles):
+        if self.max_bytes and nbytes > self.max_bytes:
+            raise QuotaExceeded(f"Archive expands to more than {self.max_bytes // 2**20} MB")
+        if self.max_files and nfiles > self.max_files:
+            raise QuotaExceeded(f"Archive has more than {self.max_files} files")
+
+    def check_name(self, name):
+        if self.max_depth and path_depth(name) > self.max_depth:
+            raise QuotaExceeded(f"Path nested deeper than {self.max_depth} levels: {name[:200]!r}")
+
+    def check_tree(self, path):
+        """
+        Check what an extractor has written under path so far: bytes,
+        files and path depth.
+        """
+        total = 0
+        count = 0
+        for root, dirs, files in os.walk(path):
+            rel = os.path.relpath(root, path)
+            for name in dirs:
+                self.check_name(os.path.join(rel, name))
+            for name in files:
+                self.check_name(os.path.join(rel, name))
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+                count += 1
+            self.check_totals(total, count)
+
+    def check_listing(self, entries, archive_size):
+        """
+        Refuse an archive up front from its (name, size) listing.
+        """
+        total = 0
+        for name, size in entries:
+            self.check_name(name)
+            total += size
+        self.check_totals(total, len(entries))
+        if self.max_ratio and archive_size and total / archive_size > self.max_ratio:
+            raise QuotaExceeded(f"Compression ratio {total / archive_size:.0f}:1 exceeds {self.max_ratio}:1")
+
+    def run(self, cmd, extract_dir, cancel=None):
+        """
+        Run an extractor, killing it as soon as its output exceeds the quota
+        or the cancel.CancelToken is cancelled. Raises QuotaExceeded,
+        Cancelled, or Exception with stderr if the tool failed.
+        """
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if cancel:
+            cancel.attach(proc)
+        stderr = b''
+        try:
+            while True:
+                try:
+                    _, stderr = proc.communicate(timeout=WATCH_INTERVAL)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                written = written_bytes(proc)
+                if written is not None:
+                    # Extractors write little besides the extracted files
+                    self.check_totals(written, 0)
+                else:
+                    self.check_totals(*tree_usage(extract_dir))
+        except BaseException as e:
+            if isinstance(e, QuotaExceeded):
+                logging.warning(f"Killing {cmd[0]}: {e}")
+            proc.kill()
+            proc.communicate()
+            raise
+        finally:
+            if cancel:
+                cancel.detach(proc)
+
+        if cancel:
+            # Killed by cancel() rather than failed
+            cancel.check()
+        # The file count is only known from the listing while running; confirm it now
+        self.check_totals(*tree_usage(extract_dir))
+        if proc.returncode != 0:
+            raise Exception(stderr.decode('utf-8', errors='ignore'))
+
+
+extraction_quota = ExtractionQuota(EXTRACT_MAX_BYTES, EXTRACT_MAX_FILES, EXTRACT_MAX_RATIO, EXTRACT_MAX_DEPTH)
@@ -0,0 +1,39 @@
+import re
+import fnmatch
+import hashlib
+from config import CLEAN_NAMES, CLEAN_GLOBS, CLEAN_PATTERN, CLEAN_MAX_FILE_SIZE
+
+
+class CleanRules:
+    """
+    Compiled rules for entries dropped while repacking. Names and globs
+    match an entry's base name, the pattern is searched in its full path
+    inside the archive, and max_size (bytes, 0 = off) drops large files.
+    """
+
+    def __init__(self, names=(), globs=(), pattern=None, max_size=0):
+        self.names = set(names)
+        self.glob_re = re.compile('|'.join(fnmatch.translate(g) for g in globs)) if globs else None
+        self.pattern_re = re.compile(pattern) if pattern else None
+        self.max_size = max_size
+        # Differs whenever the rules would clean an archive differently
+        self.signature = hashlib.sha256(repr((sorted(self.names), list(globs), pattern, max_size)).encode()).hexdigest()[:16]
+
+    def drop_reason(self, arcname, size=0):
+        """
+        Why an entry should be dropped, or None to keep it.
+        """
+        path = arcname.replace('\\', '/').rstrip('/')
+        name = path.rsplit('/', 1)[-1]
+        if name in self.names:
+            return "name"
+        if self.glob_re and self.glob_re.match(name):
+            return "glob"
+        if self.pattern_re and self.pattern_re.search(path):
+            return "pattern"
+        if self.max_size and size > self.max_size:
+            return "size"
+        return None
+
+
+clean_rules = CleanRules(CLEAN_NAMES, CLEAN_GLOBS, CLEAN_PATTERN, CLEAN_MAX_FILE_SIZE)
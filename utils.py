@@ -2,17 +2,24 @@ import time
 import logging
 import asyncio
 import os
-import shutil
 import secrets
+import re
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
-from processor import process_url
+from processor import process_url_async
+from dedup import Fingerprint, Duplicate, file_ids_of
+from jobqueue import job_queue, PRIORITY_USER
+from pipeline import user_pipeline, post_pipeline
+from hosts import normalize_url
+from workspace import workspace
 from config import ADMIN_ID, CHANNEL_ID
 from database import file_store
 
 class ProgressTracker:
-    def __init__(self, message: Message, operation: str):
+    def __init__(self, message: Message, operation: str, on_text=None):
         self.message = message
         self.operation = operation
+        # Also handed every text shown (e.g. to mirror it to other chats)
+        self.on_text = on_text
         self.last_update_time = 0
         self.start_time = time.time()
 
@@ -43,11 +50,131 @@ class ProgressTracker:
             f"📦 **Size**: {current / 1024 / 1024:.2f} / {total / 1024 / 1024:.2f} MB"
         )
         
+        if self.on_text:
+            self.on_text(text)
+        if self.message is None:
+            return
         try:
             await self.message.edit_text(text)
         except Exception as e:
             logging.error(f"Error updating progress: {e}")
 
+# Split outputs are name.zip.001, name.zip.002, ...
+VOLUME_SUFFIX = re.compile(r'\.\d{3}$')
+_FINISHED = object()
+
+class VolumeUploader:
+    """
+    Sends output volumes to a chat in order as the processor finishes them,
+    so the first parts are on Telegram while the rest is still being written.
+    Pass add() as volume_callback; finish() returns the uploaded file_ids.
+    Sends hold the upload stage of `pipeline` (see pipeline.py).
+    """
+
+    def __init__(self, client, chat_id, pipeline=user_pipeline):
+        self.client = client
+        self.chat_id = chat_id
+        self.pipeline = pipeline
+        self.queue = asyncio.Queue()
+        self.messages = []
+        self.single = None
+        self.error = None
+        self.task = None
+
+    def add(self, path):
+        if path is None:
+            # The attempt that wrote the queued volumes failed; a retry starts over
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.single = None
+        elif not VOLUME_SUFFIX.search(path):
+            # Output that wasn't split goes out in finish() with the final caption
+            self.single = path
+            return
+        self.queue.put_nowait(path)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            path = await self.queue.get()
+            if path is None:
+                await self._discard()
+                continue
+            if path is _FINISHED:
+                return
+            if self.error:
+                continue
+            try:
+                async with self.pipeline.upload:
+                    msg = await self.client.send_document(
+                        chat_id=self.chat_id,
+                        document=path,
+                        caption=f"📦 Part {len(self.messages) + 1}: {os.path.basename(path)}"
+                    )
+                self.messages.append(msg)
+            except Exception as e:
+                logging.error(f"Error uploading {path}: {e}")
+                self.error = e
+
+    async def _discard(self):
+        for msg in self.messages:
+            try:
+                await msg.delete()
+            except Exception:
+                pass
+        self.messages = []
+        self.error = None
+
+    async def finish(self, zip_path, caption):
+        """
+        Wait for the parts still queued; an unsplit output is sent now.
+        """
+        if self.task:
+            self.queue.put_nowait(_FINISHED)
+            await self.task
+        if self.error:
+            raise self.error
+        if self.messages:
+            return [msg.document.file_id for msg in self.messages]
+        async with self.pipeline.upload:
+            msg = await self.client.send_document(chat_id=self.chat_id, document=self.single or zip_path, caption=caption)
+        self.messages.append(msg)
+        return [msg.document.file_id]
+
+    async def discard(self):
+        """
+        Delete the parts sent so far (the output turned out to be a duplicate).
+        """
+        if self.task:
+            self.add(None)
+            self.queue.put_nowait(_FINISHED)
+            await self.task
+
+    async def delete_sent(self):
+        """
+        Delete the messages of a finished upload from the chat; their
+        file_ids stay usable.
+        """
+        await self._discard()
+
+    def cancel(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+async def upload_or_reuse(uploader, fingerprint, zip_path, caption, existing=None):
+    """
+    (file_ids, reused) for a job's output: the file_ids of an earlier upload
+    of the same archive or output if there is one, otherwise a fresh upload.
+    """
+    if existing is None:
+        existing = await fingerprint.find_content()
+    if existing:
+        logging.info(f"Reusing upload {existing.get('code')} instead of uploading again")
+        await uploader.discard()
+        return file_ids_of(existing), True
+    return await uploader.finish(zip_path, caption), False
+
 async def check_force_sub(client, user_id, force_sub_channels):
     if not force_sub_channels:
         return True, []
@@ -64,10 +191,24 @@ async def check_force_sub(client, user_id, force_sub_channels):
             
     return len(missing_channels) == 0, missing_channels
 
-async def process_and_post_to_channel(client, url, bot_username=None):
+async def process_and_post_to_channel(client, url, bot_username=None, priority=PRIORITY_USER, status_msg=None, user_id=None):
     """
-    Headless version of the processing logic for automation.
+    Headless version of the processing logic for automation, run through
+    the job queue. Concurrent calls for the same link share one job and its
+    channel post; status_msg, if given, shows the queue position. Raises
+    QueueFull when user_id already has USER_MAX_JOBS jobs queued.
     """
+    fields = {}
+    if status_msg:
+        fields = {"chat_id": status_msg.chat.id, "status_id": status_msg.id}
+    job = await job_queue.submit("post", normalize_url(url), priority, user_id=user_id,
+                                 url=url, bot_username=bot_username, **fields)
+    return await job_queue.wait(job)
+
+async def run_post_job(client, job, context=None):
+    return await _process_and_post(client, job["url"], job.get("bot_username"))
+
+async def _process_and_post(client, url, bot_username=None):
     if not bot_username:
          try:
              me = await client.get_me()
@@ -75,43 +216,45 @@ async def process_and_post_to_channel(client, url, bot_username=None):
          except:
              bot_username = "Bot"
 
-    work_dir = f"work_auto_{int(time.time())}_{secrets.token_hex(3)}"
-    os.makedirs(work_dir, exist_ok=True)
+    work_dir = workspace.acquire(f"work_auto_{int(time.time())}_{secrets.token_hex(3)}")
+    
+    # We upload to ADMIN_ID first to get file_id and store it.
+    # If ADMIN_ID is not set, we might fail or need a dump channel.
+    # Parts of a split output are uploaded while the next one is written.
+    target_chat = ADMIN_ID if ADMIN_ID else CHANNEL_ID
+    uploader = VolumeUploader(client, target_chat, post_pipeline)
     
     try:
         logging.info(f"Auto-processing URL: {url}")
         
         # 1. Download & Process
-        loop = asyncio.get_running_loop()
-        executor = None # Use default
-        
         # We don't have a progress callback for auto-mode, or we log it
-        zip_path, metadata = await loop.run_in_executor(
-            executor, 
-            lambda: process_url(url, work_dir, add_copyright=True)
-        )
+        # An archive (or output) uploaded before is not uploaded again
+        fingerprint = Fingerprint(file_store.find_by_hash)
+        existing = None
+        try:
+            zip_path, metadata = await process_url_async(
+                url, work_dir, add_copyright=True, volume_callback=uploader.add, fingerprint=fingerprint,
+                pipeline=post_pipeline
+            )
+        except Duplicate as e:
+            zip_path, metadata, existing = None, e.metadata, e.doc
         
-        if zip_path and os.path.exists(zip_path):
+        if existing or (zip_path and os.path.exists(zip_path)):
             logging.info(f"Processing complete. Uploading {zip_path}...")
             
             # 2. Upload to Telegram
-            # We send it to ADMIN_ID first to get file_id and store it.
-            # If ADMIN_ID is not set, we might fail or need a dump channel.
-            target_chat = ADMIN_ID if ADMIN_ID else CHANNEL_ID
-            
             caption_file = f"{metadata.get('title', 'File')}\n\nUploaded by Bot"
             
             # Upload to Admin to get File ID
-            msg = await client.send_document(
-                chat_id=target_chat,
-                document=zip_path,
-                caption=caption_file
-            )
-            
-            file_id = msg.document.file_id
+            file_ids, _ = await upload_or_reuse(uploader, fingerprint, zip_path, caption_file, existing)
             
             # 3. Create Store Entry
-            code = await file_store.save_file(file_id, caption=caption_file)
+            code = await file_store.save_file(
+                file_ids[0], caption=caption_file, parts=file_ids if len(file_ids) > 1 else None,
+                source_hash=fingerprint.source, content_hash=fingerprint.content,
+                variant=fingerprint.variant
+            )
             bot_link = f"https://t.me/{bot_username}?start={code}"
             
             # 4. Post to Channel
@@ -184,8 +327,5 @@ async def process_and_post_to_channel(client, url, bot_username=None):
         return None
     finally:
         # Cleanup
-        if os.path.exists(work_dir):
-            try:
-                shutil.rmtree(work_dir)
-            except:
-                pass
+        uploader.cancel()
+        workspace.release(work_dir)
@@ -0,0 +1,181 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+import threading
+from config import RAM_WORK_DIR, WORK_DIR, RAM_WORK_BUDGET, WORK_DIR_MAX_AGE, JANITOR_INTERVAL, PARTIAL_DIR
+from executors import executors
+
+# Peak footprint of a job relative to its download: the archive, its
+# extracted tree and the repacked output
+FOOTPRINT_FACTOR = 4
+# ZIPs are rewritten entry by entry: just the archive and the output
+ZIP_FOOTPRINT_FACTOR = 2
+# Held in RAM for a job before its download size is known (pages, cover image)
+INITIAL_RESERVATION = 16 * 1024 * 1024
+WORK_PREFIX = "work_"
+
+
+def estimate_footprint(download_size, archive_format=None):
+    """
+    Expected peak size of a job's work dir, or None if the download size is unknown.
+    """
+    if download_size <= 0:
+        return None
+    return download_size * (ZIP_FOOTPRINT_FACTOR if archive_format == 'zip' else FOOTPRINT_FACTOR)
+
+
+class WorkspaceManager:
+    """
+    Places job work dirs on a RAM-backed directory (tmpfs) while their
+    expected footprint fits the RAM budget, and on disk otherwise.
+    Jobs get a path in the disk work dir; for RAM jobs it is a symlink,
+    so a job can be spilled to disk without any of its paths changing.
+    """
+
+    def __init__(self, ram_dir, disk_dir, ram_budget):
+        self.ram_dir = ram_dir
+        self.disk_dir = disk_dir
+        self.ram_budget = ram_budget
+        # job path -> bytes reserved in RAM
+        self.reservations = {}
+        self.active = set()
+        self._lock = threading.Lock()
+        self._ram_ok = None
+
+    def _ram_usable(self):
+        if self._ram_ok is None:
+            self._ram_ok = False
+            if os.name == 'posix' and self.ram_dir and self.ram_budget > 0:
+                try:
+                    os.makedirs(self.ram_dir, exist_ok=True)
+                    self._ram_ok = True
+                except OSError as e:
+                    logging.warning(f"RAM work dir {self.ram_dir} unavailable: {e}")
+            if self._ram_ok:
+                # e.g. Docker's default /dev/shm is only 64 MB
+                free = shutil.disk_usage(self.ram_dir).free
+                if free < self.ram_budget:
+                    logging.warning(f"RAM work budget limited to the {free // (1024 * 1024)} MB free in {self.ram_dir}")
+                    self.ram_budget = free
+        return self._ram_ok
+
+    def _fits(self, nbytes, held=0):
+        reserved = sum(self.reservations.values()) - held
+        if reserved + nbytes > self.ram_budget:
+            return False
+        return nbytes - held <= shutil.disk_usage(self.ram_dir).free
+
+    def acquire(self, name):
+        """
+        Create a work dir for a job and return its path.
+        """
+        path = os.path.join(self.disk_dir, name)
+        os.makedirs(self.disk_dir, exist_ok=True)
+        with self._lock:
+            in_ram = self._ram_usable() and self._fits(INITIAL_RESERVATION)
+            if in_ram:
+                self.reservations[path] = INITIAL_RESERVATION
+            self.active.add(path)
+
+        if in_ram:
+            real = os.path.join(self.ram_dir, name)
+            os.makedirs(real, exist_ok=True)
+            os.symlink(os.path.abspath(real), path)
+        else:
+            os.makedirs(path, exist_ok=True)
+        return path
+
+    def fit(self, path, nbytes):
+        """
+        Size a job's RAM reservation to its expected footprint, spilling
+        it to disk if that doesn't fit. An unknown footprint (None) can't
+        be bounded, so it goes to disk too. Returns True if it stays in RAM.
+        """
+        with self._lock:
+            held = self.reservations.get(path)
+            if held is None:
+                return False
+            if nbytes is not None and self._fits(nbytes, held):
+                self.reservations[path] = max(nbytes, held)
+                return True
+            del self.reservations[path]
+
+        expected = "size unknown" if nbytes is None else f"expected {nbytes // (1024 * 1024)} MB"
+        logging.info(f"Spilling {path} to disk ({expected})")
+        real = os.readlink(path)
+        spill = f"{path}.spill"
+        shutil.copytree(real, spill, symlinks=True)
+        os.remove(path)
+        os.rename(spill, path)
+        shutil.rmtree(real, ignore_errors=True)
+        return False
+
+    def partial_dir(self, path):
+        """
+        Where a job's resumable downloads go. RAM jobs keep them in their
+        own work dir, so the finished file is renamed rather than copied
+        across filesystems and nothing is left behind in tmpfs; disk jobs
+        share PARTIAL_DIR, where later jobs can resume them.
+        """
+        if os.path.islink(path):
+            return os.path.join(path, ".partials")
+        return PARTIAL_DIR
+
+    def release(self, path):
+        with self._lock:
+            self.reservations.pop(path, None)
+            self.active.discard(path)
+        try:
+            if os.path.islink(path):
+                real = os.readlink(path)
+                os.remove(path)
+                shutil.rmtree(real, ignore_errors=True)
+            elif os.path.exists(path):
+                shutil.rmtree(path)
+        except OSError as e:
+            logging.error(f"Error removing work dir {path}: {e}")
+
+    def sweep(self, max_age=WORK_DIR_MAX_AGE):
+        """
+        Remove work dirs left behind by crashed jobs.
+        """
+        cutoff = time.time() - max_age
+        removed = 0
+        for base in (self.disk_dir, self.ram_dir):
+            if not base or not os.path.isdir(base):
+                continue
+            for entry in os.scandir(base):
+                if not entry.name.startswith(WORK_PREFIX):
+                    continue
+                path = os.path.join(self.disk_dir, entry.name) if base == self.ram_dir else entry.path
+                with self._lock:
+                    if path in self.active:
+                        continue
+                try:
+                    if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                        continue
+                    if entry.is_symlink():
+                        os.remove(entry.path)
+                    elif entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    else:
+                        continue
+                    removed += 1
+                except OSError as e:
+                    logging.error(f"Janitor could not remove {entry.path}: {e}")
+        if removed:
+            logging.info(f"Janitor removed {removed} stale work dirs")
+        return removed
+
+    async def run_janitor(self, interval=JANITOR_INTERVAL):
+        while True:
+            try:
+                await executors.run_io(self.sweep)
+            except Exception as e:
+                logging.error(f"Janitor error: {e}")
+            await asyncio.sleep(interval)
+
+
+workspace = WorkspaceManager(RAM_WORK_DIR, WORK_DIR, RAM_WORK_BUDGET)
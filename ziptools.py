@@ -0,0 +1,716 @@
+import os
+import copy
+import zlib
+import struct
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# ZIP record signatures
+LOCAL_SIG = b'PK\x03\x04'
+CENTRAL_SIG = b'PK\x01\x02'
+END_SIG = b'PK\x05\x06'
+DESCRIPTOR_SIG = b'PK\x07\x08'
+
+ZIP64_END_SIG = b'PK\x06\x06'
+ZIP64_LOCATOR_SIG = b'PK\x06\x07'
+
+# sig, version, flags, method, mtime, mdate, crc, csize, usize, name_len, extra_len
+LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+# sig, create ver, create sys, extract ver, reserved, flags, method, mtime, mdate,
+# crc, csize, usize, name_len, extra_len, comment_len, disk, int attr, ext attr, offset
+CENTRAL_HEADER = struct.Struct('<4sBBBBHHHHIIIHHHHHII')
+# sig, disk, cd disk, disk entries, total entries, cd size, cd offset, comment_len
+END_RECORD = struct.Struct('<4sHHHHIIH')
+# sig, record size, create ver, extract ver, disk, cd disk, disk entries, total entries, cd size, cd offset
+ZIP64_END_RECORD = struct.Struct('<4sQHHIIQQQQ')
+# sig, disk with zip64 end, its offset, total disks
+ZIP64_LOCATOR = struct.Struct('<4sIQI')
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+
+FLAG_ENCRYPTED = 0x01
+FLAG_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+READ_SIZE = 64 * 1024
+# Timestamp of every entry we write, so the same files always pack to the same bytes
+FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+# Extra fields holding timestamps (extended, NTFS, old Info-ZIP Unix)
+TIMESTAMP_EXTRAS = {0x5455, 0x000a, 0x5855}
+
+
+class StreamingUnsupported(Exception):
+    """
+    The archive can't be extracted from a forward-only stream; download it
+    to a file and extract that instead.
+    """
+
+
+def strip_extra(extra, header_ids):
+    out = []
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, size = struct.unpack_from('<HH', extra, pos)
+        if header_id not in header_ids:
+            out.append(extra[pos:pos + 4 + size])
+        pos += 4 + size
+    return b''.join(out)
+
+
+def strip_zip64_extra(extra):
+    """
+    Drop ZIP64 fields from an extra block; the writer adds its own.
+    """
+    return strip_extra(extra, (0x0001,))
+
+
+def normalize_entry(info):
+    """
+    Give a copied entry the fixed timestamp. Encrypted entries keep theirs,
+    since ZipCrypto's check byte can be derived from it.
+    """
+    if not info.flag_bits & FLAG_ENCRYPTED:
+        info.date_time = FIXED_DATE_TIME
+        info.extra = strip_extra(info.extra, TIMESTAMP_EXTRAS)
+
+
+def dos_datetime(date_time):
+    year, month, day, hour, minute, second = date_time
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    dosdate = (year - 1980) << 9 | month << 5 | day
+    dostime = hour << 11 | minute << 5 | second // 2
+    return dostime, dosdate
+
+
+def encode_name(info):
+    try:
+        return info.filename.encode('ascii'), info.flag_bits
+    except UnicodeEncodeError:
+        return info.filename.encode('utf-8'), info.flag_bits | FLAG_UTF8
+
+
+def data_offset(fp, info):
+    """
+    Offset of an entry's compressed data; the local header's name and extra
+    lengths can differ from the central directory's.
+    """
+    fp.seek(info.header_offset)
+    header = fp.read(LOCAL_HEADER.size)
+    if len(header) != LOCAL_HEADER.size or header[:4] != LOCAL_SIG:
+        raise zipfile.BadZipFile(f"Bad local header for {info.filename!r}")
+    fields = LOCAL_HEADER.unpack(header)
+    return info.header_offset + LOCAL_HEADER.size + fields[9] + fields[10]
+
+
+def copy_raw(fp, info):
+    """
+    Iterator over an entry's compressed bytes in an open source archive.
+    The offset is resolved up front, before the writer reuses info.
+    """
+    offset = data_offset(fp, info)
+    remaining = info.compress_size
+    name = info.filename
+
+    def chunks(offset, remaining):
+        while remaining > 0:
+            fp.seek(offset)
+            data = fp.read(min(READ_SIZE, remaining))
+            if not data:
+                raise zipfile.BadZipFile(f"Truncated data for {name!r}")
+            offset += len(data)
+            remaining -= len(data)
+            yield data
+
+    return chunks(offset, remaining)
+
+
+class CheckedWriter:
+    """
+    File object wrapper that calls check() before every write, so a long
+    write can be stopped from outside by making check() raise.
+    """
+
+    def __init__(self, fp, check):
+        self.fp = fp
+        self.check = check
+
+    def write(self, data):
+        self.check()
+        return self.fp.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+
+class RawZipWriter:
+    """
+    Minimal ZIP writer that takes entries whose compressed bytes are already
+    known (copied from another archive or deflated elsewhere) as well as
+    plain files. Entries are zipfile.ZipInfo objects. Writes to a path, or
+    to a file object; if that can't seek (VolumeWriter), entries whose
+    sizes aren't known up front get data descriptors instead of patched
+    headers. With check, check() is called before every write (see
+    CheckedWriter).
+    """
+
+    def __init__(self, dst, check=None):
+        self.fp = dst if hasattr(dst, 'write') else open(dst, 'wb')
+        if check:
+            self.fp = CheckedWriter(self.fp, check)
+        self.streaming = not self.fp.seekable()
+        self.entries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif hasattr(self.fp, 'abort'):
+            self.fp.abort()
+        else:
+            self.fp.close()
+
+    def _local_header(self, info, zip64):
+        name, flags = encode_name(info)
+        dostime, dosdate = dos_datetime(info.date_time)
+        extra = strip_zip64_extra(info.extra)
+        csize, usize = info.compress_size, info.file_size
+        version = info.extract_version
+        if zip64:
+            extra = struct.pack('<HHQQ', 0x0001, 16, usize, csize) + extra
+            csize = usize = ZIP64_LIMIT
+            version = max(version, 45)
+        return LOCAL_HEADER.pack(
+            LOCAL_SIG, version, flags, info.compress_type, dostime, dosdate,
+            info.CRC, csize, usize, len(name), len(extra)
+        ) + name + extra
+
+    def write_raw(self, info, chunks):
+        """
+        Write an entry whose CRC and sizes are already set on info; chunks
+        yields its compressed bytes.
+        """
+        zip64 = info.file_size >= ZIP64_LIMIT or info.compress_size >= ZIP64_LIMIT
+        info.header_offset = self.fp.tell()
+        self.fp.write(self._local_header(info, zip64))
+        for chunk in chunks:
+            self.fp.write(chunk)
+        if info.flag_bits & FLAG_DESCRIPTOR:
+            # Kept for entries that had one, since ZipCrypto's check byte depends on the flag
+            fmt = '<4sIQQ' if zip64 else '<4sIII'
+            self.fp.write(struct.pack(fmt, DESCRIPTOR_SIG, info.CRC, info.compress_size, info.file_size))
+        self.entries.append(info)
+
+    def write_precompressed(self, entry):
+        """
+        Append an (info, payload) entry from precompress(); the template
+        info is copied so the same entry can go into many archives.
+        """
+        info, payload = entry
+        self.write_raw(copy.copy(info), [payload])
+
+    def begin_entry(self, info, zip64):
+        """
+        Write a placeholder local header for an entry whose CRC and
+        compressed size are only known once its data is written.
+        """
+        info.header_offset = self.fp.tell()
+        if self.streaming:
+            info.flag_bits |= FLAG_DESCRIPTOR
+            placeholder = copy.copy(info)
+            placeholder.CRC = placeholder.compress_size = placeholder.file_size = 0
+            self.fp.write(self._local_header(placeholder, zip64))
+        else:
+            info.flag_bits &= ~FLAG_DESCRIPTOR
+            self.fp.write(self._local_header(info, zip64))
+
+    def end_entry(self, info, zip64):
+        if self.streaming:
+            fmt = '<4sIQQ' if zip64 else '<4sIII'
+            self.fp.write(struct.pack(fmt, DESCRIPTOR_SIG, info.CRC, info.compress_size, info.file_size))
+        else:
+            end = self.fp.tell()
+            self.fp.seek(info.header_offset)
+            self.fp.write(self._local_header(info, zip64))
+            self.fp.seek(end)
+        self.entries.append(info)
+
+    def write_file(self, info, path, level=6):
+        """
+        Compress a file from disk in chunks, then patch its local header
+        (or follow it with a data descriptor).
+        """
+        size = os.path.getsize(path)
+        # Same margin as zipfile: compressed output can be a little larger than the input
+        zip64 = size * 1.05 > ZIP64_LIMIT
+        info.file_size = size
+        self.begin_entry(info, zip64)
+
+        compressor = None
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        crc = 0
+        csize = 0
+        with open(path, 'rb') as src:
+            while True:
+                data = src.read(READ_SIZE)
+                if not data:
+                    break
+                crc = zlib.crc32(data, crc)
+                if compressor:
+                    data = compressor.compress(data)
+                self.fp.write(data)
+                csize += len(data)
+        if compressor:
+            tail = compressor.flush()
+            self.fp.write(tail)
+            csize += len(tail)
+
+        info.CRC = crc
+        info.compress_size = csize
+        self.end_entry(info, zip64)
+
+    def _central_header(self, info):
+        name, flags = encode_name(info)
+        dostime, dosdate = dos_datetime(info.date_time)
+        extra = strip_zip64_extra(info.extra)
+        csize, usize, offset = info.compress_size, info.file_size, info.header_offset
+        zip64_fields = []
+        if usize >= ZIP64_LIMIT:
+            zip64_fields.append(usize)
+            usize = ZIP64_LIMIT
+        if csize >= ZIP64_LIMIT:
+            zip64_fields.append(csize)
+            csize = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            zip64_fields.append(offset)
+            offset = ZIP64_LIMIT
+        version = info.extract_version
+        if zip64_fields:
+            extra = struct.pack(f'<HH{len(zip64_fields)}Q', 0x0001, 8 * len(zip64_fields), *zip64_fields) + extra
+            version = max(version, 45)
+        comment = info.comment or b''
+        return CENTRAL_HEADER.pack(
+            CENTRAL_SIG, max(info.create_version, version), info.create_system, version, 0,
+            flags, info.compress_type, dostime, dosdate, info.CRC, csize, usize,
+            len(name), len(extra), len(comment), 0, info.internal_attr, info.external_attr, offset
+        ) + name + extra + comment
+
+    def close(self):
+        if self.fp.closed:
+            return
+        cd_offset = self.fp.tell()
+        for info in self.entries:
+            self.fp.write(self._central_header(info))
+        cd_size = self.fp.tell() - cd_offset
+        count = len(self.entries)
+
+        if count > ZIP_FILECOUNT_LIMIT or cd_offset > ZIP64_LIMIT or cd_size > ZIP64_LIMIT:
+            zip64_end = self.fp.tell()
+            self.fp.write(ZIP64_END_RECORD.pack(
+                ZIP64_END_SIG, ZIP64_END_RECORD.size - 12, 45, 45, 0, 0, count, count, cd_size, cd_offset
+            ))
+            self.fp.write(ZIP64_LOCATOR.pack(ZIP64_LOCATOR_SIG, 0, zip64_end, 1))
+            count = min(count, ZIP_FILECOUNT_LIMIT)
+            cd_size = min(cd_size, ZIP64_LIMIT)
+            cd_offset = min(cd_offset, ZIP64_LIMIT)
+        self.fp.write(END_RECORD.pack(END_SIG, 0, 0, count, count, cd_size, cd_offset, 0))
+        self.fp.close()
+
+
+def new_entry(arcname, compress_type=zipfile.ZIP_DEFLATED, date_time=FIXED_DATE_TIME):
+    info = zipfile.ZipInfo(arcname, date_time)
+    info.compress_type = compress_type
+    info.CRC = 0
+    info.compress_size = 0
+    info.file_size = 0
+    info.external_attr = 0o644 << 16
+    info.create_system = 3
+    info.create_version = 20
+    info.extract_version = 20
+    return info
+
+
+def precompress(arcname, data, date_time=FIXED_DATE_TIME, level=9):
+    """
+    Deflate data once into a ready-to-append (info, payload) entry with
+    its CRC and sizes filled in.
+    """
+    info = new_entry(arcname, date_time=date_time)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    payload = compressor.compress(data) + compressor.flush()
+    if len(payload) >= len(data):
+        info.compress_type = zipfile.ZIP_STORED
+        payload = data
+    info.CRC = zlib.crc32(data)
+    info.file_size = len(data)
+    info.compress_size = len(payload)
+    return info, payload
+
+
+def rewrite_zip(src_path, dst, keep=None, add_entries=(), check=None):
+    """
+    Copy the entries of src_path that keep(info) accepts into dst (a path
+    or file object) without inflating or deflating them, then append add_entries from
+    precompress(). Entries are written sorted by name with the fixed
+    timestamp. Returns (copied, dropped) entry counts. check is passed to
+    RawZipWriter.
+    """
+    copied = dropped = 0
+    with zipfile.ZipFile(src_path) as src, RawZipWriter(dst, check) as writer:
+        for info in sorted(src.infolist(), key=lambda i: i.filename):
+            if keep and not keep(info):
+                dropped += 1
+                continue
+            normalize_entry(info)
+            writer.write_raw(info, copy_raw(src.fp, info))
+            copied += 1
+        for entry in add_entries:
+            writer.write_precompressed(entry)
+    return copied, dropped
+
+
+# --- Compression policy ---
+
+# Formats that are already compressed; deflating them only burns CPU
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif', '.ico',
+    '.mp3', '.mp4', '.m4a', '.m4v', '.mov', '.avi', '.mkv', '.webm', '.ogg', '.flac',
+    '.woff', '.woff2', '.eot',
+    '.zip', '.rar', '.7z', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.jar', '.apk',
+    '.docx', '.xlsx', '.pptx', '.odt', '.epub',
+}
+
+# profile -> (level for compressible data, level for data that barely shrinks)
+COMPRESSION_PROFILES = {
+    'fast': (1, 1),
+    'balanced': (6, 1),
+    'small': (9, 6),
+}
+
+SAMPLE_SIZE = 64 * 1024
+# Sample ratios (compressed / original) at level 1
+STORE_RATIO = 0.95
+MARGINAL_RATIO = 0.8
+# Not worth sampling; deflate is as cheap as the sample would be
+MIN_SAMPLE_FILE = 512
+
+
+def sample_ratio(path):
+    with open(path, 'rb') as f:
+        data = f.read(SAMPLE_SIZE)
+    if not data:
+        return 1.0
+    compressor = zlib.compressobj(1, zlib.DEFLATED, -15)
+    return len(compressor.compress(data) + compressor.flush()) / len(data)
+
+
+def compression_for(path, size, profile='balanced'):
+    """
+    (compress_type, level) for a file: store known compressed formats and
+    anything whose first block doesn't shrink, otherwise deflate at the
+    profile's level for how well the sample compressed.
+    """
+    level, marginal_level = COMPRESSION_PROFILES.get(profile, COMPRESSION_PROFILES['balanced'])
+    if os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED, None
+    if size < MIN_SAMPLE_FILE:
+        return zipfile.ZIP_DEFLATED, level
+    ratio = sample_ratio(path)
+    if ratio >= STORE_RATIO:
+        return zipfile.ZIP_STORED, None
+    if ratio >= MARGINAL_RATIO:
+        return zipfile.ZIP_DEFLATED, marginal_level
+    return zipfile.ZIP_DEFLATED, level
+
+
+# --- Parallel compression ---
+# Files are cut into chunks that worker processes deflate independently,
+# pigz-style: each chunk is primed with the 32 KB before it and ends on a
+# full flush, so the pieces concatenate into one valid deflate stream.
+# Small files are batched so a task is never much smaller than a chunk.
+
+PARALLEL_CHUNK_SIZE = 4 * 1024 * 1024
+DEFLATE_WINDOW = 32 * 1024
+
+
+def _gf2_times(matrix, vec):
+    total = 0
+    i = 0
+    while vec:
+        if vec & 1:
+            total ^= matrix[i]
+        vec >>= 1
+        i += 1
+    return total
+
+
+def _gf2_square(matrix):
+    return [_gf2_times(matrix, row) for row in matrix]
+
+
+def crc32_combine(crc1, crc2, len2):
+    """
+    CRC-32 of A+B from crc(A), crc(B) and len(B); zlib's crc32_combine,
+    which Python's zlib module doesn't expose.
+    """
+    if len2 <= 0:
+        return crc1
+    odd = [0xEDB88320] + [1 << i for i in range(31)]
+    even = _gf2_square(odd)
+    odd = _gf2_square(even)
+    while True:
+        even = _gf2_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = _gf2_square(even)
+        if len2 & 1:
+            crc1 = _gf2_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+    return crc1 ^ crc2
+
+
+_chunk_shift = None
+
+
+def _crc32_after_chunk(crc1, crc2):
+    """
+    crc32_combine(crc1, crc2, PARALLEL_CHUNK_SIZE) with the operator that
+    shifts a CRC past a whole chunk worked out once, instead of on every call.
+    """
+    global _chunk_shift
+    if _chunk_shift is None:
+        # The shift is linear in crc1, so the images of the 32 bits define it
+        _chunk_shift = [crc32_combine(1 << i, 0, PARALLEL_CHUNK_SIZE) for i in range(32)]
+    return _gf2_times(_chunk_shift, crc1) ^ crc2
+
+
+def compress_batch(items, profile='balanced'):
+    """
+    Worker: compress (path, offset, length, last, size) pieces. Returns
+    (crc, length, compressed bytes, level) for each; stored pieces come
+    back with level None and no data, the writer copies them from disk.
+    """
+    results = []
+    for path, offset, length, last, size in items:
+        # Deterministic, so every chunk of a file makes the same choice
+        _, level = compression_for(path, size, profile)
+        with open(path, 'rb') as f:
+            start = max(0, offset - DEFLATE_WINDOW)
+            f.seek(start)
+            zdict = f.read(offset - start)
+            data = f.read(length)
+        if level is None:
+            results.append((zlib.crc32(data), len(data), None, None))
+            continue
+        if zdict:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        out = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+        results.append((zlib.crc32(data), len(data), out, level))
+    return results
+
+
+def plan_batches(files, chunk_size=PARALLEL_CHUNK_SIZE):
+    """
+    Cut (arcname, path, size) files into batches of (index, piece) where
+    each piece is (path, offset, length, last, size).
+    """
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for index, (_, path, size) in enumerate(files):
+        offset = 0
+        while True:
+            length = min(chunk_size, size - offset)
+            last = offset + length >= size
+            batch.append((index, (path, offset, length, last, size)))
+            batch_bytes += length
+            if batch_bytes >= chunk_size:
+                batches.append(batch)
+                batch = []
+                batch_bytes = 0
+            offset += length
+            if last:
+                break
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _copy_range(src_path, dst, offset, length):
+    with open(src_path, 'rb') as src:
+        src.seek(offset)
+        while length > 0:
+            data = src.read(min(READ_SIZE, length))
+            if not data:
+                raise EOFError(f"{src_path} shrank while being packed")
+            dst.write(data)
+            length -= len(data)
+
+
+def write_tree(files, dst, workers=1, memory_budget=256 * 1024 * 1024, profile='balanced', add_entries=(), pool=None, check=None):
+    """
+    Pack (arcname, path, size) files into a new ZIP at dst, storing or deflating
+    each according to compression_for, followed by add_entries from
+    precompress(). With more than one worker, chunks are compressed
+    in a process pool (`pool`, or one of `workers` processes for this
+    call) while this thread writes finished pieces in order; at most
+    memory_budget bytes of input are in flight. Files are written
+    sorted by name, so the same tree always packs to the same bytes.
+    check is passed to RawZipWriter.
+    """
+    files = sorted(files)
+    with RawZipWriter(dst, check) as writer:
+        if workers <= 1:
+            for arcname, path, size in files:
+                compress_type, level = compression_for(path, size, profile)
+                writer.write_file(new_entry(arcname, compress_type), path, level)
+        else:
+            if pool is not None:
+                _write_parallel(writer, files, pool, workers, memory_budget, profile)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as own_pool:
+                    _write_parallel(writer, files, own_pool, workers, memory_budget, profile)
+        for entry in add_entries:
+            writer.write_precompressed(entry)
+    return len(files) + len(add_entries)
+
+
+def _write_parallel(writer, files, pool, workers, memory_budget, profile):
+    batches = deque(plan_batches(files))
+    max_in_flight = max(workers, memory_budget // PARALLEL_CHUNK_SIZE)
+    pending = deque()
+    current = None  # (index, info, zip64) of the entry being written
+    try:
+        while batches or pending:
+            while batches and len(pending) < max_in_flight:
+                batch = batches.popleft()
+                future = pool.submit(compress_batch, [piece for _, piece in batch], profile)
+                pending.append((batch, future))
+
+            batch, future = pending.popleft()
+            for (index, piece), (crc, length, data, level) in zip(batch, future.result()):
+                if current is None or current[0] != index:
+                    arcname, _, size = files[index]
+                    info = new_entry(arcname, zipfile.ZIP_STORED if level is None else zipfile.ZIP_DEFLATED)
+                    info.file_size = size
+                    zip64 = size * 1.05 > ZIP64_LIMIT
+                    writer.begin_entry(info, zip64)
+                    current = (index, info, zip64)
+                _, info, zip64 = current
+                if data is None:
+                    path, offset = piece[0], piece[1]
+                    _copy_range(path, writer.fp, offset, length)
+                    info.compress_size += length
+                else:
+                    writer.fp.write(data)
+                    info.compress_size += len(data)
+                if piece[1] == 0:
+                    # First (often only) piece of the file
+                    info.CRC = crc
+                elif length == PARALLEL_CHUNK_SIZE:
+                    info.CRC = _crc32_after_chunk(info.CRC, crc)
+                else:
+                    info.CRC = crc32_combine(info.CRC, crc, length)
+                if piece[3]:
+                    writer.end_entry(info, zip64)
+    except BaseException:
+        # Don't leave queued chunks of a failed repack on a shared pool
+        for _, future in pending:
+            future.cancel()
+        raise
+
+def volume_paths(path):
+    """
+    Every file of an output, given the first volume (or the only file).
+    """
+    if not path.endswith('.001'):
+        return [path]
+    base = path[:-4]
+    paths = []
+    while os.path.exists(f"{base}.{len(paths) + 1:03d}"):
+        paths.append(f"{base}.{len(paths) + 1:03d}")
+    return paths
+
+
+class VolumeWriter:
+    """
+    Forward-only file object that cuts what is written into numbered
+    volumes of at most volume_size bytes (name.zip.001, name.zip.002, ...;
+    0 = no limit). on_volume(path) is called as soon as each volume is
+    complete. Output that fits in one volume keeps the plain name.
+    """
+
+    def __init__(self, base_path, volume_size=0, on_volume=None):
+        self.base_path = base_path
+        self.volume_size = volume_size
+        self.on_volume = on_volume
+        self.volumes = []
+        self.offset = 0
+        self.index = 0
+        self.closed = False
+        self._open_next()
+
+    def _temp_path(self):
+        return f"{self.base_path}.writing"
+
+    def _open_next(self):
+        self.index += 1
+        self.fp = open(self._temp_path(), 'wb')
+        self.written = 0
+
+    def _finish_volume(self, last):
+        self.fp.close()
+        if last and self.index == 1:
+            path = self.base_path
+        else:
+            path = f"{self.base_path}.{self.index:03d}"
+        os.replace(self._temp_path(), path)
+        self.volumes.append(path)
+        if self.on_volume:
+            self.on_volume(path)
+
+    def write(self, data):
+        view = memoryview(data)
+        while len(view):
+            if self.volume_size and self.written >= self.volume_size:
+                self._finish_volume(last=False)
+                self._open_next()
+            room = len(view)
+            if self.volume_size:
+                room = min(room, self.volume_size - self.written)
+            self.fp.write(view[:room])
+            self.written += room
+            self.offset += room
+            view = view[room:]
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._finish_volume(last=True)
+
+    def abort(self):
+        # Broken output: drop the volume in progress, don't announce it
+        self.closed = True
+        self.fp.close()
+        if os.path.exists(self._temp_path()):
+            os.remove(self._temp_path())